@@ -1,16 +1,39 @@
-import pandas as pd
+import argparse
+import os
+import sys
+
+import matplotlib
+matplotlib.use("Agg")  # only saves to a file
 import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.histogram import merged_histogram
 
-# Load the data
-data = pd.read_csv("histogram_data.csv", header=None, names=["Size", "Frequency"])
+parser = argparse.ArgumentParser(description="Plot the packet size distribution")
+parser.add_argument("inputs", nargs="*", default=["histogram_data.csv"],
+                    help="size,frequency CSVs, captures or saved .npz histograms (merged)")
+parser.add_argument("--bins", type=int, default=30, help="Number of histogram bins")
+parser.add_argument("--log", action="store_true", help="Log-spaced bins and a log frequency axis")
+parser.add_argument("-o", "--output", default="histogram.png", help="Image to write")
+args = parser.parse_args()
 
-# Expand the dataset (repeat sizes based on frequency)
-expanded_sizes = []
-for size, freq in zip(data["Size"], data["Frequency"]):
-    expanded_sizes.extend([size] * freq)
+# Load the data as weighted bins: one (size, frequency) pair per distinct size, never one value per packet
+histogram = merged_histogram(args.inputs)
+sizes, _, frequencies = histogram.bins()
+stats = histogram.summary()
 
 # Create histogram
-plt.hist(expanded_sizes, bins=30, color='blue', edgecolor='black', alpha=0.7)
+if args.log:
+    edges = np.geomspace(max(histogram.min, 1), histogram.max + 1, args.bins + 1)
+    plt.xscale("log")
+    plt.yscale("log")
+else:
+    edges = args.bins
+plt.hist(sizes, bins=edges, weights=frequencies, color='blue', edgecolor='black', alpha=0.7)
+for name, style in (("p50", "--"), ("p99", ":")):
+    plt.axvline(stats[name], color="red", linestyle=style, label=f"{name} = {stats[name]:g} bytes")
+plt.legend()
 
 # Labels and Title
 plt.xlabel("Packet Size (bytes)")
@@ -19,6 +42,7 @@ plt.title("Packet Size Distribution (Histogram)")
 plt.grid(axis="y", linestyle="--", alpha=0.7)
 
 # Save the histogram as an image
-plt.savefig("histogram.png", dpi=300, bbox_inches="tight")
+plt.savefig(args.output, dpi=300, bbox_inches="tight")
 
-print("Histogram saved as histogram.png")
+print(f"Packets: {stats['count']}, mean {stats['mean']:.3f} bytes, p50 {stats['p50']:g}, p99 {stats['p99']:g}")
+print(f"Histogram saved as {args.output}")
@@ -25,9 +25,31 @@ struct PacketStats {
     map<string, int> destIPCount; // Count of packets to each destination IP
 };
 
+// Where the ethertype and the IP header sit for a link type; typeOffset < 0 means raw IP
+struct LinkLayer {
+    int typeOffset;
+    int networkOffset;
+};
+
+#ifndef DLT_LINUX_SLL2
+#define DLT_LINUX_SLL2 276
+#endif
+
+// Returns false for link types the sniffer cannot decode
+bool linkLayerFor(int datalink, LinkLayer &link) {
+    switch (datalink) {
+        case DLT_EN10MB: link = {12, 14}; return true;
+        case DLT_LINUX_SLL: link = {14, 16}; return true; // tcpdump -i any
+        case DLT_LINUX_SLL2: link = {0, 20}; return true;
+        case DLT_RAW: link = {-1, 0}; return true;
+        default: return false;
+    }
+}
+
 // Global variables
 volatile sig_atomic_t stopCaptureFlag = 0;
 pcap_t *pcapHandle = nullptr;
+LinkLayer linkLayer = {12, 14}; // chosen once from pcap_datalink() before the capture starts
 
 // Signal handler to catch Ctrl+C interrupt
 void handleInterruptSignal(int signum) {
@@ -49,29 +71,51 @@ void processPacket(u_char *userData, const struct pcap_pkthdr *pkthdr, const u_c
     stats->packetSizes.push_back(packetSize);
     stats->sizeDistribution[packetSize]++;
 
+    cout << "Captured packet! Size: " << packetSize << " bytes | Total packets: " << stats->totalPackets << endl;
+
+    if (stopCaptureFlag) {
+        pcap_breakloop(pcapHandle); // Stop capture on signal
+    }
+
+    // Only IPv4 packets have addresses to account; other frames count toward the sizes only
+    const u_char *network = packet + linkLayer.networkOffset;
+    if (pkthdr->caplen < (bpf_u_int32)linkLayer.networkOffset + sizeof(struct ip)) {
+        return;
+    }
+    bool isIPv4 = linkLayer.typeOffset < 0
+        ? (network[0] >> 4) == 4
+        : ((packet[linkLayer.typeOffset] << 8) | packet[linkLayer.typeOffset + 1]) == 0x0800;
+    if (!isIPv4) {
+        return;
+    }
+
     // Extract IP header
-    struct ip *ipHeader = (struct ip *)(packet + 14); // Skip Ethernet header
+    struct ip *ipHeader = (struct ip *)network;
     char sourceIP[INET_ADDRSTRLEN], destIP[INET_ADDRSTRLEN];
     inet_ntop(AF_INET, &ipHeader->ip_src, sourceIP, INET_ADDRSTRLEN);
     inet_ntop(AF_INET, &ipHeader->ip_dst, destIP, INET_ADDRSTRLEN);
 
-    // Extract TCP header (for port numbers)
-    struct tcphdr *tcpHeader = (struct tcphdr *)(packet + 14 + (ipHeader->ip_hl << 2));
-    uint16_t sourcePort = ntohs(tcpHeader->th_sport);
-    uint16_t destPort = ntohs(tcpHeader->th_dport);
-
-    string flowKey = string(sourceIP) + ":" + to_string(sourcePort) + " -> " + string(destIP) + ":" + to_string(destPort);
+    // Ports only for TCP and UDP, when they were captured and this is the first fragment;
+    // other packets (ICMP, later fragments, truncated frames) are keyed by their addresses
+    int ipHeaderLength = ipHeader->ip_hl << 2;
+    bool hasPorts = (ipHeader->ip_p == IPPROTO_TCP || ipHeader->ip_p == IPPROTO_UDP)
+        && !(ntohs(ipHeader->ip_off) & IP_OFFMASK)
+        && pkthdr->caplen >= (bpf_u_int32)(linkLayer.networkOffset + ipHeaderLength + 4);
+
+    string flowKey;
+    if (hasPorts) {
+        const u_char *transport = network + ipHeaderLength;
+        uint16_t sourcePort = (transport[0] << 8) | transport[1];
+        uint16_t destPort = (transport[2] << 8) | transport[3];
+        flowKey = string(sourceIP) + ":" + to_string(sourcePort) + " -> " + string(destIP) + ":" + to_string(destPort);
+    } else {
+        flowKey = string(sourceIP) + " -> " + string(destIP);
+    }
 
     // Track flow data
     stats->flowData[flowKey] += packetSize;
     stats->sourceIPCount[sourceIP]++;
     stats->destIPCount[destIP]++;
-
-    cout << "Captured packet! Size: " << packetSize << " bytes | Total packets: " << stats->totalPackets << endl;
-
-    if (stopCaptureFlag) {
-        pcap_breakloop(pcapHandle); // Stop capture on signal
-    }
 }
 
 int main() {
@@ -99,6 +143,14 @@ int main() {
     }
 
     pcap_freealldevs(allDevices); // Free memory of devices list
+
+    int datalink = pcap_datalink(pcapHandle);
+    if (!linkLayerFor(datalink, linkLayer)) {
+        cerr << "Unsupported link type: " << pcap_datalink_val_to_name(datalink) << endl;
+        pcap_close(pcapHandle);
+        return 1;
+    }
+
     signal(SIGINT, handleInterruptSignal); // Setup signal handler for Ctrl+C
 
     PacketStats stats;
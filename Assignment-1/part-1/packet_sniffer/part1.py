@@ -0,0 +1,28 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.flowstats import flow_stats
+
+# Offline counterpart of part1.cpp: the same statistics files, from a saved capture
+parser = argparse.ArgumentParser(description="part1 packet statistics from a PCAP file")
+parser.add_argument("-f", "--file", required=True, help="PCAP file to analyze")
+parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: all cores)")
+args = parser.parse_args()
+
+stats = flow_stats(args.file, args.workers)
+flow_bytes = stats.flow_bytes()
+
+# Save packet size histogram for generate_histogram.py
+stats.write_histogram("histogram_data.csv")
+# Save statistics to a file
+stats.write_report("packet_statistics.txt", flow_bytes)
+
+print("\nCapture finished.")
+for line in stats.summary_lines():
+    print(line)
+max_flow, max_data = stats.busiest_flow(flow_bytes)
+print(f"Flow with most data: {max_flow} with {max_data} bytes")
+print("Histogram saved as histogram_data.csv.")
+print("Source-Destination Pair Analysis & IP Flow Analysis saved to packet_statistics.txt")
@@ -1,119 +1,296 @@
-from scapy.all import sniff, IP, UDP, TCP, IPv6, Raw
+from scapy.all import sniff, conf, IP, UDP, TCP, IPv6, Raw
 from collections import defaultdict
 import json
+import os
+import socket
+import sys
+import time
 from pprint import pprint
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.keywords import KeywordMatcher
+from pcaptools.output import EventWriter, JSONL, MODES
+from pcaptools.pipeline import CapturePipeline, InterfaceFrames, StreamFrames, parse_ip
+from pcaptools.reader import PcapReader
+from pcaptools.records import PROTO_NAMES, format_record
+from pcaptools.rules import EXCLUDE, RuleCounters, RuleSet, load_rules
+from pcaptools.timeseries import format_address
+
 # Global variables for metrics
-port_packets = []
-unique_conn_to_ims = defaultdict(int)
-all_ims_packets = []
-ims_dst_packets = []
 super_users = 0
 total_packets = 0
 total_data = 0
-course_names = []  # List to store course names
+course_names = set()  # Distinct course names
+keyword_counts = defaultdict(int)  # references of the extra --keyword patterns
+
+SUPERUSER = "superuser"
+COURSE = "course"
+keyword_matcher = KeywordMatcher([SUPERUSER], capture=[COURSE])
+output = EventWriter()  # per-packet summaries and course registrations, see configure_output()
+
+# Which packets are excluded and which are counted (IMS server, port 4321, ...) is
+# declared in a rules file; see pcaptools.rules for the format
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ims_rules.json")
+rules = RuleSet(load_rules(RULES_FILE))
+counters = RuleCounters(rules)  # packets, bytes, flow tables and records per rule
+
+
+def configure_keywords(extra_keywords=()):
+    """Adds keywords to count in payloads; one scan per payload covers all of them"""
+    global keyword_matcher
+    keyword_matcher = KeywordMatcher([SUPERUSER, *extra_keywords], capture=[COURSE])
+
+
+def configure_rules(rules_file=None, max_records=None):
+    """Loads the classification rules; max_records caps how many packets a rule keeps for display"""
+    global rules, counters
+    rules = RuleSet(load_rules(rules_file or RULES_FILE))
+    counters = RuleCounters(rules, max_records)
+
+
+def configure_output(mode="text", path=None, summary_every=1):
+    """Selects text, jsonl or quiet output and how often per-packet summaries are written"""
+    global output
+    output = EventWriter(mode, path, summary_every)
 
 
-def traffic_packet(packet):
-    """Filters out localhost and multicast traffic"""
-    if IP in packet and (packet[IP].src == "127.0.0.1" or packet[IP].dst == "127.0.0.1"):
-        return True
-    if IPv6 in packet and (packet[IPv6].src == "::1" or packet[IPv6].dst == "::1"):
-        return True
-    if (IP in packet and packet[IP].dst == "224.0.0.251") or (IPv6 in packet and packet[IPv6].dst == "ff02::fb"):
-        return True
-    if UDP in packet and packet[UDP].dport == 5353:
-        return True
-    return False
+def info(message):
+    """Status messages go to stderr while JSON lines are written to stdout"""
+    print(message, file=sys.stderr if output.mode == JSONL and output.uses_stdout else sys.stdout)
 
 
 def question_2(packet):
     """Packet handler for IMS traffic analysis."""
-    global port_packets, unique_conn_to_ims, all_ims_packets, ims_dst_packets, super_users, total_packets, total_data, course_names
+    global total_packets, total_data
 
-    if traffic_packet(packet):
-        return
+    IPv = IP if IP in packet else IPv6 if IPv6 in packet else None
+    load = bytes(packet[Raw].load) if IPv and Raw in packet else None
+    if IPv:
+        protocol = TCP if TCP in packet else UDP if UDP in packet else None
+        family = socket.AF_INET if IPv is IP else socket.AF_INET6
+        mask = count_rules(float(packet.time), packet[IPv].proto if IPv is IP else packet[IPv].nh,
+                           socket.inet_pton(family, packet[IPv].src), socket.inet_pton(family, packet[IPv].dst),
+                           packet[protocol].sport if protocol else None, packet[protocol].dport if protocol else None,
+                           packet.wirelen or len(packet), load)
+        if mask is None:
+            return
 
     total_packets += 1
-    total_data += len(packet)
+    total_data += packet.wirelen or len(packet)  # the original length, also for truncated captures
+    if load is not None:
+        count_payload(load)
 
-    ims_ip = "10.0.137.79"
+    output.summary(packet.time, packet.summary)
 
-    IPv = IP if IP in packet else IPv6 if IPv6 in packet else None
-    if IPv:
-        src_ip = packet[IPv].src
-        dst_ip = packet[IPv].dst
 
-        if dst_ip == ims_ip:
-            ims_dst_packets.append(packet)
-            all_ims_packets.append(packet)
+def print_records(records):
+    for record in records:
+        print(format_record(record))
+    if records.sampled:
+        print(f"(random sample of {len(records)} of {records.count} packets)")
 
-        if src_ip == ims_ip:
-            all_ims_packets.append(packet)
 
-        protocol = TCP if TCP in packet else UDP if UDP in packet else None
-        if protocol:
-            src_port = packet[protocol].sport
-            dst_port = packet[protocol].dport
-            if dst_ip == ims_ip:
-                unique_conn_to_ims[f"{src_ip}:{src_port} -> {dst_ip}:{dst_port}"] += 1
+def count_rules(ts, proto, src, dst, sport, dport, length, payload=None):
+    """Counts a packet for the rules it matches.
 
-        if protocol and (packet[protocol].sport == 4321 or packet[protocol].dport == 4321):
-            port_packets.append(packet)
+    Returns the mask of matched rules, or None if an exclude rule matched;
+    src/dst are packed addresses and the ports None without TCP/UDP.
+    """
+    mask = rules.match(proto, src, dst, sport, dport, payload)
+    if mask & rules.exclude:
+        counters.add(mask & rules.exclude, ts, proto, src, dst, sport, dport, length)
+        return None
+    if mask:
+        counters.add(mask, ts, proto, src, dst, sport, dport, length)
+    return mask
 
-        if Raw in packet:
-            payload = packet[Raw].load.decode(errors="ignore")
-            super_users += payload.lower().count("superuser")
 
-            # Extract course registration packet
-            if b"course" in bytes(packet[Raw].load):  # Check if "course" is in the raw payload
-                course_name = payload.split("course")[1].split()[0]  # This is a basic extraction, adjust as needed
-                course_names.append(course_name)
-                print(f"Course Registration Packet: {packet[Raw].load}")
+def count_payload(load):
+    """Counts superuser (and extra keyword) references and extracts course names from a payload"""
+    global super_users
+    found = keyword_matcher.scan(load)
+    if found is None:
+        return
+    counts, tokens = found
+    super_users += counts.pop(SUPERUSER, 0)
+    counts.pop(COURSE, None)
+    for keyword, n in counts.items():
+        keyword_counts[keyword] += n
 
-    print(packet.summary())
+    if COURSE in tokens:
+        course_name = tokens[COURSE].decode(errors="ignore")
+        if course_name:
+            course_names.add(course_name)
+        output.event("course", f"Course Registration Packet: {bytes(load)}", course=course_name, payload=load)
 
 
-def log_question2_metrics():
-    """Logs the results from question 2 packet capture"""
-    global port_packets, unique_conn_to_ims, all_ims_packets, ims_dst_packets, super_users, total_packets, total_data, course_names
+def question_2_fast(pcap_file):
+    """question_2() over raw frame bytes for offline captures.
 
-    print("\n--- IMS Packet Metrics ---")
+    The rules are matched on fixed-offset Ethernet/IPv4/IPv6/TCP/UDP
+    headers; scapy only dissects the packets some rule counts, and only
+    when their summary is written.
+    """
+    global total_packets, total_data
+
+    packets = data_bytes = 0
+    match, exclude, add = rules.match, rules.exclude, counters.add
+    with PcapReader(pcap_file) as reader:
+        layer = conf.l2types.num2layer.get(reader.linktype, Raw)
+        read = reader.read
+        for ts, caplen, wirelen, data, ip in reader.ip_packets():
+            packets += 1
+            data_bytes += wirelen
+            if ip is None:
+                continue
+            proto, src, dst, sport, dport, payload, payload_end = ip
+            load = read(payload, payload_end) if payload_end > payload else None
+
+            mask = match(proto, src, dst, sport, dport, load)
+            if mask:
+                if mask & exclude:
+                    add(mask & exclude, ts, proto, src, dst, sport, dport, wirelen)
+                    packets -= 1
+                    data_bytes -= wirelen
+                    continue
+                add(mask, ts, proto, src, dst, sport, dport, wirelen)
+                output.summary(ts, lambda: layer(read(data, data + caplen)).summary())
+
+            if load is not None:
+                count_payload(load)
+
+    total_packets += packets
+    total_data += data_bytes
+
+
+def question_2_live(frames, interval=5.0, queue_size=65536):
+    """Live IMS analysis: capture, parsing and aggregation run as pipeline stages.
+
+    Frames the parser cannot keep up with are dropped at the capture stage
+    (and counted) instead of stalling it; a metrics snapshot is printed
+    every `interval` seconds.
+    """
+    layer = conf.l2types.num2layer.get(frames.linktype, Raw)
 
-    print("\nPackets Destined to IMS Server:")
-    for packet in ims_dst_packets:
-        print(packet.summary())
+    def aggregate(item):
+        global total_packets, total_data
+        ts, length, frame, ip = item
+        if ip is not None:
+            proto, src, dst, sport, dport, payload, payload_end = ip
+            load = frame[payload:payload_end] if payload_end > payload else None
+            mask = count_rules(ts, proto, src, dst, sport, dport, length, load)
+            if mask is None:
+                return
+            if mask:
+                output.summary(ts, lambda: layer(frame).summary())
+            if load is not None:
+                count_payload(load)
+        total_packets += 1
+        total_data += length
 
-    print("\nUnique Connections to IMS Server:")
-    pprint(unique_conn_to_ims)
+    def snapshot(stats):
+        counted = [counter for counter in counters if counter.rule.action != EXCLUDE]
+        rule_counts = ", ".join(f"{counter.rule.name} {counter.packets}" for counter in counted)
+        output.event("snapshot",
+                     f"[{time.strftime('%H:%M:%S')}] packets {total_packets}, {rule_counts}, "
+                     f"superuser {super_users} | captured {stats.captured}, dropped {stats.dropped}",
+                     ts=time.time(), packets=total_packets, rules={c.rule.name: c.packets for c in counted},
+                     super_users=super_users, **stats.as_dict())
+        output.flush()
 
-    print("\nPackets Transferred on Port 4321:")
-    for packet in port_packets:
-        print(packet.summary())
+    pipeline = CapturePipeline(frames, parse_ip(frames.linktype), aggregate, snapshot, interval, queue_size)
+    return pipeline.run()
+
+
+def log_question2_metrics():
+    """Logs the results from question 2 packet capture"""
+    if output.mode == JSONL:
+        write_question2_metrics()
+        if output.uses_stdout:
+            return
+    output.flush()
+    print("\n--- IMS Packet Metrics ---")
+
+    counted = [counter for counter in counters if counter.rule.action != EXCLUDE]
+    for counter in counted:
+        if counter.records is not None:
+            print(f"\nPackets {counter.rule.label}:")
+            print_records(counter.records)
+        if counter.flows is not None:
+            print(f"\nUnique Connections {counter.rule.label}:")
+            pprint(counter.format_flows())
 
     print("\nSummary:")
-    print(f"Total IMS Packets: {len(all_ims_packets)}")
-    print(f"Total Data Transferred on Port 4321: {sum(len(pkt) for pkt in port_packets)} bytes")
+    for counter in counted:
+        print(f"Total Packets {counter.rule.label}: {counter.packets} ({counter.bytes} bytes)")
     print(f"Total SuperUser References: {super_users}")
+    for keyword, count in keyword_counts.items():
+        print(f"Total '{keyword}' References: {count}")
     
     # Print all course names at the end
     print("\nCourse Names Registered:")
-    for course in set(course_names):  # Using set to avoid duplicate course names
+    for course in course_names:
         print(course)
 
 
+def write_question2_metrics():
+    """Writes the question 2 results as JSON lines: the kept packet records, then one metrics object"""
+    for counter in counters:
+        for record in counter.records or ():
+            output.event("record", rule=counter.rule.name, ts=record.ts,
+                         proto=PROTO_NAMES.get(record.proto, record.proto),
+                         src=format_address(record.src), dst=format_address(record.dst),
+                         sport=record.sport, dport=record.dport, length=record.length)
+    output.event("metrics", total_packets=total_packets, total_data=total_data, rules=counters.as_dict(),
+                 super_users=super_users, keyword_counts=keyword_counts, course_names=course_names)
+    output.flush()
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Packet capture and IMS analysis")
-    parser.add_argument("-f", "--file", type=str, required=True, help="PCAP file to read")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-f", "--file", type=str, help="PCAP file to read, or - for a live pcap stream on stdin")
+    source.add_argument("-i", "--interface", type=str, help="Capture live from this interface (needs root)")
+    parser.add_argument("-m", "--max-records", type=int, default=None,
+                        help="Keep at most this many packets per listing (random sample); metrics stay exact")
+    parser.add_argument("-r", "--rules", default=None,
+                        help=f"JSON rules file of the packets to exclude and count (default {os.path.basename(RULES_FILE)})")
+    parser.add_argument("--fast", action="store_true",
+                        help="Parse raw frame bytes and only dissect packets counted by a rule with scapy")
+    parser.add_argument("-k", "--keyword", action="append", default=[],
+                        help="Also count references of this keyword (case-insensitive, repeatable)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between live metric snapshots")
+    parser.add_argument("--output", choices=MODES, default="text",
+                        help="text: summaries as now; jsonl: batched JSON lines; quiet: final metrics only")
+    parser.add_argument("-o", "--output-file", default=None, help="Write summaries / JSON lines here instead of stdout")
+    parser.add_argument("--summary-every", type=int, default=1, metavar="N",
+                        help="Write only every Nth packet summary (0 for none)")
     args = parser.parse_args()
+    configure_rules(args.rules, args.max_records)
+    configure_keywords(args.keyword)
+    configure_output(args.output, args.output_file, args.summary_every)
 
     try:
-        print("Starting packet sniffing from PCAP file...")
-        sniff(offline=args.file, prn=question_2, store=False)
-        log_question2_metrics()
-    except KeyboardInterrupt:
-        print("Packet capture interrupted.")
+        if args.interface or args.file == "-":
+            info(f"Starting live packet analysis on {args.interface or 'stdin'} (Ctrl-C to stop)...")
+            frames = InterfaceFrames(args.interface) if args.interface else StreamFrames(sys.stdin.buffer)
+            question_2_live(frames, args.interval)
+            log_question2_metrics()
+            return
+
+        try:
+            info("Starting packet sniffing from PCAP file...")
+            if args.fast:
+                question_2_fast(args.file)
+            else:
+                sniff(offline=args.file, prn=question_2, store=False)
+            log_question2_metrics()
+        except KeyboardInterrupt:
+            output.flush()
+            info("Packet capture interrupted.")
+    finally:
+        output.close()
 
 
 if __name__ == "__main__":
@@ -4,8 +4,13 @@ from mininet.node import Controller
 from mininet.link import TCLink
 from mininet.log import setLogLevel
 from mininet.cli import CLI
-import time
+import argparse
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.capture import add_capture_arguments, capture_options, tcpdump_command
 
 class CustomTopology(Topo):
     def build(self):
@@ -34,7 +39,7 @@ class CustomTopology(Topo):
         self.addLink(S2, S3, bw=50)
         self.addLink(S3, S4, bw=100)
 
-def run_experiment():
+def run_experiment(capture):
     topo = CustomTopology()
     net = Mininet(topo=topo, controller=Controller, link=TCLink)
     net.start()
@@ -54,7 +59,7 @@ def run_experiment():
         pcap_files.append(pcap_file)
 
         # Start tcpdump on H7 to capture packets
-        server.cmd(f'tcpdump -i any -w {pcap_file} port 5202 &')
+        server.cmd(tcpdump_command('any', pcap_file, **capture) + ' &')
         time.sleep(1)
 
         # Run iperf3 client from H1 to H7
@@ -72,5 +77,7 @@ def run_experiment():
     net.stop()
 
 if __name__ == '__main__':
+    parser = add_capture_arguments(argparse.ArgumentParser(description="Q1a congestion control experiment"))
+    args = parser.parse_args()
     setLogLevel('info')
-    run_experiment()
+    run_experiment(capture_options(args))
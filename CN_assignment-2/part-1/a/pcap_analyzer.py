@@ -1,53 +1,33 @@
-import pyshark
+import os
+import sys
 
-def analyze_pcap(pcap_file):
-    print(f"\nAnalyzing {pcap_file}...")
-    capture = pyshark.FileCapture(pcap_file, display_filter="tcp")
-
-    total_bytes = 0
-    packet_count = 0
-    lost_packets = 0
-    max_window_size = 0
-    timestamps = []
-
-    for packet in capture:
-        try:
-            total_bytes += int(packet.length)
-            packet_count += 1
-
-            if hasattr(packet.tcp, 'analysis_lost_segment'):
-                lost_packets += 1
-
-            if hasattr(packet.tcp, 'window_size'):
-                max_window_size = max(max_window_size, int(packet.tcp.window_size))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.analysis import tcp_analysis
+from pcaptools.compressed import find_capture
 
-            if hasattr(packet, 'sniff_time'):
-                timestamps.append(float(packet.sniff_time.timestamp()))
-
-        except AttributeError:
-            continue
-
-    capture.close()
-
-    if timestamps:
-        duration = timestamps[-1] - timestamps[0]
-        throughput = (total_bytes * 8) / (duration * 1000000)  # Mbps
-        goodput = ((total_bytes - (lost_packets * 1500)) * 8) / (duration * 1000000)  # Mbps
-    else:
-        throughput = 0
-        goodput = 0
+def analyze_pcap(pcap_file, workers=None):
+    print(f"\nAnalyzing {pcap_file}...")
+    metrics = tcp_analysis(pcap_file, workers=workers)  # metrics and events from one pass
 
-    loss_rate = (lost_packets / packet_count) * 100 if packet_count else 0
+    throughput = metrics['throughput']
+    goodput = metrics['goodput']
+    loss_rate = metrics['loss_rate']
+    max_window_size = metrics['max_window_size']
 
     print(f"Throughput: {throughput:.2f} Mbps")
     print(f"Goodput: {goodput:.2f} Mbps")
+    if metrics['filled_holes']:
+        print(f"  (includes {metrics['filled_bytes']} uncaptured bytes in {metrics['filled_holes']} stale holes)")
     print(f"Packet Loss Rate: {loss_rate:.2f}%")
-    print(f"Maximum Window Size: {max_window_size} bytes\n")
+    print(f"Maximum Window Size: {max_window_size} bytes")
+    print(f"Retransmissions: {metrics['retransmissions']} ({metrics['fast_retransmissions']} fast)")
+    print(f"Out-of-Order Segments: {metrics['out_of_order']}")
+    print(f"Duplicate ACKs: {metrics['duplicate_acks']}\n")
 
 def main():
     congestion_schemes = ['reno.pcap', 'bic.pcap', 'htcp.pcap']
     for pcap in congestion_schemes:
-        analyze_pcap(pcap)
+        analyze_pcap(find_capture(pcap))  # reno.pcap.gz etc. are read as they are
 
 if __name__ == '__main__':
     main()
@@ -3,8 +3,13 @@ from mininet.net import Mininet
 from mininet.node import Controller
 from mininet.link import TCLink
 from mininet.log import setLogLevel
-import time
+import argparse
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.capture import add_capture_arguments, capture_options, tcpdump_command
 
 class CustomTopology(Topo):
     def build(self):
@@ -33,7 +38,7 @@ class CustomTopology(Topo):
         self.addLink(S2, S3, bw=50)
         self.addLink(S3, S4, bw=100)
 
-def run_experiment():
+def run_experiment(capture):
     topo = CustomTopology()
     net = Mininet(topo=topo, controller=Controller, link=TCLink)
     net.start()
@@ -53,7 +58,7 @@ def run_experiment():
         print(f"\n[*] Capturing traffic for {cc} in {pcap_file}...")
 
         # Start tcpdump on H7 to capture packets
-        server.cmd(f'tcpdump -i any -w {pcap_file} port 5202 &')
+        server.cmd(tcpdump_command('any', pcap_file, **capture) + ' &')
         time.sleep(1)
 
         print(f"[*] Starting iperf3 client on H1 (T=0s) for {cc}...")
@@ -81,5 +86,7 @@ def run_experiment():
     net.stop()
 
 if __name__ == '__main__':
+    parser = add_capture_arguments(argparse.ArgumentParser(description="Q1b congestion control experiment"))
+    args = parser.parse_args()
     setLogLevel('info')
-    run_experiment()
+    run_experiment(capture_options(args))
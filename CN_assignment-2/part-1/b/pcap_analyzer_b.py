@@ -1,61 +1,61 @@
-import pyshark
+import math
 import os
+import sys
 
-def analyze_pcap(pcap_file):
-    print(f"\nAnalyzing {pcap_file} (Part B)...")
-    capture = pyshark.FileCapture(pcap_file, display_filter="tcp")
-
-    total_bytes = 0
-    packet_count = 0
-    lost_packets = 0
-    max_window_size = 0
-    timestamps = []
-
-    for packet in capture:
-        try:
-            total_bytes += int(packet.length)
-            packet_count += 1
-
-            if hasattr(packet.tcp, 'analysis_lost_segment'):
-                lost_packets += 1
-
-            if hasattr(packet.tcp, 'window_size'):
-                max_window_size = max(max_window_size, int(packet.tcp.window_size))
-
-            if hasattr(packet, 'sniff_time'):
-                timestamps.append(float(packet.sniff_time.timestamp()))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.analysis import tcp_analysis
+from pcaptools.batch import CAPTURE_SUFFIXES, analyze_many, discover_captures
+from pcaptools.compressed import uncompressed_name
+from pcaptools.timeseries import jain_index, write_series_csv
 
-        except AttributeError:
-            continue
-
-    capture.close()
-
-    if timestamps:
-        duration = timestamps[-1] - timestamps[0]
-        throughput = (total_bytes * 8) / (duration * 1000000)  # Mbps
-        goodput = ((total_bytes - (lost_packets * 1500)) * 8) / (duration * 1000000)  # Mbps
-    else:
-        throughput = 0
-        goodput = 0
-
-    loss_rate = (lost_packets / packet_count) * 100 if packet_count else 0
+BIN_WIDTH = 1.0  # seconds
 
+def print_results(pcap_file, metrics):
     print(f"--- Part B Results for {pcap_file} ---")
-    print(f"Throughput: {throughput:.2f} Mbps")
-    print(f"Goodput: {goodput:.2f} Mbps")
-    print(f"Packet Loss Rate: {loss_rate:.2f}%")
-    print(f"Maximum Window Size: {max_window_size} bytes\n")
+    print(f"Throughput: {metrics['throughput']:.2f} Mbps")
+    print(f"Goodput: {metrics['goodput']:.2f} Mbps")
+    if metrics['filled_holes']:
+        print(f"  (includes {metrics['filled_bytes']} uncaptured bytes in {metrics['filled_holes']} stale holes)")
+    print(f"Packet Loss Rate: {metrics['loss_rate']:.2f}%")
+    print(f"Maximum Window Size: {metrics['max_window_size']} bytes")
+    print(f"Retransmissions: {metrics['retransmissions']} ({metrics['fast_retransmissions']} fast)")
+    print(f"Out-of-Order Segments: {metrics['out_of_order']}")
+    print(f"Duplicate ACKs: {metrics['duplicate_acks']}")
+
+def report_convergence(pcap_file, series, bin_width=BIN_WIDTH):
+    """Writes per-client throughput per bin (H1/H3/H4 join at 0/15/30 s) and prints fairness"""
+    matrix = series['mbps']
+    output_file = uncompressed_name(pcap_file)[:-len(".pcap")] + "_throughput.csv"
+    write_series_csv(output_file, series['times'], series['clients'], matrix)
+
+    fairness = [jain for jain in jain_index(matrix) if not math.isnan(jain)] if len(matrix) else []
+    if fairness:
+        print(f"Mean Jain Fairness Index ({bin_width:g}s bins): {sum(fairness) / len(fairness):.3f}")
+    print(f"Per-client throughput saved to {output_file}\n")
+
+def analyze_pcap(pcap_file, workers=None):
+    print(f"\nAnalyzing {pcap_file} (Part B)...")
+    metrics = tcp_analysis(pcap_file, bin_width=BIN_WIDTH, workers=workers)
+    print_results(pcap_file, metrics)
+    report_convergence(pcap_file, metrics['series'])
 
 def main():
-    # Only analyze Part B PCAP files
-    pcap_files = [f for f in os.listdir() if f.endswith("_part_b.pcap")]
+    # Only analyze Part B PCAP files (the parts of a rotated capture and the copies of one count once)
+    pcap_files = [os.path.basename(f) for f in discover_captures(".")]
+    pcap_files = [f for f in pcap_files if f.endswith(tuple("_part_b" + suffix for suffix in CAPTURE_SUFFIXES))]
 
     if not pcap_files:
         print("No Part B PCAP files found!")
         return
 
-    for pcap in sorted(pcap_files):
-        analyze_pcap(pcap)
+    # Files are analyzed in parallel, each in one pass, results printed in name order
+    for pcap, metrics, error in analyze_many(sorted(pcap_files), events=True, bin_width=BIN_WIDTH):
+        print(f"\nAnalyzing {pcap} (Part B)...")
+        if error:
+            print(f"Could not read {error}\n")
+            continue
+        print_results(pcap, metrics)
+        report_convergence(pcap, metrics['series'])
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,21 @@
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.log import setLogLevel, info
-import time
+import argparse
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.capture import add_capture_arguments, capture_exists, capture_options, tcpdump_command
+from pcaptools.merge import DEDUP_WINDOW, merge_captures
+
+# ✅ Capture profile, rotation and merge window
+parser = add_capture_arguments(argparse.ArgumentParser(description="Q1c congestion control experiment"))
+parser.add_argument("--dedup-window", type=float, default=DEDUP_WINDOW,
+                    help="Seconds within which the copies of a packet captured at two hosts are merged")
+args = parser.parse_args()
+capture = capture_options(args)
 
 # ✅ Choose congestion control algorithm
 print("Select congestion control algorithm: 1. Reno  2. BIC  3. HTCP")
@@ -54,7 +67,7 @@ def run_experiment():
     H7.cmd('iperf3 -s -p 5202 &')
 
     pcap_folder = "./pcaps_Q1"
-    os.system(f'mkdir -p {pcap_folder}')  # ✅ Ensure PCAP folder exists
+    os.system(f'mkdir -p {pcap_folder}/hosts')  # ✅ Ensure PCAP folders exist
 
     # ✅ Define scenarios
     scenarios = {
@@ -72,12 +85,14 @@ def run_experiment():
     clients = scenarios[experiment_case]
     info(f"*** Running experiment {experiment_case} with {congestion_control} ***\n")
 
-    # ✅ Start TCPdump on server and clients
+    # ✅ Start TCPdump on server and clients, each into its own file
+    pcap_file = f"{pcap_folder}/{congestion_control}_{experiment_case}.pcap"
+    host_files = {}
     tcpdump_processes = {}
     for host in clients + ['H7']:  
         h = net.get(host)
-        pcap_file = f"{pcap_folder}/{congestion_control}_{experiment_case}.pcap"
-        tcpdump_processes[h] = h.popen(f"sudo tcpdump -i {h.defaultIntf()} -w {pcap_file} port 5202 > /tmp/tcpdump_{h}.log 2>&1 &", shell=True)
+        host_files[host] = f"{pcap_folder}/hosts/{congestion_control}_{experiment_case}_{host}.pcap"
+        tcpdump_processes[h] = h.popen(f"sudo {tcpdump_command(str(h.defaultIntf()), host_files[host], **capture)} > /tmp/tcpdump_{h}.log 2>&1 &", shell=True)
 
     
     time.sleep(3)  # ✅ Give TCPdump enough time to start
@@ -101,12 +116,14 @@ def run_experiment():
     info("*** Stopping TCPdump\n")
     os.system("pkill -f tcpdump")  # ✅ Ensure TCPdump is properly terminated
     
-    time.sleep(3)  # ✅ Ensure PCAP files are written before moving
-
-    # ✅ Check if PCAP files exist before moving
-    if any(os.path.exists(f"{pcap_folder}/{congestion_control}_{experiment_case}.pcap") for h in clients + ['H7']):
-        os.system(f'mv {pcap_folder}/*.pcap {pcap_folder}/')
-        info("*** PCAP files moved successfully! ***\n")
+    time.sleep(3)  # ✅ Ensure PCAP files are written before merging
+
+    # ✅ Merge the host captures into one timeline, each packet once
+    written = [f for f in host_files.values() if capture_exists(f)]
+    if written:
+        merge = merge_captures(pcap_file, written, args.dedup_window)
+        info(f"*** Merged {len(written)} captures into {pcap_file}: {merge.records_in} records, "
+             f"{merge.duplicates} duplicates dropped, {merge.single_point} seen at one host only ***\n")
     else:
         info("*** Warning: No PCAP files found! Check TCPDump or Iperf3 setup. ***\n")
 
@@ -1,15 +1,26 @@
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.log import setLogLevel, info
-import time
+import argparse
 import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from pcaptools.capture import add_capture_arguments, capture_exists, capture_options, tcpdump_command
+from pcaptools.merge import DEDUP_WINDOW, merge_captures
 
 # ✅ Configurations (Automated Execution)
+parser = add_capture_arguments(argparse.ArgumentParser(description="Q1d congestion control experiments with link loss"))
+parser.add_argument("--dedup-window", type=float, default=DEDUP_WINDOW,
+                    help="Seconds within which the copies of a packet captured at two hosts are merged")
+args = parser.parse_args()
+capture = capture_options(args)
 congestion_algorithms = ["reno", "bic", "htcp"]
 experiment_cases = ["P", "Q", "R", "S"]
 loss_values = [1, 5]
 pcap_folder = "./pcaps_Q1d"
-os.system(f'mkdir -p {pcap_folder}')  # ✅ Ensure PCAP folder exists
+os.system(f'mkdir -p {pcap_folder}/hosts')  # ✅ Ensure PCAP folders exist
 
 class NetworkTopology(Topo):
     def __init__(self, loss_percent):
@@ -66,12 +77,14 @@ def run_experiment(congestion_control, experiment_case, loss):
     clients = scenarios[experiment_case]
     info(f"*** Running experiment {experiment_case} with {congestion_control} ***\n")
 
-    # ✅ Start TCPdump
+    # ✅ Start TCPdump, one file per host
+    pcap_file = f"{pcap_folder}/{congestion_control}_{experiment_case}_loss{loss}.pcap"
+    host_files = {}
     tcpdump_processes = {}
     for host in clients + ['H7']:  
         h = net.get(host)
-        pcap_file = f"{pcap_folder}/{congestion_control}_{experiment_case}_loss{loss}.pcap"
-        tcpdump_processes[h] = h.popen(f"sudo tcpdump -i {h.defaultIntf()} -w {pcap_file} port 5202 > /tmp/tcpdump_{h}.log 2>&1 &", shell=True)
+        host_files[host] = f"{pcap_folder}/hosts/{congestion_control}_{experiment_case}_loss{loss}_{host}.pcap"
+        tcpdump_processes[h] = h.popen(f"sudo {tcpdump_command(str(h.defaultIntf()), host_files[host], **capture)} > /tmp/tcpdump_{h}.log 2>&1 &", shell=True)
 
     time.sleep(3)  # ✅ Give TCPdump time to start
 
@@ -95,6 +108,15 @@ def run_experiment(congestion_control, experiment_case, loss):
     os.system("pkill -f tcpdump")  # ✅ Ensure TCPdump is terminated
     time.sleep(3)  # ✅ Ensure PCAP files are written
 
+    # ✅ Merge the host captures into one timeline, each packet once
+    written = [f for f in host_files.values() if capture_exists(f)]
+    if written:
+        merge = merge_captures(pcap_file, written, args.dedup_window)
+        info(f"*** Merged {len(written)} captures into {pcap_file}: {merge.records_in} records, "
+             f"{merge.duplicates} duplicates dropped, {merge.single_point} seen at one host only ***\n")
+    else:
+        info("*** Warning: No PCAP files found! Check TCPDump or Iperf3 setup. ***\n")
+
     info("*** Stopping Network\n")
     net.stop()
 
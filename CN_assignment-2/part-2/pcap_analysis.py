@@ -1,83 +1,161 @@
-import dpkt
-import datetime
+import csv
+import matplotlib
+matplotlib.use("Agg")  # render straight to files, no display needed
 import matplotlib.pyplot as plt
+import numpy as np
 import os
-from collections import defaultdict
+import sys
+from array import array
 from tqdm import tqdm
 
-def plot_tcp_durations(start_timestamps, connection_times, attack_begin, attack_finish, pcap_filename, output_folder):
-    if not start_timestamps:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from pcaptools.conntable import ConnectionTable, NO_TIME, timestamp_us
+from pcaptools.expiry import ConnectionExpiry, TIMEOUT
+from pcaptools.compressed import find_capture, uncompressed_name
+from pcaptools.reader import PcapReader, TH_ACK, TH_FIN, TH_RST, TH_SYN
+from pcaptools.synflood import SynFloodDetector, attack_windows, format_alert
+
+SCATTER_LIMIT = 20000  # above this many connections, draw a density grid instead of points
+GRID_BINS = (400, 200)  # (time, duration) bins of the density grid
+BAND_BINS = 200  # time bins of the percentile bands
+
+def duration_percentiles(start_timestamps, connection_times, bins, percentiles=(50, 90, 99)):
+    # Per time bin percentiles of the durations, from one sort of all connections
+    edges = np.linspace(start_timestamps.min(), start_timestamps.max() + 1e-9, bins + 1)
+    which = np.clip(np.searchsorted(edges, start_timestamps, side='right') - 1, 0, bins - 1)
+    order = np.lexsort((connection_times, which))
+    sorted_times = connection_times[order]
+    counts = np.bincount(which, minlength=bins)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    present = counts > 0
+    centers = ((edges[:-1] + edges[1:]) / 2)[present]
+    bands = {}
+    for q in percentiles:
+        rank = offsets[:-1] + np.floor((counts - 1) * q / 100).astype(np.int64)
+        bands[q] = sorted_times[rank[present]]
+    return centers, bands
+
+def plot_tcp_durations(start_timestamps, connection_times, attack_begin, attack_finish, pcap_filename, output_folder,
+                       formats=("png", "svg")):
+    if not len(start_timestamps):
         print(f"No connection data to plot for {pcap_filename}")
         return
 
-    plt.figure(figsize=(12, 6))
-    plt.scatter(start_timestamps, connection_times, s=1)
-    plt.xlabel("Connection Start Time (seconds)")
-    plt.ylabel("Connection Duration (seconds)")
-    plt.title("TCP Connection Durations")
-    plt.grid(True)
-
-    plt.axvline(x=attack_begin, color='red', linestyle='--', label='Attack Start')
-    plt.axvline(x=attack_finish, color='green', linestyle='--', label='Attack End')
-    plt.legend()
-    plt.show()
-
-pcap_path = 'syn_attack.pcap'
-attack_begin = 20.0  # Attack start time
-attack_finish = 120.0  # Attack end time
+    start_timestamps = np.asarray(start_timestamps, dtype=np.float64)
+    connection_times = np.asarray(connection_times, dtype=np.float64)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    if len(start_timestamps) <= SCATTER_LIMIT:
+        ax.scatter(start_timestamps, connection_times, s=1, label='Connections')
+    else:
+        counts, x_edges, y_edges = np.histogram2d(start_timestamps, connection_times, bins=GRID_BINS)
+        mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), cmap='viridis',
+                             norm=matplotlib.colors.LogNorm(), rasterized=True)
+        fig.colorbar(mesh, ax=ax, label='Connections per bin')
+
+    centers, bands = duration_percentiles(start_timestamps, connection_times, BAND_BINS)
+    ax.fill_between(centers, bands[50], bands[99], color='orange', alpha=0.25, step='mid', label='p50-p99')
+    ax.plot(centers, bands[90], color='orange', linewidth=1, drawstyle='steps-mid', label='p90')
+    ax.plot(centers, bands[50], color='black', linewidth=1, drawstyle='steps-mid', label='Median')
+
+    ax.set_xlabel("Connection Start Time (seconds)")
+    ax.set_ylabel("Connection Duration (seconds)")
+    ax.set_title(f"TCP Connection Durations ({len(start_timestamps)} connections)")
+    ax.grid(True)
+
+    ax.axvline(x=attack_begin, color='red', linestyle='--', label='Attack Start')
+    ax.axvline(x=attack_finish, color='green', linestyle='--', label='Attack End')
+    ax.legend()
+
+    stem = os.path.splitext(pcap_filename)[0]
+    for fmt in formats:
+        output_file = os.path.join(output_folder, f"{stem}_durations.{fmt}")
+        fig.savefig(output_file, dpi=150)
+        print(f"Saved {output_file}")
+    plt.close(fig)
+
+pcap_path = find_capture('syn_attack.pcap')  # or syn_attack.pcap.gz / .xz / .zst
+attack_begin = 20.0  # Attack start time, used if no flood is detected
+attack_finish = 120.0  # Attack end time, used if no flood is detected
+syn_flood_detector = SynFloodDetector()
+attack_alerts = []
 output_folder_graphs = "tcp_duration_graphs"  
+idle_timeout = 120.0  # seconds without packets before an open connection is finalized
+close_linger = 30.0  # seconds a reset/finished connection waits for its last packets
+unclosed_duration = 100.0  # duration reported for connections that never closed
 
 os.makedirs(output_folder_graphs, exist_ok=True)  
-tcp_connections = defaultdict(lambda: {'start_timestamp': None, 'close_timestamp': None})  
-
-with open(pcap_path, 'rb') as file:
-    pcap_reader = dpkt.pcap.Reader(file)  
-    first_pkt_timestamp = None  
-
-    for timestamp, packet_data in tqdm(pcap_reader, desc="Processing packets"):  
-        ethernet_frame = dpkt.ethernet.Ethernet(packet_data)  
-        
-        if isinstance(ethernet_frame.data, dpkt.ip.IP):  
-            ip_packet = ethernet_frame.data
-            
-            if isinstance(ip_packet.data, dpkt.tcp.TCP):  
-                tcp_segment = ip_packet.data
-                connection_key = (ip_packet.src, ip_packet.dst, tcp_segment.sport, tcp_segment.dport)  
-
-                if first_pkt_timestamp is None:  
-                    first_pkt_timestamp = datetime.datetime.utcfromtimestamp(timestamp)  
-
-                current_packet_timestamp = datetime.datetime.utcfromtimestamp(timestamp)  
-
-                if tcp_segment.flags & dpkt.tcp.TH_SYN:  
-                    if tcp_connections[connection_key]['start_timestamp'] is None:
-                        tcp_connections[connection_key]['start_timestamp'] = current_packet_timestamp
-
-                if tcp_segment.flags & dpkt.tcp.TH_FIN and tcp_segment.flags & dpkt.tcp.TH_ACK:  
-                    tcp_connections[connection_key]['fin_ack_timestamp'] = current_packet_timestamp
-
-                if tcp_segment.flags & dpkt.tcp.TH_RST:  
-                    tcp_connections[connection_key]['close_timestamp'] = current_packet_timestamp
-
-                if tcp_segment.flags & dpkt.tcp.TH_ACK and 'fin_ack_timestamp' in tcp_connections[connection_key]:  
-                    if current_packet_timestamp > tcp_connections[connection_key]['fin_ack_timestamp']:
-                        tcp_connections[connection_key]['close_timestamp'] = current_packet_timestamp
-
-    tcp_durations = []
-    tcp_start_timestamps = []
-
-    for conn_key, conn_info in tcp_connections.items():  
-        if conn_info['start_timestamp'] is None:
-            continue
-        start_time = conn_info['start_timestamp']  
-        close_time = conn_info.get('close_timestamp')  
-
-        if close_time:  
-            duration = (close_time - start_time).total_seconds()
-        else:
-            duration = 100.0  
-
-        tcp_durations.append(duration)  
-        tcp_start_timestamps.append((start_time - first_pkt_timestamp).total_seconds())  
-
-    plot_tcp_durations(tcp_start_timestamps, tcp_durations, attack_begin, attack_finish, os.path.basename(pcap_path), output_folder_graphs)
+tcp_connections = ConnectionTable()  # timestamps in integer microseconds
+tcp_durations = array('d')
+tcp_start_timestamps = array('d')
+first_pkt_timestamp = None
+
+durations_file = open(os.path.join(output_folder_graphs, "tcp_durations.csv"), 'w', newline='')
+durations_writer = csv.writer(durations_file)
+durations_writer.writerow(["start", "duration", "state"])
+
+def record_connection(key, start_time, close_time, reason):
+    # Called as connections finish or go idle, so the table only holds live ones
+    if reason == TIMEOUT:
+        duration = unclosed_duration
+    else:
+        duration = (close_time - start_time) / 1000000
+    start = (start_time - first_pkt_timestamp) / 1000000
+    tcp_durations.append(duration)
+    tcp_start_timestamps.append(start)
+    durations_writer.writerow([f"{start:.6f}", f"{duration:.6f}", reason])
+
+connection_expiry = ConnectionExpiry(tcp_connections, record_connection, idle_timeout, close_linger)
+
+# Decoded per link type, so Ethernet, Linux cooked (tcpdump -i any), raw IP and pcapng captures all work
+with PcapReader(pcap_path) as pcap_reader:
+    start_ts = tcp_connections.start
+    fin_ack_ts = tcp_connections.fin_ack
+    close_ts = tcp_connections.close
+
+    for tcp_segment in tqdm(pcap_reader.tcp_packets(), desc="Processing packets"):
+        timestamp = tcp_segment.ts
+        flags = tcp_segment.flags
+        row = tcp_connections.row(tcp_segment.src, tcp_segment.dst, tcp_segment.sport, tcp_segment.dport)
+
+        current_packet_timestamp = timestamp_us(timestamp)
+
+        if first_pkt_timestamp is None:
+            first_pkt_timestamp = current_packet_timestamp
+
+        for alert in syn_flood_detector.update(timestamp, flags, tcp_segment.src, tcp_segment.dst,
+                                               tcp_segment.sport, tcp_segment.dport):
+            tqdm.write(format_alert(alert, syn_flood_detector.first_ts))
+            attack_alerts.append(alert)
+
+        if flags & TH_SYN:
+            if start_ts[row] == NO_TIME:
+                start_ts[row] = current_packet_timestamp
+
+        if flags & TH_FIN and flags & TH_ACK:
+            fin_ack_ts[row] = current_packet_timestamp
+
+        if flags & TH_RST:
+            close_ts[row] = current_packet_timestamp
+
+        if flags & TH_ACK and fin_ack_ts[row] != NO_TIME:
+            if current_packet_timestamp > fin_ack_ts[row]:
+                close_ts[row] = current_packet_timestamp
+
+        connection_expiry.touch(row, current_packet_timestamp)
+        connection_expiry.expire(current_packet_timestamp)
+
+    for alert in syn_flood_detector.finish():
+        print(format_alert(alert, syn_flood_detector.first_ts))
+        attack_alerts.append(alert)
+
+    windows = attack_windows(attack_alerts)
+    if windows:
+        attack_begin = windows[0][0] - syn_flood_detector.first_ts
+        attack_finish = windows[-1][1] - syn_flood_detector.first_ts
+    else:
+        print(f"No SYN flood detected, marking the default attack window {attack_begin}-{attack_finish}s")
+
+    connection_expiry.flush()
+    durations_file.close()
+
+    plot_tcp_durations(tcp_start_timestamps, tcp_durations, attack_begin, attack_finish, os.path.basename(uncompressed_name(pcap_path)), output_folder_graphs)
@@ -0,0 +1,4 @@
+"""Shared pcap reading and analysis helpers for the assignment scripts."""
+from .reader import PcapReader, TcpHeader
+from .table import PacketTable, PACKET_DTYPE
+from .tcp_tracker import TcpTracker, track_pcap
@@ -0,0 +1,91 @@
+"""Throughput / goodput / loss / window metrics shared by the pcap analyzers."""
+import argparse
+import os
+import sys
+
+from .cache import cached_analysis
+from .capture import capture_parts
+from .parallel import CHUNK_MIN_BYTES, parallel_tcp_metrics
+from .reader import PcapReader
+from .table import PacketTable
+from .timeseries import ThroughputSeries
+
+
+@cached_analysis('tcp_metrics', version=2, ignore=('workers',))
+def tcp_metrics(pcap_file, workers=None):
+    """Computes the metrics the analyzers report for all TCP packets in pcap_file.
+
+    The capture is decoded once into a PacketTable; lost segments follow
+    tshark's tcp.analysis.lost_segment rule and the window is tshark's
+    calculated (scaled) window. Large captures are split across `workers`
+    processes (default: all cores) with identical results. Results are
+    cached on disk per capture (see pcaptools.cache). A rotated capture
+    is analyzed as one, its parts in capture order.
+    """
+    workers = workers or os.cpu_count() or 1
+    parts = capture_parts(pcap_file)
+    if len(parts) > 1 or workers > 1 and os.path.getsize(parts[0]) >= CHUNK_MIN_BYTES:
+        return parallel_tcp_metrics(pcap_file, workers)
+    return PacketTable.from_pcap(parts[0]).metrics()
+
+
+@cached_analysis('tcp_analysis', version=3, ignore=('workers',))
+def tcp_analysis(pcap_file, bin_width=None, workers=None):
+    """tcp_metrics() plus the TcpTracker event counts, from one decode pass.
+
+    The capture is decoded once into a PacketTable; the events
+    (PacketTable.events()) and, when bin_width is given, the per-client
+    throughput series are computed from its columns. The series is
+    returned under 'series' as client_throughput() would
+    ({'times', 'clients', 'mbps'}). Large and rotated captures are split
+    across `workers` processes like in tcp_metrics(), with identical results.
+    """
+    workers = workers or os.cpu_count() or 1
+    parts = capture_parts(pcap_file)
+    if len(parts) > 1 or workers > 1 and os.path.getsize(parts[0]) >= CHUNK_MIN_BYTES:
+        return parallel_tcp_metrics(pcap_file, workers, events=True, bin_width=bin_width)
+    return _table_analysis(parts, bin_width)
+
+
+def _table_analysis(parts, bin_width):
+    table = PacketTable.from_packets(_tcp_packets(parts))
+    metrics = table.metrics()
+    metrics.update(table.events())
+    if bin_width:
+        metrics['series'] = ThroughputSeries.from_table(table, bin_width).client_series()
+    return metrics
+
+
+def _tcp_packets(parts):
+    for part in parts:
+        with PcapReader(part) as reader:
+            yield from reader.tcp_packets()
+
+
+def check_analysis(pcap_file, bin_width=None, workers=4):
+    """Names of the tcp_analysis() results that differ between a split and a single-process run"""
+    single = _table_analysis(capture_parts(pcap_file), bin_width)
+    split = parallel_tcp_metrics(pcap_file, max(workers, 2), events=True, bin_width=bin_width)
+    return [name for name in sorted(set(single) | set(split)) if single.get(name) != split.get(name)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP metrics, events and throughput series of a capture")
+    parser.add_argument("pcap", help="Capture to analyze")
+    parser.add_argument("-b", "--bin", type=float, default=None, help="Series bin width in seconds")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes")
+    parser.add_argument("--check", action="store_true",
+                        help="Compare the split analysis against a single-process one")
+    args = parser.parse_args()
+
+    if args.check:
+        differing = check_analysis(args.pcap, args.bin, args.workers or 4)
+        print(f"Differs: {', '.join(differing)}" if differing else "Split and single-process results match")
+        sys.exit(1 if differing else 0)
+    for name, value in tcp_analysis(args.pcap, args.bin, args.workers).items():
+        if name != 'series':
+            print(f"{name}: {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Parallel analysis of a whole directory of captures.
+
+Usage: python3 -m pcaptools.batch pcaps_Q1d -o results.csv
+
+Every capture is analyzed in its own worker process and the per-file
+metrics are merged into one comparison table (CSV or JSON).
+"""
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from .analysis import tcp_analysis, tcp_metrics
+from .capture import capture_name
+from .compressed import COMPRESSED_SUFFIXES, uncompressed_name
+
+CAPTURE_SUFFIXES = ('.pcap',) + tuple('.pcap' + suffix for suffix in COMPRESSED_SUFFIXES)
+
+
+def discover_captures(folder, suffixes=CAPTURE_SUFFIXES):
+    """Returns the sorted paths of all captures directly inside folder.
+
+    Rotated parts count once, and so do the copies of one capture: like
+    find_capture(), the plain file wins over reno.pcap.gz, .xz and .zst.
+    """
+    copies = {}
+    for name in os.listdir(folder):
+        if os.path.isfile(os.path.join(folder, name)):
+            name = capture_name(name)
+            if name.endswith(suffixes):
+                copies.setdefault(uncompressed_name(name), set()).add(name)
+    captures = []
+    for base, names in copies.items():
+        name = next(name for name in [base] + [base + suffix for suffix in COMPRESSED_SUFFIXES]
+                    if name in names)
+        captures.append(os.path.join(folder, name))
+    return sorted(captures)
+
+
+def _analyze_one(pcap_file, workers=None, events=False, bin_width=None):
+    try:
+        if events or bin_width:
+            metrics = tcp_analysis(pcap_file, bin_width=bin_width, workers=workers)
+        else:
+            metrics = tcp_metrics(pcap_file, workers=workers)
+        return pcap_file, metrics, None
+    except (OSError, ValueError) as err:
+        return pcap_file, None, str(err)
+
+
+def analyze_many(pcap_files, workers=None, events=False, bin_width=None):
+    """Analyzes pcap_files across a process pool.
+
+    Returns (pcap_file, metrics, error) tuples in input order; metrics is
+    None and error holds the reason when a capture could not be read.
+    With events=True the TcpTracker retransmission / out-of-order /
+    duplicate ACK counts are added to each metrics dict, and with a
+    bin_width the per-client throughput series is added under 'series'
+    (see analysis.tcp_analysis); both come from the worker's single pass.
+    """
+    pcap_files = list(pcap_files)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pcap_files) <= 1:
+        return [_analyze_one(pcap, workers, events, bin_width) for pcap in pcap_files]
+    with ProcessPoolExecutor(max_workers=min(workers, len(pcap_files))) as pool:
+        # The pool already uses every core, so files are not split further
+        return list(pool.map(partial(_analyze_one, workers=1, events=events, bin_width=bin_width),
+                             pcap_files))
+
+
+def results_table(results):
+    """Flattens analyze_many() output into one row dict per readable capture"""
+    return [dict(file=os.path.basename(pcap), **metrics)
+            for pcap, metrics, error in results if metrics is not None]
+
+
+def write_table(rows, output_file):
+    """Writes rows as JSON if output_file ends in .json, otherwise as CSV"""
+    if output_file.endswith('.json'):
+        with open(output_file, 'w') as f:
+            json.dump(rows, f, indent=2)
+        return
+
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every capture in a directory in parallel")
+    parser.add_argument("folder", help="Directory holding the pcap files")
+    parser.add_argument("-o", "--output", default="results.csv", help="Output table (.csv or .json)")
+    parser.add_argument("-e", "--events", action="store_true", help="Also count retransmissions, out-of-order segments and duplicate ACKs")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    pcap_files = discover_captures(args.folder)
+    if not pcap_files:
+        print(f"No PCAP files found in {args.folder}!")
+        return
+
+    results = analyze_many(pcap_files, args.workers, args.events)
+    for pcap, metrics, error in results:
+        if error:
+            print(f"Skipped {error}")
+
+    rows = results_table(results)
+    write_table(rows, args.output)
+    print(f"Wrote {len(rows)} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""On-disk cache of analysis results, keyed by capture identity.
+
+A capture is identified by its size, mtime and a BLAKE2 hash of its head
+and tail, so an unchanged file is recognised in milliseconds and a
+rewritten one misses (its old entries are dropped on the next store).
+The key also covers the analysis name, its version and its parameters.
+Entries are small JSON files; the least recently used ones are evicted
+once the cache grows past its size cap.
+
+Set PCAPTOOLS_CACHE_DIR to move the cache, or PCAPTOOLS_NO_CACHE=1 to
+bypass it.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+from .capture import capture_parts
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pcaptools")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+SAMPLE_BYTES = 1024 * 1024  # hashed from each end of the capture
+
+
+def file_identity(path):
+    """(size, mtime_ns, content hash) of a capture file"""
+    st = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(st.st_size.to_bytes(8, 'little'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if st.st_size > 2 * SAMPLE_BYTES:
+            f.seek(-SAMPLE_BYTES, os.SEEK_END)
+        digest.update(f.read(SAMPLE_BYTES))
+    return st.st_size, st.st_mtime_ns, digest.hexdigest()
+
+
+def capture_identity(pcap_file):
+    """file_identity() of every part of a (possibly rotated) capture"""
+    return [file_identity(part) for part in capture_parts(pcap_file)]
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """Directory of JSON analysis results with LRU eviction."""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get("PCAPTOOLS_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry(self, pcap_file, name, version, params):
+        # Entry names start with a digest of the capture's path so stale
+        # results for a rewritten file can be found and dropped
+        path_tag = _digest(os.path.abspath(pcap_file))
+        key = json.dumps([capture_identity(pcap_file), name, version, params], sort_keys=True)
+        return path_tag, os.path.join(self.cache_dir, f"{path_tag}-{_digest(key)}.json")
+
+    def get(self, pcap_file, name, version=1, params=None):
+        """Returns the cached result, or None on a miss"""
+        _, entry = self._entry(pcap_file, name, version, params or {})
+        try:
+            with open(entry) as f:
+                result = json.load(f)
+            os.utime(entry)  # mark as recently used
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, pcap_file, name, result, version=1, params=None):
+        """Stores a JSON-serialisable result and enforces the size cap"""
+        path_tag, entry = self._entry(pcap_file, name, version, params or {})
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp, entry)
+        self._drop_stale(path_tag, pcap_file)
+        self.evict()
+
+    def _drop_stale(self, path_tag, pcap_file):
+        """Removes entries of pcap_file that were made for older contents"""
+        mtime_ns = max(mtime for size, mtime, digest in capture_identity(pcap_file))
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith(path_tag + "-"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if os.stat(path).st_mtime_ns < mtime_ns:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache()
+    return _default_cache
+
+
+def cached_analysis(name, version=1, ignore=()):
+    """Decorates func(pcap_file, *params) to go through the default cache.
+
+    Bump version whenever the analysis changes its results. The key holds
+    every parameter by name, defaults included, however it was passed;
+    parameters listed in ignore (e.g. worker counts) do not affect it.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        first = next(iter(signature.parameters))
+
+        @functools.wraps(func)
+        def wrapper(pcap_file, *args, use_cache=True, **kwargs):
+            if not use_cache or os.environ.get("PCAPTOOLS_NO_CACHE"):
+                return func(pcap_file, *args, **kwargs)
+            bound = signature.bind(pcap_file, *args, **kwargs)
+            bound.apply_defaults()
+            params = {k: v for k, v in bound.arguments.items() if k != first and k not in ignore}
+            try:
+                cache = default_cache()
+                result = cache.get(pcap_file, name, version, params)
+            except OSError:
+                return func(*bound.args, **bound.kwargs)
+            if result is None:
+                result = func(*bound.args, **bound.kwargs)
+                try:
+                    cache.put(pcap_file, name, result, version, params)
+                except OSError:
+                    pass
+            return result
+        return wrapper
+    return decorator
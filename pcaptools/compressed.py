@@ -0,0 +1,217 @@
+"""Reading gzip, xz and zstd compressed captures without decompressing them to disk.
+
+A background thread decompresses the capture into a small ring of large,
+reused buffers while the caller parses the previous one; zlib, lzma and
+zstandard release the GIL while they work, so decompression and parsing
+run on separate cores. Every buffer keeps HEADROOM bytes free in front
+of the data so the partial record at the end of one buffer is copied in
+front of the next, and records are then parsed in place exactly like
+those of a memory-mapped capture.
+
+CompressedPcapReader (what PcapReader() returns for a .pcap.gz,
+.pcap.xz or .pcap.zst) reads sequentially: data offsets point into the
+current buffer and are only valid until the iteration moves on, and
+records cannot be split across workers or looked up by offset.
+"""
+import gzip
+import lzma
+import os
+import queue
+import struct
+import threading
+
+from .reader import (PcapReader, LINK_LAYERS, PCAP_HEADER_LEN, PCAPNG_MAGIC, RECORD_HEADER_LEN,
+                     _parse_header, decode_tcp)
+
+COMPRESSED_SUFFIXES = ('.gz', '.xz', '.zst')
+BUFFER_SIZE = 8 * 1024 * 1024
+BUFFERS = 3  # one being parsed, one being filled, one spare
+HEADROOM = RECORD_HEADER_LEN + 262144  # the largest record libpcap writes
+_READ_SIZE = 1024 * 1024
+
+
+def is_compressed(path):
+    return str(path).endswith(COMPRESSED_SUFFIXES)
+
+
+def uncompressed_name(path):
+    """path without its compression suffix, e.g. reno.pcap for reno.pcap.gz"""
+    return os.path.splitext(path)[0] if is_compressed(path) else path
+
+
+def find_capture(path):
+    """path, or its compressed copy (path.gz, path.xz, path.zst) if only that exists"""
+    if os.path.exists(path):
+        return path
+    for suffix in COMPRESSED_SUFFIXES:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return path
+
+
+def open_decompressed(path):
+    """A binary file object with readinto() yielding the decompressed bytes of path"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    if path.endswith('.zst'):
+        try:
+            import zstandard  # only needed for .zst captures
+        except ImportError:
+            raise ValueError(f"{path}: reading .zst captures needs the zstandard package") from None
+        # Several frames (e.g. from pzstd or concatenated files) are read as one stream
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_size=_READ_SIZE,
+                                                          read_across_frames=True, closefd=True)
+    raise ValueError(f"{path}: unknown compression")
+
+
+class Decompressor:
+    """Decompresses a file on a background thread into a ring of reusable buffers.
+
+    Iterating yields (buffer, length): the data is buffer[HEADROOM:HEADROOM
+    + length]. Each buffer must be handed back with release() once parsed;
+    the thread waits for a free buffer, so at most BUFFERS are ever allocated.
+    """
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE, buffers=BUFFERS):
+        self.path = path
+        self._source = open_decompressed(path)
+        self._free = queue.Queue()
+        self._filled = queue.Queue()
+        for _ in range(buffers):
+            self._free.put(bytearray(HEADROOM + buffer_size))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"decompress {path}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                buf = self._free.get()
+                if buf is None or self._stop.is_set():
+                    return
+                view = memoryview(buf)[HEADROOM:]
+                filled = 0
+                while filled < len(view):
+                    got = self._source.readinto(view[filled:])
+                    if not got:
+                        break
+                    filled += got
+                self._filled.put((buf, filled))
+                if filled < len(buf) - HEADROOM:
+                    return  # end of the stream
+        except Exception as err:  # handed to the reading thread, e.g. a corrupt stream
+            self._filled.put(err)
+        finally:
+            self._filled.put(None)
+            self._source.close()
+
+    def __iter__(self):
+        while True:
+            item = self._filled.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise ValueError(f"{self.path}: {item}") from item
+            yield item
+
+    def release(self, buf):
+        self._free.put(buf)
+
+    def close(self):
+        self._stop.set()
+        self._free.put(None)  # wakes the thread if it waits for a buffer
+        self._thread.join()
+
+
+class CompressedPcapReader(PcapReader):
+    """Sequential reader for compressed classic pcap files with PcapReader's interface.
+
+    records(), ip_packets() and tcp_packets() always cover the whole
+    capture (start/stop may only be the defaults split() returns); each
+    call decompresses the file again.
+    """
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self._buffer_size = buffer_size
+        self._map = b''
+        with open_decompressed(path) as f:
+            header = f.read(PCAP_HEADER_LEN)
+        if header[:4] == PCAPNG_MAGIC:
+            raise ValueError(f"{path}: compressed pcapng captures are not supported")
+        order, self.ts_scale, self.snaplen, self.linktype = _parse_header(header, path)
+        self._record = struct.Struct(order + 'IIII')
+        self._end = None
+
+    def close(self):
+        self._map = b''
+
+    def __len__(self):
+        return os.path.getsize(self.path)
+
+    def _windows(self, start, stop):
+        """Yields (view, offset) per buffer, view[offset:] starting with a whole record.
+
+        Between windows the caller stores the end of the last record it
+        consumed in self._end; the bytes after it move to the next buffer.
+        """
+        if start != PCAP_HEADER_LEN or stop is not None:
+            raise ValueError(f"{self.path}: compressed captures can only be read as a whole")
+        decompressor = Decompressor(self.path, self._buffer_size)
+        tail = b''
+        skip = PCAP_HEADER_LEN
+        try:
+            for buf, length in decompressor:
+                offset = HEADROOM - len(tail)
+                buf[offset:HEADROOM] = tail
+                view = memoryview(buf)[:HEADROOM + length]
+                if skip:
+                    offset += skip
+                    skip = 0
+                self._map = view
+                self._end = offset
+                yield view, offset
+                tail = bytes(view[self._end:])
+                self._map = b''
+                decompressor.release(buf)
+                if len(tail) > HEADROOM:
+                    raise ValueError(f"{self.path}: record larger than {HEADROOM} bytes; corrupt capture?")
+        finally:
+            self._map = b''
+            decompressor.close()
+
+    def records(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (timestamp, caplen, wirelen, data_offset), the offset valid until the next record"""
+        for view, offset in self._windows(start, stop):
+            for record in PcapReader.records(self, offset):
+                self._end = record[3] + record[1]
+                yield record
+
+    def records_at(self, offsets):
+        raise ValueError(f"{self.path}: record offsets are not supported for compressed captures")
+
+    def split(self, parts):
+        """One range: a compressed capture cannot be entered in the middle"""
+        return [(PCAP_HEADER_LEN, None)]
+
+    def packet(self, data_offset, caplen):
+        """A copy of one record's bytes; the buffer behind the offsets is reused"""
+        return bytes(self._map[data_offset:data_offset + caplen])
+
+    def read(self, start, stop):
+        return bytes(self._map[start:stop])
+
+    def ip_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        for view, offset in self._windows(start, stop):
+            for item in PcapReader.ip_packets(self, offset):
+                self._end = item[3] + item[1]
+                yield item
+
+    def tcp_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        link = LINK_LAYERS[self.linktype]
+        for ts, caplen, wirelen, data in self.records(start, stop):
+            pkt = decode_tcp(self._map, data, caplen, wirelen, ts, link)
+            if pkt is not None:
+                yield pkt
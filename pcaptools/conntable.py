@@ -0,0 +1,151 @@
+"""Compact array-backed TCP connection table for SYN-flood sized captures.
+
+A dict of dicts of datetimes costs several hundred bytes per connection.
+Here an IPv4 4-tuple is packed into two 64-bit integers, connection
+timestamps (including the last activity, which orders expiry) are int64
+microseconds in parallel arrays, and lookups go through an
+open-addressing index of row numbers, for ~60 bytes per connection.
+Rows keep first-seen order until some are removed; removed rows are
+reused, so a table that is pruned as connections finish stays as large
+as the number of concurrent connections.
+"""
+import math
+from array import array
+
+NO_TIME = -(1 << 63)  # marks an unset timestamp
+_EMPTY = -1
+_MIN_CAPACITY = 1024
+
+
+def timestamp_us(ts):
+    """Epoch seconds -> integer microseconds, rounded like datetime.utcfromtimestamp"""
+    frac, whole = math.modf(ts)
+    return int(whole) * 1000000 + round(frac * 1e6)
+
+
+class ConnectionTable:
+    """Rows of (4-tuple, start, fin_ack, close, last) indexed by packed 4-tuple."""
+
+    def __init__(self, capacity=_MIN_CAPACITY):
+        self.key_hi = array('Q')      # src << 32 | dst
+        self.key_lo = array('Q')      # sport << 16 | dport
+        self.start = array('q')
+        self.fin_ack = array('q')
+        self.close = array('q')
+        self.last = array('q')        # last activity, kept by ConnectionExpiry
+        self._wide = {}               # IPv6 4-tuples -> row (rare, kept in a dict)
+        self._wide_keys = {}
+        self._free = array('i')       # removed rows, reused before the arrays grow
+        size = _MIN_CAPACITY
+        while size < capacity * 2:
+            size *= 2
+        self._slots = array('i', [_EMPTY]) * size
+        self._mask = size - 1
+
+    def __len__(self):
+        return len(self.start) - len(self._free)
+
+    def _append(self, hi, lo):
+        if self._free:
+            row = self._free.pop()
+            self.key_hi[row] = hi
+            self.key_lo[row] = lo
+            self.start[row] = self.fin_ack[row] = self.close[row] = self.last[row] = NO_TIME
+            return row
+        self.key_hi.append(hi)
+        self.key_lo.append(lo)
+        self.start.append(NO_TIME)
+        self.fin_ack.append(NO_TIME)
+        self.close.append(NO_TIME)
+        self.last.append(NO_TIME)
+        return len(self.start) - 1
+
+    def row(self, src, dst, sport, dport):
+        """Row number of a connection, creating an empty row on first sight"""
+        if len(src) != 4:
+            key = (src, dst, sport, dport)
+            row = self._wide.get(key)
+            if row is None:
+                row = self._wide[key] = self._append(0, 0)
+                self._wide_keys[row] = key
+            return row
+
+        hi = int.from_bytes(src, 'big') << 32 | int.from_bytes(dst, 'big')
+        lo = sport << 16 | dport
+        slots, mask = self._slots, self._mask
+        key_hi, key_lo = self.key_hi, self.key_lo
+        i = hash((hi, lo)) & mask
+        while True:
+            row = slots[i]
+            if row == _EMPTY:
+                break
+            if key_hi[row] == hi and key_lo[row] == lo:
+                return row
+            i = (i + 1) & mask
+
+        row = self._append(hi, lo)
+        slots[i] = row
+        if len(self) * 3 > len(slots) * 2:
+            self._grow()
+        return row
+
+    def remove(self, row):
+        """Forgets a connection; its row number is handed out again later"""
+        key = self._wide_keys.pop(row, None)
+        if key is not None:
+            del self._wide[key]
+            self._free.append(row)
+            return
+
+        slots, mask = self._slots, self._mask
+        key_hi, key_lo = self.key_hi, self.key_lo
+        i = hash((key_hi[row], key_lo[row])) & mask
+        while slots[i] != row:
+            i = (i + 1) & mask
+        # Backward-shift deletion: pull later rows of the probe run into the
+        # gap unless that would move them in front of their home slot
+        j = i
+        while True:
+            j = (j + 1) & mask
+            other = slots[j]
+            if other == _EMPTY:
+                break
+            home = hash((key_hi[other], key_lo[other])) & mask
+            if (j > i and (home <= i or home > j)) or (j < i and home <= i and home > j):
+                slots[i] = other
+                i = j
+        slots[i] = _EMPTY
+        self._free.append(row)
+
+    def rows(self):
+        """Row numbers currently in use"""
+        free = set(self._free)
+        return (row for row in range(len(self.start)) if row not in free)
+
+    def _grow(self):
+        size = len(self._slots) * 2
+        slots = array('i', [_EMPTY]) * size
+        mask = size - 1
+        key_hi, key_lo = self.key_hi, self.key_lo
+        for row in self._slots:
+            if row == _EMPTY:
+                continue
+            i = hash((key_hi[row], key_lo[row])) & mask
+            while slots[i] != _EMPTY:
+                i = (i + 1) & mask
+            slots[i] = row
+        self._slots, self._mask = slots, mask
+
+    def key(self, row):
+        """The (src, dst, sport, dport) of a row, addresses as packed bytes"""
+        if row in self._wide_keys:
+            return self._wide_keys[row]
+        hi, lo = self.key_hi[row], self.key_lo[row]
+        return ((hi >> 32).to_bytes(4, 'big'), (hi & 0xFFFFFFFF).to_bytes(4, 'big'),
+                lo >> 16, lo & 0xFFFF)
+
+    def nbytes(self):
+        """Approximate memory held by the table's arrays"""
+        return sum(a.itemsize * len(a) for a in
+                   (self.key_hi, self.key_lo, self.start, self.fin_ack, self.close, self.last,
+                    self._slots, self._free))
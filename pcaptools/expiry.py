@@ -0,0 +1,125 @@
+"""Idle-timeout expiry of ConnectionTable rows.
+
+Live connections sit in two queues ordered by last activity: open ones,
+which time out after idle_timeout, and ones that already saw a reset or
+a FIN handshake, which only linger long enough to catch the final ACKs.
+Touching a connection moves it to the back of its queue, so expiring is
+popping from the front until the first connection that is still fresh.
+Expired rows are handed to a sink and removed from the table, keeping
+memory proportional to the number of concurrent connections.
+
+The queues are doubly linked lists threaded through row-indexed arrays
+(previous / next row and the queue a row is in), and the last activity
+is the table's `last` column, so the order costs 9 bytes per row on top
+of that column and no Python object per connection.
+"""
+from array import array
+
+from .conntable import NO_TIME
+
+CLOSED = 'closed'
+RESET = 'reset'
+TIMEOUT = 'timeout'
+
+_NONE = -1
+_OPEN = 1     # queue ids in _queue; 0 means the row is in neither queue
+_LINGER = 2
+
+
+class ConnectionExpiry:
+    """Finalizes idle connections of a ConnectionTable (timestamps in µs)."""
+
+    def __init__(self, table, sink, idle_timeout=120.0, close_linger=30.0):
+        self.table = table
+        self.sink = sink  # called as sink(key, start, close, reason)
+        self.idle_timeout = int(idle_timeout * 1000000)
+        self.close_linger = int(close_linger * 1000000)
+        self._prev = array('i')
+        self._next = array('i')
+        self._queue = bytearray()
+        self._head = [_NONE, _NONE, _NONE]  # by queue id
+        self._tail = [_NONE, _NONE, _NONE]
+        self._sizes = [0, 0, 0]
+        self.expired = 0
+
+    def __len__(self):
+        return self._sizes[_OPEN] + self._sizes[_LINGER]
+
+    def _grow(self):
+        missing = len(self.table.start) - len(self._queue)
+        self._prev.extend(array('i', [_NONE]) * missing)
+        self._next.extend(array('i', [_NONE]) * missing)
+        self._queue.extend(bytes(missing))
+
+    def _unlink(self, row):
+        queue = self._queue[row]
+        prev, nxt = self._prev[row], self._next[row]
+        if prev == _NONE:
+            self._head[queue] = nxt
+        else:
+            self._next[prev] = nxt
+        if nxt == _NONE:
+            self._tail[queue] = prev
+        else:
+            self._prev[nxt] = prev
+        self._queue[row] = 0
+        self._sizes[queue] -= 1
+
+    def _append(self, row, queue):
+        tail = self._tail[queue]
+        self._prev[row] = tail
+        self._next[row] = _NONE
+        if tail == _NONE:
+            self._head[queue] = row
+        else:
+            self._next[tail] = row
+        self._tail[queue] = row
+        self._queue[row] = queue
+        self._sizes[queue] += 1
+
+    def touch(self, row, now):
+        """Records activity on a row after its timestamps were updated"""
+        table = self.table
+        table.last[row] = now
+        if row >= len(self._queue):
+            self._grow()
+        queue = _LINGER if table.close[row] != NO_TIME else _OPEN
+        current = self._queue[row]
+        if current:
+            if current == queue and self._tail[queue] == row:
+                return  # already the most recent
+            self._unlink(row)
+        self._append(row, queue)
+
+    def expire(self, now):
+        """Finalizes every connection idle for longer than its timeout"""
+        last = self.table.last
+        for queue, timeout in ((_OPEN, self.idle_timeout), (_LINGER, self.close_linger)):
+            row = self._head[queue]
+            while row != _NONE and now - last[row] >= timeout:
+                self._unlink(row)
+                self._finalize(row)
+                row = self._head[queue]
+
+    def flush(self):
+        """Finalizes every remaining connection, e.g. at the end of a capture"""
+        for queue in (_OPEN, _LINGER):
+            row = self._head[queue]
+            while row != _NONE:
+                self._unlink(row)
+                self._finalize(row)
+                row = self._head[queue]
+
+    def _finalize(self, row):
+        table = self.table
+        start, close = table.start[row], table.close[row]
+        if start != NO_TIME:
+            if close == NO_TIME:
+                reason = TIMEOUT
+            elif table.fin_ack[row] != NO_TIME:
+                reason = CLOSED
+            else:
+                reason = RESET
+            self.sink(table.key(row), start, close, reason)
+        table.remove(row)
+        self.expired += 1
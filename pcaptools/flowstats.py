@@ -0,0 +1,183 @@
+"""Packet-size and per-flow byte accounting, the part1.cpp statistics for a capture.
+
+Usage: python3 -m pcaptools.flowstats 0.pcap --workers 4 --output-dir stats/
+
+The capture is split into record-aligned byte ranges and every range is
+accounted in its own worker process into a compact partial: a size
+histogram plus dicts keyed by packed addresses and ports. The partials are
+merged once at the end, and only then are addresses formatted.
+
+part1.cpp reads an IPv4 header at offset 14 and TCP ports right after it
+for every frame, so IPv6 and other non-IPv4 frames show up as flows like
+0.0.0.0:24576 (the IPv6 version/class word read as a port). Here headers
+are decoded per link type and protocol: IPv6 packets have their real
+addresses, ports come only from TCP and UDP, and non-IP frames count
+toward the size statistics but not toward any flow.
+"""
+import argparse
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .histogram import SizeHistogram
+from .parallel import CHUNK_MIN_BYTES
+from .reader import PcapReader, PCAP_HEADER_LEN
+from .timeseries import format_address
+
+EXACT_SIZE_BITS = 17  # every size up to 128 KiB gets its own bucket, like part1's std::map
+_CHUNK = 1 << 16
+
+
+def format_endpoint(addr, port):
+    host = format_address(addr)
+    if port is None:
+        return host
+    return f"[{host}]:{port}" if len(addr) == 16 else f"{host}:{port}"
+
+
+class FlowStats:
+    """Size distribution, bytes per flow and packets per source / destination address."""
+
+    def __init__(self):
+        self.sizes = SizeHistogram(EXACT_SIZE_BITS)
+        self.flows = {}         # (src, dst, sport, dport) -> wire bytes; ports None without TCP/UDP
+        self.sources = {}       # src -> packets
+        self.destinations = {}  # dst -> packets
+        self.non_ip = 0
+
+    @property
+    def packets(self):
+        return self.sizes.count
+
+    def add_range(self, reader, start=PCAP_HEADER_LEN, stop=None):
+        """Accounts the records of reader in [start, stop)"""
+        flows, sources, destinations = self.flows, self.sources, self.destinations
+        flows_get, sources_get, destinations_get = flows.get, sources.get, destinations.get
+        sizes = array('I')
+        non_ip = 0
+        for ts, caplen, wirelen, data, ip in reader.ip_packets(start, stop):
+            sizes.append(wirelen)
+            if len(sizes) >= _CHUNK:
+                self.sizes.add_many(np.frombuffer(sizes, dtype=np.uint32))
+                del sizes[:]
+            if ip is None:
+                non_ip += 1
+                continue
+            src, dst = ip[1], ip[2]
+            key = (src, dst, ip[3], ip[4])
+            flows[key] = flows_get(key, 0) + wirelen
+            sources[src] = sources_get(src, 0) + 1
+            destinations[dst] = destinations_get(dst, 0) + 1
+        self.sizes.add_many(np.frombuffer(sizes, dtype=np.uint32))
+        self.non_ip += non_ip
+        return self
+
+    def merge(self, other):
+        """Adds another partial's counters; returns self"""
+        self.sizes.merge(other.sizes)
+        for mine, theirs in ((self.flows, other.flows), (self.sources, other.sources),
+                             (self.destinations, other.destinations)):
+            get = mine.get
+            for key, value in theirs.items():
+                mine[key] = get(key, 0) + value
+        self.non_ip += other.non_ip
+        return self
+
+    def flow_bytes(self):
+        """{"src:sport -> dst:dport": bytes} in part1's (string sorted) order"""
+        formatted = {f"{format_endpoint(src, sport)} -> {format_endpoint(dst, dport)}": size
+                     for (src, dst, sport, dport), size in self.flows.items()}
+        return dict(sorted(formatted.items()))
+
+    @staticmethod
+    def _address_counts(counts):
+        return dict(sorted((format_address(addr), n) for addr, n in counts.items()))
+
+    def source_counts(self):
+        return self._address_counts(self.sources)
+
+    def destination_counts(self):
+        return self._address_counts(self.destinations)
+
+    def busiest_flow(self, flow_bytes=None):
+        """(flow, bytes) of the flow with the most data, the first in sorted order on ties"""
+        best, best_bytes = "", 0
+        for flow, size in (flow_bytes or self.flow_bytes()).items():
+            if size > best_bytes:
+                best, best_bytes = flow, size
+        return best, best_bytes
+
+    def write_histogram(self, path):
+        """histogram_data.csv: size,frequency rows"""
+        self.sizes.to_csv(path)
+
+    def write_report(self, path, flow_bytes=None):
+        """packet_statistics.txt in part1's layout"""
+        flow_bytes = flow_bytes or self.flow_bytes()
+        with open(path, 'w', buffering=1 << 20) as f:
+            f.write("\n".join(self.summary_lines()[:5]) + "\n")
+            f.write("\nUnique Source-Destination Flows:\n")
+            f.writelines(f"{flow} -> {size} bytes transferred\n" for flow, size in flow_bytes.items())
+            f.write("\nSource IP Flow Counts:\n")
+            f.writelines(f"{addr} : {n} flows\n" for addr, n in self.source_counts().items())
+            f.write("\nDestination IP Flow Counts:\n")
+            f.writelines(f"{addr} : {n} flows\n" for addr, n in self.destination_counts().items())
+
+    def summary_lines(self):
+        sizes = self.sizes
+        return [f"Total Packets: {self.packets}",
+                f"Total Data Transferred: {sizes.total} bytes",
+                f"Min Packet Size: {sizes.min if sizes.min is not None else 0} bytes",
+                f"Max Packet Size: {sizes.max if sizes.max is not None else 0} bytes",
+                f"Avg Packet Size: {sizes.mean:.6g} bytes"]
+
+
+def range_stats(pcap_file, start, stop):
+    """FlowStats of the records in [start, stop) of pcap_file"""
+    with PcapReader(pcap_file) as reader:
+        return FlowStats().add_range(reader, start, stop)
+
+
+def flow_stats(pcap_file, workers=None):
+    """FlowStats of a capture, its records split across worker processes"""
+    workers = workers or os.cpu_count() or 1
+    if os.path.getsize(pcap_file) < CHUNK_MIN_BYTES // 4:
+        workers = 1
+    with PcapReader(pcap_file) as reader:
+        if workers == 1:
+            return FlowStats().add_range(reader)
+        ranges = reader.split(workers)
+    total = FlowStats()
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        for partial in pool.map(range_stats, [pcap_file] * len(ranges),
+                                [start for start, stop in ranges], [stop for start, stop in ranges]):
+            total.merge(partial)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="part1 packet statistics for a capture")
+    parser.add_argument("pcap", help="Capture to account")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("-d", "--output-dir", default=".",
+                        help="Where to write packet_statistics.txt and histogram_data.csv")
+    args = parser.parse_args()
+
+    stats = flow_stats(args.pcap, args.workers)
+    flow_bytes = stats.flow_bytes()
+    stats.write_histogram(os.path.join(args.output_dir, "histogram_data.csv"))
+    stats.write_report(os.path.join(args.output_dir, "packet_statistics.txt"), flow_bytes)
+
+    for line in stats.summary_lines():
+        print(line)
+    flow, size = stats.busiest_flow(flow_bytes)
+    print(f"Flow with most data: {flow} with {size} bytes")
+    if stats.non_ip:
+        print(f"Non-IP frames (sizes only): {stats.non_ip}")
+    print(f"Histogram and statistics saved to {args.output_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Streaming, mergeable packet-size histograms with quantiles.
+
+Usage:
+    python3 -m pcaptools.histogram 0.pcap 1.pcap --csv histogram_data.csv
+    python3 -m pcaptools.histogram histogram_data.csv part_a.npz part_b.npz -o total.npz
+
+Sizes are counted in HDR-style buckets: every value below 2**sub_bucket_bits
+has its own bucket, larger values share log-spaced buckets whose width is
+at most 1/2**(sub_bucket_bits - 1) of the value. With the default 11 bits
+every Ethernet frame size is exact and jumbo frames are within 0.1%. The
+histogram is a fixed-size count array however many packets it covers, so
+it can be built while streaming a capture, and partial histograms from
+several captures or workers merge by adding their counts.
+"""
+import argparse
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .reader import PcapReader
+
+DEFAULT_SUB_BUCKET_BITS = 11
+_CHUNK = 1 << 16  # sizes buffered before they are binned with NumPy
+
+
+class SizeHistogram:
+    """Counts of non-negative integers in HDR buckets; exact below 2**sub_bucket_bits."""
+
+    def __init__(self, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+        if sub_bucket_bits < 2:
+            raise ValueError("sub_bucket_bits must be at least 2")
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = np.zeros(1 << sub_bucket_bits, dtype=np.int64)
+        self.total = 0          # exact sum of the values, not of bucket bounds
+        self.min = None
+        self.max = None
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    @property
+    def mean(self):
+        count = self.count
+        return self.total / count if count else 0.0
+
+    def bucket_index(self, values):
+        """Bucket of each value (an int or an integer array)"""
+        bits = self.sub_bucket_bits
+        values = np.asarray(values, dtype=np.int64)
+        exponent = np.frexp(values.astype(np.float64))[1]      # bit length, exact below 2**53
+        shift = np.maximum(exponent - bits, 0)
+        half = 1 << (bits - 1)
+        large = (1 << bits) + (shift - 1) * half + (values >> shift) - half
+        return np.where(shift > 0, large, values)
+
+    def bucket_bounds(self, index):
+        """(lowest, highest) value of each bucket in index"""
+        bits = self.sub_bucket_bits
+        index = np.asarray(index, dtype=np.int64)
+        half = 1 << (bits - 1)
+        offset = np.maximum(index - (1 << bits), 0)
+        shift = np.where(index >= 1 << bits, offset // half + 1, 0)
+        mantissa = np.where(shift > 0, offset % half + half, index)
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def _grow(self, size):
+        if size > len(self.counts):
+            counts = np.zeros(max(size, 2 * len(self.counts)), dtype=np.int64)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def add(self, value, count=1):
+        self.add_many(np.array([value]), np.array([count]))
+
+    def add_many(self, values, weights=None):
+        """Adds an array of values, each counted weights[i] times (once by default)"""
+        values = np.asarray(values, dtype=np.int64)
+        if not len(values):
+            return
+        if values.min() < 0:
+            raise ValueError("histogram values must be non-negative")
+        weights = np.ones(len(values), dtype=np.int64) if weights is None else np.asarray(weights, dtype=np.int64)
+        binned = np.bincount(self.bucket_index(values), weights=weights).astype(np.int64)
+        self._grow(len(binned))
+        self.counts[:len(binned)] += binned
+        self.total += int(np.dot(values, weights))
+        present = values[weights > 0]
+        if len(present):
+            low, high = int(present.min()), int(present.max())
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+    def merge(self, other):
+        """Adds the counts of another histogram with the same bucketing; returns self"""
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError("histograms use different bucketing")
+        self._grow(len(other.counts))
+        self.counts[:len(other.counts)] += other.counts
+        self.total += other.total
+        for name, pick in (('min', min), ('max', max)):
+            theirs = getattr(other, name)
+            if theirs is not None:
+                ours = getattr(self, name)
+                setattr(self, name, theirs if ours is None else pick(ours, theirs))
+        return self
+
+    __iadd__ = merge
+
+    def bins(self):
+        """(lowest, highest, count) arrays of the non-empty buckets"""
+        index = np.flatnonzero(self.counts)
+        low, high = self.bucket_bounds(index)
+        return low, high, self.counts[index]
+
+    def quantiles(self, qs):
+        """Nearest-rank quantiles; values in shared buckets report the bucket's highest value"""
+        qs = np.atleast_1d(np.asarray(qs, dtype=np.float64))
+        count = self.count
+        if not count:
+            return np.full(len(qs), np.nan)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(qs * count), 1)
+        index = np.searchsorted(cumulative, ranks, 'left')
+        values = self.bucket_bounds(index)[1]
+        # The extreme buckets are bounded by the exact min and max
+        return np.clip(values, self.min, self.max)
+
+    def quantile(self, q):
+        return float(self.quantiles([q])[0])
+
+    def summary(self):
+        p50, p90, p99 = self.quantiles([0.5, 0.9, 0.99]).tolist()
+        return {'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max,
+                'mean': self.mean, 'p50': p50, 'p90': p90, 'p99': p99}
+
+    @classmethod
+    def from_counts(cls, values, counts, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+        histogram = cls(sub_bucket_bits)
+        histogram.add_many(values, counts)
+        return histogram
+
+    @classmethod
+    def from_csv(cls, path, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+        """Reads size,frequency rows, e.g. the histogram_data.csv written by part1"""
+        data = np.loadtxt(path, delimiter=',', dtype=np.int64, ndmin=2)
+        return cls.from_counts(data[:, 0], data[:, 1], sub_bucket_bits)
+
+    def to_csv(self, path):
+        """Writes size,frequency rows (a shared bucket is written as its lowest value)"""
+        low, _, counts = self.bins()
+        np.savetxt(path, np.column_stack((low, counts)), fmt='%d', delimiter=',')
+
+    @classmethod
+    def from_pcap(cls, pcap_file, wire=True, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+        """Histogram of the frame sizes of a capture (on-the-wire lengths unless wire is False)"""
+        histogram = cls(sub_bucket_bits)
+        sizes = array('I')
+        with PcapReader(pcap_file) as reader:
+            for ts, caplen, wirelen, data in reader.records():
+                sizes.append(wirelen if wire else caplen)
+                if len(sizes) >= _CHUNK:
+                    histogram.add_many(np.frombuffer(sizes, dtype=np.uint32))
+                    del sizes[:]
+        histogram.add_many(np.frombuffer(sizes, dtype=np.uint32))
+        return histogram
+
+    def save(self, path):
+        index = np.flatnonzero(self.counts)
+        with open(path, 'wb') as f:
+            np.savez(f, sub_bucket_bits=np.array(self.sub_bucket_bits), index=index,
+                     counts=self.counts[index], total=np.array(self.total),
+                     extremes=np.array([-1 if self.min is None else self.min,
+                                        -1 if self.max is None else self.max]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            histogram = cls(int(data['sub_bucket_bits']))
+            index = data['index']
+            if len(index):
+                histogram._grow(int(index.max()) + 1)
+                histogram.counts[index] = data['counts']
+            histogram.total = int(data['total'])
+            low, high = data['extremes'].tolist()
+            histogram.min = None if low < 0 else low
+            histogram.max = None if high < 0 else high
+        return histogram
+
+
+def load_histogram(path, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+    """A SizeHistogram from a saved partial (.npz), a size,frequency CSV or a capture"""
+    if path.endswith('.npz'):
+        return SizeHistogram.load(path)
+    if path.endswith('.csv'):
+        return SizeHistogram.from_csv(path, sub_bucket_bits)
+    return SizeHistogram.from_pcap(path, sub_bucket_bits=sub_bucket_bits)
+
+
+def merged_histogram(paths, workers=None, sub_bucket_bits=DEFAULT_SUB_BUCKET_BITS):
+    """Builds the inputs' histograms in worker processes and merges them"""
+    total = SizeHistogram(sub_bucket_bits)
+    if len(paths) <= 1 or workers == 1:
+        for path in paths:
+            total.merge(load_histogram(path, sub_bucket_bits))
+        return total
+    with ProcessPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as pool:
+        for histogram in pool.map(load_histogram, paths, [sub_bucket_bits] * len(paths)):
+            total.merge(histogram)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge packet-size histograms and report quantiles")
+    parser.add_argument("inputs", nargs="+", help="Captures, size,frequency CSVs or saved .npz histograms")
+    parser.add_argument("-o", "--output", help="Save the merged histogram (.npz) for later merging")
+    parser.add_argument("--csv", help="Write the merged histogram as size,frequency rows")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: one per input)")
+    args = parser.parse_args()
+
+    histogram = merged_histogram(args.inputs, args.workers)
+    stats = histogram.summary()
+    print(f"Packets: {stats['count']}  bytes: {stats['total']}  min/mean/max: "
+          f"{stats['min']}/{stats['mean']:.1f}/{stats['max']}")
+    print(f"p50: {stats['p50']:g}  p90: {stats['p90']:g}  p99: {stats['p99']:g}")
+    if args.output:
+        histogram.save(args.output)
+    if args.csv:
+        histogram.to_csv(args.csv)
+
+
+if __name__ == '__main__':
+    main()
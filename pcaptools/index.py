@@ -0,0 +1,279 @@
+"""Sidecar time index for jumping straight to a time range or flow of a capture.
+
+Usage:
+    python3 -m pcaptools.index syn_attack.pcap --flows
+    python3 -m pcaptools.index syn_attack.pcap --range 20 30 -o attack_start.pcap
+
+The index is built in one pass and saved next to the capture as
+<capture>.idx.npz. It maps fixed-width timestamp buckets to the byte range
+of the records in them, and optionally maps each conversation (both
+directions of a TCP 4-tuple) to the offsets of its records. A time-range
+query then only reads the records of the buckets it overlaps, however
+large the capture is. The index is rebuilt whenever the capture changes.
+"""
+import argparse
+import struct
+from array import array
+
+import numpy as np
+
+from .cache import file_identity
+from .compressed import CompressedPcapReader
+from .pcapng import PcapngReader
+from .reader import PcapReader, PCAP_HEADER_LEN, RECORD_HEADER_LEN
+from .timeseries import format_address
+
+INDEX_VERSION = 1
+KEY_WIDTH = 36  # two 16 byte addresses and two ports
+_ports = struct.Struct('!HH')
+
+
+def sidecar_path(pcap_file):
+    return pcap_file + ".idx.npz"
+
+
+def conversation_key(src, dst, sport, dport):
+    """Direction-independent key of a TCP 4-tuple"""
+    a, b = (src, sport), (dst, dport)
+    if b < a:
+        a, b = b, a
+    return a[0], b[0], a[1], b[1]
+
+
+def _pack_key(key):
+    src, dst, sport, dport = key
+    return src.ljust(16, b'\0') + dst.ljust(16, b'\0') + _ports.pack(sport, dport)
+
+
+def _unpack_key(raw, width):
+    sport, dport = _ports.unpack_from(raw, 32)
+    return raw[:width], raw[16:16 + width], sport, dport
+
+
+class PcapIndex:
+    """Bucket -> byte range table of a capture, plus optional per-flow offsets.
+
+    buckets holds the sorted numbers of the non-empty buckets. starts[i] is
+    the offset of the first record that may fall in buckets[i] or later and
+    stops[i] the end of the last record that may fall in buckets[i] or
+    earlier, so [starts[i], stops[j]) holds every record of buckets i..j
+    even if the capture's timestamps are out of order or have gaps.
+    """
+
+    def __init__(self, identity, origin, bucket, buckets, starts, stops, flow_keys=None,
+                 flow_widths=None, flow_ptr=None, flow_offsets=None):
+        self.identity = identity
+        self.origin = origin
+        self.bucket = bucket
+        self.buckets = buckets
+        self.starts = starts
+        self.stops = stops
+        self.flow_keys = flow_keys
+        self.flow_widths = flow_widths
+        self.flow_ptr = flow_ptr
+        self.flow_offsets = flow_offsets
+        self._flows = None
+
+    @property
+    def has_flows(self):
+        return self.flow_ptr is not None
+
+    @classmethod
+    def build(cls, pcap_file, bucket=1.0, flows=False):
+        """Indexes pcap_file in a single pass"""
+        identity = file_identity(pcap_file)
+        spans = {}           # bucket -> [offset of its first record, end of its last]
+        conversations = {}
+        origin = None
+        with PcapReader(pcap_file) as reader:
+            if isinstance(reader, (PcapngReader, CompressedPcapReader)):
+                # Offsets are of uncompressed classic pcap records; convert with editcap -F pcap first
+                raise ValueError(f"{pcap_file}: only uncompressed classic pcap captures can be indexed")
+            for ts, caplen, wirelen, data in reader.records():
+                offset = data - RECORD_HEADER_LEN
+                if origin is None:
+                    origin = ts
+                i = int((ts - origin) // bucket)
+                span = spans.get(i)
+                if span is None:
+                    spans[i] = [offset, data + caplen]
+                else:
+                    span[1] = data + caplen
+                if flows:
+                    pkt = reader.tcp_header(ts, caplen, wirelen, data)
+                    if pkt is not None:
+                        key = conversation_key(pkt.src, pkt.dst, pkt.sport, pkt.dport)
+                        offsets = conversations.get(key)
+                        if offsets is None:
+                            offsets = conversations[key] = array('q')
+                        offsets.append(offset)
+
+        buckets = np.array(sorted(spans), dtype=np.int64)
+        bounds = np.array([spans[i] for i in buckets.tolist()], dtype=np.int64).reshape(-1, 2)
+        starts = np.minimum.accumulate(bounds[::-1, 0])[::-1].copy()
+        stops = np.maximum.accumulate(bounds[:, 1])
+        index = cls(identity, origin or 0.0, bucket, buckets, starts, stops)
+        if flows:
+            keys = list(conversations)
+            index.flow_keys = np.frombuffer(b''.join(map(_pack_key, keys)),
+                                            dtype=np.uint8).reshape(-1, KEY_WIDTH)
+            index.flow_widths = np.array([len(key[0]) for key in keys], dtype=np.uint8)
+            counts = np.array([len(conversations[key]) for key in keys], dtype=np.int64)
+            index.flow_ptr = np.concatenate(([0], np.cumsum(counts)))
+            index.flow_offsets = np.frombuffer(b''.join(conversations[key].tobytes() for key in keys),
+                                               dtype=np.int64)
+        return index
+
+    def save(self, path):
+        arrays = {
+            'version': np.array(INDEX_VERSION),
+            'identity': np.array([str(part) for part in self.identity]),
+            'origin': np.array(self.origin),
+            'bucket': np.array(self.bucket),
+            'buckets': self.buckets,
+            'starts': self.starts,
+            'stops': self.stops,
+        }
+        if self.has_flows:
+            arrays.update(flow_keys=self.flow_keys, flow_widths=self.flow_widths,
+                          flow_ptr=self.flow_ptr, flow_offsets=self.flow_offsets)
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['version']) != INDEX_VERSION:
+                raise ValueError(f"{path}: unsupported index version")
+            size, mtime_ns, digest = data['identity'].tolist()
+            flows = {name: data[name] for name in ('flow_keys', 'flow_widths', 'flow_ptr', 'flow_offsets')
+                     if name in data}
+            return cls((int(size), int(mtime_ns), digest), float(data['origin']), float(data['bucket']),
+                       data['buckets'], data['starts'], data['stops'], **flows)
+
+    def byte_range(self, t0, t1):
+        """(start, stop) offsets covering every record with t0 <= ts < t1 (absolute times)"""
+        if t1 <= t0:
+            return PCAP_HEADER_LEN, PCAP_HEADER_LEN
+        first = np.searchsorted(self.buckets, (t0 - self.origin) // self.bucket, 'left')
+        last = np.searchsorted(self.buckets, np.ceil((t1 - self.origin) / self.bucket) - 1, 'right') - 1
+        if first > last:
+            return PCAP_HEADER_LEN, PCAP_HEADER_LEN
+        return int(self.starts[first]), max(int(self.stops[last]), int(self.starts[first]))
+
+    def flow_records(self, src, dst, sport, dport):
+        """Record offsets of both directions of a 4-tuple (empty if never seen)"""
+        if not self.has_flows:
+            raise ValueError("index was built without per-flow offsets")
+        if self._flows is None:
+            self._flows = {_unpack_key(row.tobytes(), int(width)): i
+                           for i, (row, width) in enumerate(zip(self.flow_keys, self.flow_widths))}
+        i = self._flows.get(conversation_key(src, dst, sport, dport))
+        if i is None:
+            return self.flow_offsets[:0]
+        return self.flow_offsets[self.flow_ptr[i]:self.flow_ptr[i + 1]]
+
+    def conversations(self):
+        """Yields (4-tuple, packet count) of every indexed conversation"""
+        if not self.has_flows:
+            return
+        counts = np.diff(self.flow_ptr)
+        for row, width, count in zip(self.flow_keys, self.flow_widths, counts):
+            yield _unpack_key(row.tobytes(), int(width)), int(count)
+
+
+def load_index(pcap_file, bucket=1.0, flows=False):
+    """Loads the capture's sidecar index, (re)building it when missing or stale"""
+    path = sidecar_path(pcap_file)
+    try:
+        index = PcapIndex.load(path)
+        if (index.identity == file_identity(pcap_file) and index.bucket == bucket
+                and (index.has_flows or not flows)):
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    index = PcapIndex.build(pcap_file, bucket, flows)
+    try:
+        index.save(path)
+    except OSError:
+        pass  # read-only capture directory: use the index without saving it
+    return index
+
+
+def _slice_records(reader, index, t0, t1):
+    start, stop = index.byte_range(t0, t1)
+    for record in reader.records(start, stop):
+        if t0 <= record[0] < t1:
+            yield record
+
+
+def time_slice(pcap_file, t0, t1, relative=True, index=None):
+    """Yields the TcpHeader of every TCP segment with t0 <= ts < t1.
+
+    Times are seconds since the first packet unless relative is False. Only
+    the byte range of the overlapping index buckets is read.
+    """
+    index = index or load_index(pcap_file)
+    if relative:
+        t0, t1 = t0 + index.origin, t1 + index.origin
+    with PcapReader(pcap_file) as reader:
+        for record in _slice_records(reader, index, t0, t1):
+            pkt = reader.tcp_header(*record)
+            if pkt is not None:
+                yield pkt
+
+
+def flow_packets(pcap_file, src, dst, sport, dport, index=None):
+    """Yields the TcpHeaders of one conversation without scanning the capture"""
+    index = index or load_index(pcap_file, flows=True)
+    with PcapReader(pcap_file) as reader:
+        for record in reader.records_at(index.flow_records(src, dst, sport, dport)):
+            pkt = reader.tcp_header(*record)
+            if pkt is not None:
+                yield pkt
+
+
+def write_slice(pcap_file, output_file, t0, t1, relative=True, index=None):
+    """Copies the records with t0 <= ts < t1 into a new capture; returns their count"""
+    index = index or load_index(pcap_file)
+    if relative:
+        t0, t1 = t0 + index.origin, t1 + index.origin
+    count = 0
+    with PcapReader(pcap_file) as reader, open(output_file, 'wb') as out:
+        out.write(reader.packet(0, PCAP_HEADER_LEN))
+        for ts, caplen, wirelen, data in _slice_records(reader, index, t0, t1):
+            out.write(reader.packet(data - RECORD_HEADER_LEN, RECORD_HEADER_LEN + caplen))
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the sidecar time index of a capture")
+    parser.add_argument("pcap", help="Capture to index")
+    parser.add_argument("-b", "--bucket", type=float, default=1.0, help="Bucket width in seconds")
+    parser.add_argument("-f", "--flows", action="store_true", help="Also index per-conversation offsets")
+    parser.add_argument("-r", "--range", type=float, nargs=2, metavar=("START", "END"),
+                        help="Report the records between START and END seconds after the first packet")
+    parser.add_argument("-o", "--output", help="With --range, write the slice to this capture")
+    args = parser.parse_args()
+
+    index = load_index(args.pcap, args.bucket, args.flows)
+    print(f"{args.pcap}: {len(index.buckets)} buckets of {index.bucket:g}s -> {sidecar_path(args.pcap)}")
+    if args.flows:
+        top = sorted(index.conversations(), key=lambda item: -item[1])[:10]
+        for (a, b, pa, pb), count in top:
+            print(f"  {format_address(a)}:{pa} <-> {format_address(b)}:{pb}  {count} packets")
+
+    if args.range:
+        t0, t1 = args.range
+        start, stop = index.byte_range(t0 + index.origin, t1 + index.origin)
+        if args.output:
+            count = write_slice(args.pcap, args.output, t0, t1, index=index)
+            print(f"Wrote {count} records from {t0:g}-{t1:g}s to {args.output}")
+        else:
+            count = sum(1 for _ in time_slice(args.pcap, t0, t1, index=index))
+            print(f"{count} TCP segments from {t0:g}-{t1:g}s in bytes {start}-{stop}")
+
+
+if __name__ == '__main__':
+    main()
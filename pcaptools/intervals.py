@@ -0,0 +1,77 @@
+"""Compact set of covered sequence ranges for unique-byte (goodput) accounting."""
+from bisect import bisect_left, bisect_right
+
+# A hole ending this far below the highest covered byte is filled (its bytes
+# counted) and forgotten. TCP retransmits within a window, so a hole that old
+# was delivered without being captured; the horizon bounds memory under
+# heavy capture loss. The bytes counted only depend on the final ranges, not
+# on the order they arrive in, so table.stale_holes() reproduces them
+# vectorized.
+HOLE_HORIZON = 1 << 24
+
+
+class IntervalSet:
+    """Disjoint half-open [start, end) ranges, merged whenever they touch.
+
+    add() returns how many bytes of the range were not covered before, so
+    summing it over every segment of a flow yields its unique payload bytes.
+    Holes ending more than `horizon` bytes below the highest covered byte are
+    filled; filled_holes and filled_bytes count them (the bytes are included
+    in what add() returns). A segment arriving inside a hole that was already
+    filled stays counted as filled, so those two may exceed what
+    stale_holes() reports for the same data; the covered total never differs.
+    """
+    __slots__ = ('starts', 'ends', 'covered', 'horizon', 'filled_holes', 'filled_bytes')
+
+    def __init__(self, horizon=HOLE_HORIZON):
+        self.starts = []
+        self.ends = []
+        self.covered = 0
+        self.horizon = horizon
+        self.filled_holes = 0
+        self.filled_bytes = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def add(self, start, end):
+        """Covers [start, end) and returns the number of newly covered bytes"""
+        if end <= start:
+            return 0
+        starts, ends = self.starts, self.ends
+
+        # In-order data extends or follows the last range
+        if not starts or start > ends[-1]:
+            starts.append(start)
+            ends.append(end)
+            added = end - start
+        elif start >= starts[-1]:
+            added = max(end - ends[-1], 0)
+            ends[-1] = max(end, ends[-1])
+        else:
+            i = bisect_left(ends, start)
+            j = bisect_right(starts, end)
+            overlap = 0
+            for k in range(i, j):
+                overlap += max(min(ends[k], end) - max(starts[k], start), 0)
+            added = (end - start) - overlap
+            if i < j:
+                start = min(start, starts[i])
+                end = max(end, ends[j - 1])
+            starts[i:j] = [start]
+            ends[i:j] = [end]
+
+        # The lowest hole ends first, so stale holes are always at the front
+        stale = ends[-1] - self.horizon
+        while len(starts) > 1 and starts[1] < stale:
+            hole = starts[1] - ends[0]
+            self.filled_holes += 1
+            self.filled_bytes += hole
+            added += hole
+            del starts[1]
+            del ends[0]
+        self.covered += added
+        return added
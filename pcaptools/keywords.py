@@ -0,0 +1,115 @@
+"""Case-insensitive multi-keyword scanning of raw payload bytes.
+
+The keywords are compiled once into an Aho-Corasick automaton whose
+transition table already folds ASCII case, so a payload is scanned in a
+single pass over its bytes (a memoryview of a capture works, nothing is
+decoded) however many keywords there are. For "capture" keywords the
+whitespace-delimited token that follows the first occurrence is cut out
+during that same pass, e.g. the course code after "course".
+
+Most payloads contain none of the keywords, so scan() first rules them
+out with one compiled, case-insensitive regular expression alternating
+all keywords (a single C-level pass over the payload buffer, no copy)
+and only walks the automaton for the rest.
+"""
+import re
+from array import array
+from collections import deque
+
+WHITESPACE = frozenset(b" \t\n\r\x0b\x0c")
+_FOLD = bytes(range(256)).lower()
+
+
+def _as_bytes(keyword):
+    return keyword.encode() if isinstance(keyword, str) else bytes(keyword)
+
+
+class KeywordMatcher:
+    """Counts occurrences of keywords and extracts the token after capture keywords."""
+
+    def __init__(self, keywords=(), capture=()):
+        names = list(dict.fromkeys([*keywords, *capture]))
+        patterns = [_as_bytes(name).lower() for name in names]
+        if not patterns or not all(patterns):
+            raise ValueError("keywords must be non-empty")
+        self.keywords = names
+        self._patterns = patterns
+        self._capture = {names.index(name) for name in capture}
+        self._reject = re.compile(b"|".join(map(re.escape, patterns)), re.IGNORECASE)
+
+        # Trie of the lowercased keywords
+        goto = [{}]
+        outputs = [()]
+        for k, pattern in enumerate(patterns):
+            state = 0
+            for byte in pattern:
+                nxt = goto[state].get(byte)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][byte] = nxt
+                    goto.append({})
+                    outputs.append(())
+                state = nxt
+            outputs[state] += (k,)
+
+        # Breadth-first failure links, flattened into a full DFA over folded bytes
+        delta = array('i', [0]) * (len(goto) * 256)
+        fail = [0] * len(goto)
+        queue = deque()
+        for byte, nxt in goto[0].items():
+            queue.append(nxt)
+        for byte in range(256):
+            delta[byte] = goto[0].get(_FOLD[byte], 0)
+        while queue:
+            state = queue.popleft()
+            outputs[state] += outputs[fail[state]]
+            base, fail_base = state << 8, fail[state] << 8
+            for byte in range(256):
+                nxt = goto[state].get(_FOLD[byte])
+                if nxt is None:
+                    delta[base | byte] = delta[fail_base | byte]
+                elif _FOLD[byte] == byte:
+                    fail[nxt] = delta[fail_base | byte]
+                    queue.append(nxt)
+                    delta[base | byte] = nxt
+                else:
+                    delta[base | byte] = nxt
+        self._delta = delta
+        self._outputs = outputs
+
+    def scan(self, payload):
+        """Scans bytes or a memoryview.
+
+        Returns None if no keyword occurs, else (counts, tokens): occurrences
+        per keyword (overlapping ones included) and, for each capture keyword
+        seen, the bytes token after its first occurrence (b'' if none follows).
+        """
+        if self._reject.search(payload) is None:
+            return None
+
+        delta, outputs, capture = self._delta, self._outputs, self._capture
+        counts = [0] * len(self._patterns)
+        tokens = {}
+        pending = None      # capture keyword whose token is being read
+        token_start = -1
+        state = 0
+        for i, byte in enumerate(memoryview(payload).cast('B')):
+            if pending is not None:
+                if byte in WHITESPACE:
+                    if token_start >= 0:
+                        tokens[pending] = bytes(payload[token_start:i])
+                        pending = None
+                elif token_start < 0:
+                    token_start = i
+            state = delta[state << 8 | byte]
+            for k in outputs[state]:
+                counts[k] += 1
+                if k in capture and k not in tokens and pending is None:
+                    tokens[k] = b''
+                    pending, token_start = k, -1
+        if pending is not None and token_start >= 0:
+            tokens[pending] = bytes(payload[token_start:])
+
+        names = self.keywords
+        return ({names[k]: n for k, n in enumerate(counts) if n},
+                {names[k]: token for k, token in tokens.items()})
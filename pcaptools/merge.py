@@ -0,0 +1,201 @@
+"""Merging per-host captures into one timeline without duplicate packets.
+
+Usage: python3 -m pcaptools.merge reno_Q.pcap hosts/reno_Q_H1.pcap hosts/reno_Q_H2.pcap hosts/reno_Q_H7.pcap
+
+Every host of an experiment captures into its own file; the merge reads
+them all at once, one record per file at a time, and interleaves them by
+timestamp with a heap (heapq.merge). A segment captured both where it is
+sent and where it is received, or twice by `tcpdump -i any`, is only
+kept the first time: the network header and the start of the transport
+header are hashed (leaving out TTL / hop limit and the IPv4 checksum,
+which change on the way) and a copy arriving within `window` seconds of
+the first is dropped. Memory holds one record per input plus the hashes of
+one window, however long the captures are.
+
+Packets kept from only one capture point are counted (single_point): on
+a path captured at both ends that is the packets lost in between, and a
+count far above the loss rate means the window is shorter than the delay
+between the capture points.
+
+The merged records are written to a classic pcap file or decoded
+straight into TcpHeaders for the analyzers (see merged_metrics()).
+"""
+import argparse
+import heapq
+import struct
+from collections import deque
+from operator import itemgetter
+
+from .capture import capture_parts
+from .reader import PcapReader, LINK_LAYERS, LINKTYPE_RAW, decode_tcp
+from .table import PacketTable
+
+# Seconds between the first and the last copy of a packet. Covers the queueing
+# delay of a congested bottleneck between two capture points (Mininet's default
+# 1000 packet queue holds about 1.2 s at 10 Mbit/s); retransmissions are not
+# taken for copies however late they come, as they differ in IP ID and TCP timestamp.
+DEDUP_WINDOW = 5.0
+DEDUP_BYTES = 128   # hashed from the network header on: IP, TCP and its options
+MAX_HASHES = 1 << 20  # hard cap on the window, whatever the packet rate
+_MERGED_MAGICS = {1000000: 0xa1b2c3d4, 1000000000: 0xa1b23c4d}
+
+
+def packet_hash(frame, caplen, net_off):
+    """Hash of a frame's network packet that is the same at every capture point"""
+    end = min(caplen, net_off + DEDUP_BYTES)
+    version = frame[net_off] >> 4 if caplen > net_off else 0
+    if version == 4:
+        return hash((frame[net_off:net_off + 8], frame[net_off + 12:end]))
+    if version == 6:
+        return hash((frame[net_off:net_off + 7], frame[net_off + 8:end]))
+    return hash(frame[net_off:end])
+
+
+class DuplicateFilter:
+    """Remembers packet hashes for `window` seconds of (non-decreasing) timestamps."""
+
+    def __init__(self, window=DEDUP_WINDOW, max_hashes=MAX_HASHES):
+        self.window = window
+        self.max_hashes = max_hashes
+        self.unmatched = 0      # hashes that left the window without a copy
+        self._recent = deque()  # (ts, hash) of first occurrences in arrival order
+        self._copies = {}       # hash -> occurrences since its first
+
+    def seen(self, ts, key):
+        """True if key was first seen less than `window` seconds ago"""
+        recent, copies = self._recent, self._copies
+        horizon = ts - self.window
+        while recent and (recent[0][0] < horizon or len(recent) >= self.max_hashes):
+            _, old = recent.popleft()
+            if copies.pop(old) == 1:
+                self.unmatched += 1
+        if key in copies:
+            copies[key] += 1
+            return True
+        copies[key] = 1
+        recent.append((ts, key))
+        return False
+
+    def single(self):
+        """Hashes seen exactly once so far, in or out of the window"""
+        return self.unmatched + sum(1 for n in self._copies.values() if n == 1)
+
+
+class CaptureMerge:
+    """Timestamp-ordered, de-duplicated records of several captures.
+
+    Each input may be a rotated capture (its parts are read in order) and
+    should itself be in timestamp order, as tcpdump writes it. If the
+    inputs' link types differ, records() strips the link headers and the
+    merge is a raw IP capture; frames that are not IP are then dropped, and
+    byte counts of the written file no longer include link headers.
+    """
+
+    def __init__(self, pcap_files, window=DEDUP_WINDOW, dedup=True):
+        self.pcap_files = list(pcap_files)
+        self.window = window
+        self.dedup = dedup
+        self.records_in = 0
+        self.duplicates = 0
+        self.single_point = 0  # kept records no other input (or interface) had a copy of
+        self.non_ip = 0
+        linktypes, snaplens, units = set(), [], 1000000
+        for pcap_file in self.pcap_files:
+            for part in capture_parts(pcap_file):
+                with PcapReader(part) as reader:
+                    if reader.linktype is None:
+                        raise ValueError(f"{part}: interfaces have different link types")
+                    linktypes.add(reader.linktype)
+                    snaplens.append(reader.snaplen)
+                    if reader.ts_scale < 1e-6:
+                        units = 1000000000
+        if not linktypes:
+            raise ValueError("no captures to merge")
+        self.raw = len(linktypes) > 1
+        self.linktype = LINKTYPE_RAW if self.raw else linktypes.pop()
+        self.snaplen = max(snaplens)
+        self.units = units  # timestamp resolution of the merged capture
+
+    def _input(self, index, pcap_file):
+        """(ts, index, caplen, wirelen, frame, link) of one input, the frame copied out of the map"""
+        for part in capture_parts(pcap_file):
+            with PcapReader(part) as reader:
+                read, link = reader.read, LINK_LAYERS[reader.linktype]
+                for ts, caplen, wirelen, data in reader.records():
+                    yield ts, index, caplen, wirelen, read(data, data + caplen), link
+
+    def _merged(self):
+        inputs = [self._input(i, pcap_file) for i, pcap_file in enumerate(self.pcap_files)]
+        duplicates = DuplicateFilter(self.window)
+        seen = duplicates.seen
+        for ts, index, caplen, wirelen, frame, link in heapq.merge(*inputs, key=itemgetter(0, 1)):
+            self.records_in += 1
+            if self.dedup and seen(ts, packet_hash(frame, caplen, link[1])):
+                self.duplicates += 1
+                continue
+            yield ts, caplen, wirelen, frame, link
+        if self.dedup:
+            self.single_point = duplicates.single()
+
+    def records(self):
+        """Yields (ts, caplen, wirelen, frame) in the merged capture's link type"""
+        raw = self.raw
+        for ts, caplen, wirelen, frame, (type_off, net_off) in self._merged():
+            if raw and net_off:
+                if caplen <= net_off or frame[net_off] >> 4 not in (4, 6):
+                    self.non_ip += 1
+                    continue
+                frame, caplen, wirelen = frame[net_off:], caplen - net_off, wirelen - net_off
+            yield ts, caplen, wirelen, frame
+
+    def tcp_packets(self):
+        """Yields a TcpHeader for every TCP segment of the merge"""
+        for ts, caplen, wirelen, frame, link in self._merged():
+            pkt = decode_tcp(frame, 0, caplen, wirelen, ts, link)
+            if pkt is not None:
+                yield pkt
+
+    def write(self, output_file):
+        """Writes the merge as a classic pcap file; returns the number of records written"""
+        units = self.units
+        record = struct.Struct('<IIII')
+        written = 0
+        with open(output_file, 'wb', buffering=1 << 20) as out:
+            out.write(struct.pack('<IHHiIII', _MERGED_MAGICS[units], 2, 4, 0, 0, self.snaplen, self.linktype))
+            for ts, caplen, wirelen, frame in self.records():
+                sec, frac = divmod(round(ts * units), units)
+                out.write(record.pack(sec, frac, caplen, wirelen))
+                out.write(frame)
+                written += 1
+        return written
+
+
+def merge_captures(output_file, pcap_files, window=DEDUP_WINDOW, dedup=True):
+    """Merges pcap_files into output_file; returns the CaptureMerge with its counters"""
+    merge = CaptureMerge(pcap_files, window, dedup)
+    merge.write(output_file)
+    return merge
+
+
+def merged_metrics(pcap_files, window=DEDUP_WINDOW):
+    """tcp_metrics() of the de-duplicated merge of pcap_files, without writing it out"""
+    return PacketTable.from_packets(CaptureMerge(pcap_files, window).tcp_packets()).metrics()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge per-host captures by timestamp, dropping duplicates")
+    parser.add_argument("output", help="Merged capture to write")
+    parser.add_argument("inputs", nargs="+", help="Captures to merge (rotated captures by their name)")
+    parser.add_argument("-w", "--window", type=float, default=DEDUP_WINDOW,
+                        help="Seconds within which an identical packet counts as a duplicate")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Only interleave, keep every record")
+    args = parser.parse_args()
+
+    merge = merge_captures(args.output, args.inputs, args.window, not args.keep_duplicates)
+    print(f"Merged {merge.records_in} records from {len(args.inputs)} captures into {args.output}: "
+          f"{merge.duplicates} duplicates dropped, {merge.single_point} packets seen at one capture point only"
+          + (f", {merge.non_ip} non-IP frames dropped" if merge.non_ip else ""))
+
+
+if __name__ == '__main__':
+    main()
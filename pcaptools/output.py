@@ -0,0 +1,92 @@
+"""Batched per-packet output for the sniffers.
+
+Printing a formatted summary for every packet easily costs more than
+parsing it. EventWriter collects output lines and writes them in large
+batches through one buffered stream, as plain text or as JSON lines,
+and can sample or suppress per-packet summaries. Summaries are passed
+as callables and only formatted for the packets that are written.
+"""
+import json
+import sys
+
+TEXT = 'text'
+JSONL = 'jsonl'
+QUIET = 'quiet'
+MODES = (TEXT, JSONL, QUIET)
+
+
+class EventWriter:
+    """Writes packet summaries and named events in text or JSON-lines form.
+
+    summary_every=N writes every Nth packet summary (0 writes none); quiet
+    mode writes no per-packet output at all, only what the caller prints
+    itself.
+    """
+
+    def __init__(self, mode=TEXT, path=None, summary_every=1, batch=4096, buffer_size=1 << 20):
+        if mode not in MODES:
+            raise ValueError(f"unknown output mode {mode!r}")
+        self.mode = mode
+        self.summary_every = summary_every if mode != QUIET else 0
+        self.batch = batch
+        self.packets = 0
+        if path and path != '-':
+            self._stream = open(path, 'w', buffering=buffer_size)
+            self._owned = True
+        else:
+            self._stream = sys.stdout
+            self._owned = False
+        self._lines = []
+
+    @property
+    def uses_stdout(self):
+        return not self._owned
+
+    def summary(self, ts, make_summary):
+        """Counts a packet and writes make_summary() if it is sampled"""
+        self.packets += 1
+        every = self.summary_every
+        if not every or (every > 1 and self.packets % every):
+            return
+        if self.mode == JSONL:
+            self._add(json.dumps({'event': 'packet', 'ts': float(ts), 'summary': make_summary()}))
+        else:
+            self._add(make_summary())
+
+    def event(self, kind, text=None, **fields):
+        """Writes a named event: its text in text mode, kind + fields as JSON otherwise"""
+        if self.mode == JSONL:
+            self._add(json.dumps({'event': kind, **fields}, default=_jsonable))
+        elif self.mode == TEXT and text is not None:
+            self._add(text)
+
+    def _add(self, line):
+        self._lines.append(line)
+        if len(self._lines) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._lines.append('')
+            self._stream.write('\n'.join(self._lines))
+            self._lines = []
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owned:
+            self._stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _jsonable(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode(errors='replace')
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
@@ -0,0 +1,461 @@
+"""Intra-file parallelism: one capture split across worker processes.
+
+The capture is cut into record-aligned byte ranges and every range is
+decoded into its own PacketTable in a worker. Workers return per-flow
+partial aggregates that carry just enough edge state (sequence numbers
+whose loss status depends on earlier ranges, per-range SYN state) for the
+merge to reproduce the single-process metrics exactly.
+
+With events, each flow also carries the TcpTracker state at the range's
+edges plus the rows whose event depends on the state before the range;
+the merge replays those rows against TcpTracker FlowStates carried from
+range to range. With a bin width, each flow carries its throughput bins.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from .capture import capture_parts
+from .reader import PcapReader, TH_SYN, TH_FIN, TH_RST
+from .intervals import IntervalSet
+from .table import PacketTable, merge_ranges, summarize, SEQ_MOD
+from .tcp_tracker import FlowState, TcpTracker, OUT_OF_ORDER_THRESHOLD, seq_after
+from .timeseries import ThroughputSeries, flow_bins
+
+# Captures smaller than this are not worth the process start-up cost
+CHUNK_MIN_BYTES = 64 * 1024 * 1024
+
+# In-order data rows per flow and range shipped for the event merge; a
+# range whose carried sequence state reaches past them is re-analyzed
+EVENT_HEAD_ROWS = 64
+
+NO_EXPECTED = np.iinfo(np.int64).min  # expected seq of a flow's first row in the range
+
+EVENT_ROW_DTYPE = np.dtype([
+    ('rel', np.int64),             # seq relative to FlowPartial.first_seq
+    ('seglen', np.int64),
+    ('expected', np.int64),        # next expected seq from the range alone, NO_EXPECTED on the first row
+    ('ts', np.float64),
+    ('advance_ts', np.float64),    # ts of the range's last advancing row before this one
+    ('seq', np.int64),
+    ('same_seq', np.int8),         # seq repeats the previous row's, -1 on the first row
+    ('peer_seen', np.bool_),       # the peer flow had rows in the range before this one
+    ('peer_ack', np.int64),        # the peer's last ACK number in the range, -1 if none
+    ('peer_first_ack', np.bool_),  # the peer's first ACK row in the range came before this one
+    ('peer_reset', np.bool_),      # ... and so did a change of its ACK number after that
+    ('peer_run', np.int64),        # the peer's duplicate ACKs since then
+])
+
+TrackerEdge = namedtuple('TrackerEdge', [
+    'rows',         # EVENT_ROW_DTYPE rows whose event depends on earlier ranges
+    'limit',        # expected rel seq of the first data row not in rows, None if all are
+    'first_ack',    # (ack, window, previous row's window or -1, pure ACK) of the first ACK row
+    'dup_acks',     # duplicate ACKs after the first ACK row
+    'reset',        # an ACK row after the first one changed the ACK number
+    'dup_run',      # duplicate ACKs at the end since the first ACK row or the last reset
+    'last_seq',
+    'last_ack',     # None without ACK rows
+    'last_window',
+    'advance_ts',   # ts of the range's last advancing row
+])
+
+FlowPartial = namedtuple('FlowPartial', [
+    'candidates',          # seqs of segments whose loss depends on earlier ranges
+    'first_is_candidate',  # candidates[0] is the flow's first segment in the range
+    'end_seq',             # next expected seq after the range
+    'syn_wscale',          # window scale of the range's first SYN, None without SYN
+    'windows',             # max raw window: SYNs, then non-SYNs by (own, peer) SYN seen in range
+    'first_seq',           # seq of the flow's first segment in the range
+    'ranges',              # merged payload ranges (starts, ends) relative to first_seq
+    'tracker',             # TrackerEdge, None without events
+    'series',              # (payload bytes, bin indices, wire bytes per bin), None without bins
+], defaults=(None, None))
+
+ChunkPartial = namedtuple('ChunkPartial', ['packets', 'bytes', 'first_ts', 'last_ts', 'flows', 'source'])
+
+
+def chunk_partial(pcap_file, start, stop, events=False, bin_width=None, origin=None,
+                  head=EVENT_HEAD_ROWS):
+    """Analyzes the records in [start, stop) of pcap_file into a ChunkPartial.
+
+    With events, flows carry their TrackerEdge with the first `head` data
+    rows (all with head=None); with bin_width, their throughput bins
+    counted from `origin`, the capture's first TCP timestamp.
+    """
+    table = PacketTable.from_pcap(pcap_file, start, stop)
+    p = table.packets
+    n = len(p)
+    source = (pcap_file, start, stop)
+    if n == 0:
+        return ChunkPartial(0, 0, None, None, {}, source)
+    nflows = len(table.flows)
+
+    # Sequence edge state
+    order, first, rel, expected = table.sequence_state()
+    flow_sorted = p['flow'][order].astype(np.int64)
+    flags_sorted = p['flags'][order]
+    seq_sorted = p['seq'][order]
+    rst = (flags_sorted & TH_RST) != 0
+    candidate = ~rst & (first | (rel > expected))
+
+    seg_end = rel + p['payload_len'][order] + ((flags_sorted & (TH_SYN | TH_FIN)) != 0)
+    end_rel = np.full(nflows, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(end_rel, flow_sorted, seg_end)
+    first_seq = np.empty(nflows, dtype=np.int64)
+    first_seq[flow_sorted[first]] = seq_sorted[first]
+    end_seq = (first_seq + end_rel) % SEQ_MOD
+    first_candidate = np.zeros(nflows, dtype=bool)
+    first_candidate[flow_sorted[first]] = candidate[first]
+
+    cand_flows = flow_sorted[candidate]
+    cand_seqs = seq_sorted[candidate]
+    bounds = np.flatnonzero(np.diff(cand_flows)) + 1
+    candidates = [np.empty(0, dtype=np.uint32)] * nflows
+    for flow, seqs in zip(cand_flows[np.r_[0, bounds]] if len(cand_flows) else (),
+                          np.split(cand_seqs, bounds)):
+        candidates[flow] = seqs
+
+    # Payload ranges, already merged within the range
+    range_flow, range_start, range_end = merge_ranges(*table.payload_ranges())
+    bounds = np.flatnonzero(np.diff(range_flow)) + 1
+    ranges = [(np.empty(0, dtype=np.int64),) * 2] * nflows
+    for flow, starts, ends in zip(range_flow[np.r_[0, bounds]] if len(range_flow) else (),
+                                  np.split(range_start, bounds), np.split(range_end, bounds)):
+        ranges[flow] = (starts, ends)
+
+    # Window / SYN edge state
+    flow = p['flow'].astype(np.int64)
+    is_syn = (p['flags'] & TH_SYN) != 0
+    syn_rows = np.flatnonzero(is_syn)
+    first_syn = np.full(nflows + 1, n, dtype=np.int64)
+    np.minimum.at(first_syn, flow[syn_rows], syn_rows)
+    shift = np.full(nflows, -1, dtype=np.int64)
+    shift[flow[syn_rows][::-1]] = p['wscale'][syn_rows][::-1]
+
+    peer = table.peers[flow]
+    peer[peer < 0] = nflows
+    rows = np.arange(n)
+    bucket = np.where(is_syn, 0, 1 + 2 * (first_syn[flow] < rows) + (first_syn[peer] < rows))
+    windows = np.full((nflows, 5), -1, dtype=np.int64)
+    np.maximum.at(windows, (flow, bucket), p['window'])
+
+    edges = tracker_edges(table, head) if events else [None] * nflows
+    bins = flow_bins(table, origin, bin_width) if bin_width else [None] * nflows
+
+    flows = {}
+    for f, key in enumerate(table.flows):
+        flows[key] = FlowPartial(candidates[f], bool(first_candidate[f]), int(end_seq[f]),
+                                 int(shift[f]) if first_syn[f] < n else None,
+                                 windows[f].tolist(), int(first_seq[f]), ranges[f], edges[f], bins[f])
+    return ChunkPartial(n, table.total_bytes(), float(p['ts'][0]), float(p['ts'][-1]), flows, source)
+
+
+def tracker_edges(table, head=EVENT_HEAD_ROWS):
+    """TrackerEdge of every flow of a range's PacketTable.
+
+    Retransmission-type rows are always shipped. Rows that are in order
+    within the range can still be retransmissions of data from earlier
+    ranges, so the first `head` of them are shipped too and `limit` says
+    how far the earlier ranges may have reached for the rest to stay in order.
+    """
+    c = table.tracker_columns()
+    n = len(c.order)
+    nflows = len(table.flows)
+    positions = np.arange(n)
+    starts = np.flatnonzero(c.first)
+    ends = np.r_[starts[1:] - 1, n - 1]
+
+    other = ~c.rst & (c.seglen > 0) & ~c.retrans
+    if head is None:
+        shipped = c.retrans | other
+        unshipped = np.empty(0, dtype=np.int64)
+    else:
+        count = np.cumsum(other)
+        rank = count - (count - other)[c.flow_start] - 1
+        shipped = c.retrans | (other & (rank < head))
+        unshipped = np.flatnonzero(other & (rank == head))
+    limits = [None] * nflows
+    for flow, expected in zip(c.flow[unshipped].tolist(), c.expected[unshipped].tolist()):
+        limits[flow] = expected
+
+    rows = np.flatnonzero(shipped)
+    first = c.first[rows]
+    prev = np.maximum(rows - 1, 0)
+    reset_seen = np.maximum.accumulate(np.where(c.reset, positions, -1))
+    pos = table.peer_rows(c, rows)
+    seen = pos >= 0
+    peer_ack = c.last_ack[pos]
+    peer_acked = seen & (peer_ack >= c.flow_start[pos])
+    shipped_rows = np.empty(len(rows), dtype=EVENT_ROW_DTYPE)
+    shipped_rows['rel'] = c.rel[rows]
+    shipped_rows['seglen'] = c.seglen[rows]
+    shipped_rows['expected'] = np.where(first, NO_EXPECTED, c.expected[rows])
+    shipped_rows['ts'] = c.ts[rows]
+    shipped_rows['advance_ts'] = np.where(first, np.nan, c.ts[c.last_advance[prev]])
+    shipped_rows['seq'] = c.seq[rows]
+    shipped_rows['same_seq'] = np.where(first, -1, c.seq[rows] == c.seq[prev])
+    shipped_rows['peer_seen'] = seen
+    shipped_rows['peer_ack'] = np.where(peer_acked, c.ack[peer_ack].astype(np.int64), -1)
+    shipped_rows['peer_first_ack'] = peer_acked
+    shipped_rows['peer_reset'] = seen & (reset_seen[pos] >= c.flow_start[pos])
+    shipped_rows['peer_run'] = np.where(seen, c.dup_run[pos], 0)
+    flow_rows = np.split(shipped_rows, np.searchsorted(c.flow[rows], np.arange(1, nflows)))
+
+    first_acks = [None] * nflows
+    first_ack = np.flatnonzero((c.last_ack == positions) & (c.prev_ack < 0))
+    for flow, ack, window, prev_window, pure in zip(
+            c.flow[first_ack].tolist(), c.ack[first_ack].tolist(), c.window[first_ack].tolist(),
+            np.where(c.first[first_ack], -1, c.window[first_ack - 1].astype(np.int64)).tolist(),
+            ((c.seglen[first_ack] == 0) & ~c.rst[first_ack]).tolist()):
+        first_acks[flow] = (ack, window, prev_window, pure)
+
+    last_ack = c.last_ack[ends]
+    acked = last_ack >= starts
+    dup_acks = np.bincount(c.flow[c.dup], minlength=nflows)
+    return [TrackerEdge(*edge) for edge in zip(
+        flow_rows, limits, first_acks, dup_acks.tolist(), (reset_seen[ends] >= starts).tolist(),
+        c.dup_run[ends].tolist(), c.seq[ends].tolist(),
+        [ack if has_ack else None for ack, has_ack in zip(c.ack[last_ack].tolist(), acked.tolist())],
+        c.window[ends].tolist(), c.ts[c.last_advance[ends]].tolist())]
+
+
+def merge_partials(partials, events=False, bin_width=None, ooo_threshold=OUT_OF_ORDER_THRESHOLD):
+    """Merges ChunkPartials, in file order, into the final metrics dict.
+
+    With events, the dict also holds the TcpTracker event totals; with
+    bin_width, the per-client series under 'series' as client_throughput().
+    """
+    packet_count = total_bytes = unique_bytes = lost_packets = max_window_size = 0
+    first_ts = last_ts = None
+    next_seq = {}
+    syn_wscale = {}
+    delivered = {}  # flow -> (IntervalSet, reference seq, its unwrapped position)
+    tracker = TcpTracker(ooo_threshold)
+    series = ThroughputSeries(bin_width) if bin_width else None
+
+    for part in partials:
+        if not part.packets:
+            continue
+        packet_count += part.packets
+        total_bytes += part.bytes
+        if first_ts is None:
+            first_ts = part.first_ts
+        last_ts = part.last_ts
+
+        # Windows are resolved against the SYN state from earlier ranges
+        for key, fp in part.flows.items():
+            src, dst, sport, dport = key
+            peer_key = (dst, src, dport, sport)
+            own_prev = key in syn_wscale
+            peer_prev = peer_key in syn_wscale
+            own_shift = syn_wscale[key] if own_prev else fp.syn_wscale
+            if peer_prev:
+                peer_shift = syn_wscale[peer_key]
+            else:
+                peer_fp = part.flows.get(peer_key)
+                peer_shift = peer_fp.syn_wscale if peer_fp else None
+            for bucket, window in enumerate(fp.windows):
+                if window < 0:
+                    continue
+                if bucket:
+                    own_seen = own_prev or (bucket - 1) & 2
+                    peer_seen = peer_prev or (bucket - 1) & 1
+                    if own_seen and peer_seen and own_shift > 0 and peer_shift >= 0:
+                        window <<= own_shift
+                max_window_size = max(max_window_size, window)
+
+        if events:
+            if not _edges_cover(part, next_seq):
+                full = chunk_partial(*part.source, events=True, head=None)
+                part = part._replace(flows={key: fp._replace(tracker=full.flows[key].tracker)
+                                            for key, fp in part.flows.items()})
+            merge_events(tracker, part, next_seq)
+        if series is not None:
+            series.start_ts = first_ts
+            for key, fp in part.flows.items():
+                series.add_flow(key, *fp.series)
+
+        for key, fp in part.flows.items():
+            expected = next_seq.get(key)
+            if expected is None:
+                lost_packets += len(fp.candidates) - fp.first_is_candidate
+                next_seq[key] = fp.end_seq
+            else:
+                gap = (fp.candidates.astype(np.int64) - expected) % SEQ_MOD
+                lost_packets += int(np.count_nonzero((gap > 0) & (gap < SEQ_MOD // 2)))
+                if seq_after(fp.end_seq, expected):
+                    next_seq[key] = fp.end_seq
+            if key not in syn_wscale and fp.syn_wscale is not None:
+                syn_wscale[key] = fp.syn_wscale
+
+            # Re-base the range's payload positions onto the flow's first range
+            if key in delivered:
+                covered, ref_seq, ref_pos = delivered[key]
+                pos = ref_pos + (fp.first_seq - ref_seq + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+            else:
+                covered, pos = IntervalSet(), 0
+            for start, end in zip(*fp.ranges):
+                unique_bytes += covered.add(int(start) + pos, int(end) + pos)
+            delivered[key] = (covered, fp.first_seq, pos)
+
+    duration = last_ts - first_ts if packet_count else 0
+    filled_holes = sum(covered.filled_holes for covered, _, _ in delivered.values())
+    filled_bytes = sum(covered.filled_bytes for covered, _, _ in delivered.values())
+    metrics = summarize(packet_count, total_bytes, unique_bytes, lost_packets, duration, max_window_size,
+                        filled_holes, filled_bytes)
+    if events:
+        metrics.update(tracker.events())
+    if series is not None:
+        metrics['series'] = series.client_series()
+    return metrics
+
+
+def _signed_gap(seq, ref):
+    return (seq - ref + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+
+
+def _edges_cover(part, next_seq):
+    """True if every flow shipped the rows its carried sequence state can turn into events"""
+    for key, fp in part.flows.items():
+        expected = next_seq.get(key)
+        limit = fp.tracker.limit
+        if expected is not None and limit is not None and _signed_gap(expected, fp.first_seq) > limit:
+            return False
+    return True
+
+
+def merge_events(tracker, part, next_seq):
+    """Replays a range's TrackerEdges against the FlowStates carried in tracker.
+
+    next_seq holds the flows' next expected seqs before the range.
+    """
+    states = tracker.flows
+
+    # The first ACK row of a flow continues the carried duplicate ACK run
+    runs = {}
+    first_dups = {}
+    for key, fp in part.flows.items():
+        if fp.tracker.first_ack is None:
+            continue
+        ack, window, prev_window, pure = fp.tracker.first_ack
+        state = states.get(key)
+        last_ack = state.last_ack if state else None
+        last_window = prev_window if prev_window >= 0 else state.last_window if state else None
+        if pure and ack == last_ack and window == last_window:
+            runs[key] = state.dup_acks + 1
+            first_dups[key] = 1
+        elif ack != last_ack:
+            runs[key] = 0
+        else:
+            runs[key] = state.dup_acks
+
+    # The carried state of every row's flow and peer, repeated over its rows
+    carried = []     # next expected seq relative to the range's first_seq
+    advance_ts = []
+    last_seq = []
+    peer_known = []
+    peer_dups = []
+    peer_run = []    # the peer's run after its first ACK row in the range
+    peer_ack = []
+    for key, fp in part.flows.items():
+        state = states.get(key)
+        if state is None:
+            carried.append(NO_EXPECTED)
+            advance_ts.append(-1.0)
+            last_seq.append(-1)
+        else:
+            carried.append(_signed_gap(next_seq[key], fp.first_seq))
+            advance_ts.append(state.advance_ts)
+            last_seq.append(state.last_seq)
+        src, dst, sport, dport = key
+        peer_key = (dst, src, dport, sport)
+        peer = states.get(peer_key)
+        peer_known.append(peer is not None)
+        peer_dups.append(peer.dup_acks if peer else 0)
+        peer_run.append(runs.get(peer_key, 0))
+        peer_ack.append(-1 if peer is None or peer.last_ack is None else peer.last_ack)
+    sizes = [len(fp.tracker.rows) for fp in part.flows.values()]
+    rows = np.concatenate([fp.tracker.rows for fp in part.flows.values()], dtype=EVENT_ROW_DTYPE)
+
+    def repeat(values):
+        return np.repeat(np.array(values), sizes)
+
+    carried = repeat(carried)
+    expected = np.maximum(rows['expected'], carried)
+    rel = rows['rel']
+    retrans = (rel < expected) & ~((rows['seglen'] == 1) & (rel + 1 == expected))
+
+    run = np.where(rows['peer_reset'], rows['peer_run'],
+                   np.where(rows['peer_first_ack'], repeat(peer_run) + rows['peer_run'], repeat(peer_dups)))
+    acked = np.where(rows['peer_ack'] >= 0, rows['peer_ack'], repeat(peer_ack))
+    fast = retrans & (rows['peer_seen'] | repeat(peer_known)) & (run >= 2) & (acked == rows['seq'])
+
+    advance = np.where(rows['expected'] > carried, rows['advance_ts'], repeat(advance_ts))
+    same = np.where(rows['same_seq'] >= 0, rows['same_seq'] == 1, rows['seq'] == repeat(last_seq))
+    out_of_order = retrans & ~fast & (rows['ts'] - advance < tracker.ooo_threshold) & ~same
+
+    flow = repeat(np.arange(len(sizes)))
+    counts = zip(*(np.bincount(flow[mask], minlength=len(sizes)).tolist()
+                   for mask in (retrans, fast, out_of_order)))
+
+    for (key, fp), (retrans, fast, out_of_order) in zip(part.flows.items(), counts):
+        edge = fp.tracker
+        state = states.get(key)
+        expected = next_seq.get(key)
+        if state is None:
+            state = states[key] = FlowState()
+        state.retransmissions += retrans - out_of_order
+        state.fast_retransmissions += fast
+        state.out_of_order += out_of_order
+        state.duplicate_acks += edge.dup_acks + first_dups.get(key, 0)
+        if edge.reset:
+            state.dup_acks = edge.dup_run
+        elif key in runs:
+            state.dup_acks = runs[key] + edge.dup_run
+        if edge.last_ack is not None:
+            state.last_ack = edge.last_ack
+        state.last_window = edge.last_window
+        state.last_seq = edge.last_seq
+        if expected is None or seq_after(fp.end_seq, expected):
+            state.advance_ts = edge.advance_ts
+
+
+def capture_ranges(pcap_file, workers):
+    """(part, start, stop) ranges covering every part of a capture, in capture order"""
+    parts = capture_parts(pcap_file)
+    sizes = [os.path.getsize(part) for part in parts]
+    ranges = []
+    for part, size in zip(parts, sizes):
+        # Each part gets its share of the workers, so a rotated capture splits like one file
+        with PcapReader(part) as reader:
+            ranges.extend((part, start, stop) for start, stop in
+                          reader.split(max(round(workers * size / max(sum(sizes), 1)), 1)))
+    return ranges
+
+
+def first_timestamp(ranges):
+    """Timestamp of the first TCP packet in (part, start, stop) ranges, None without one"""
+    for part, start, stop in ranges:
+        with PcapReader(part) as reader:
+            for pkt in reader.tcp_packets(start, stop):
+                return pkt.ts
+    return None
+
+
+def parallel_tcp_metrics(pcap_file, workers=None, events=False, bin_width=None):
+    """tcp_metrics() for one capture, with its records split across workers.
+
+    events and bin_width add what tcp_analysis() reports on top.
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = capture_ranges(pcap_file, workers)
+    analyze = partial(chunk_partial, events=events, bin_width=bin_width,
+                      origin=first_timestamp(ranges) if bin_width else None)
+    if len(ranges) == 1 or workers == 1:
+        return merge_partials((analyze(*piece) for piece in ranges), events, bin_width)
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        partials = pool.map(analyze, *zip(*ranges))
+        return merge_partials(partials, events, bin_width)
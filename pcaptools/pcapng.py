@@ -0,0 +1,427 @@
+"""pcapng support for PcapReader and PcapStream.
+
+A pcapng file is a sequence of blocks. Section headers fix the byte
+order, interface description blocks give each interface its link type,
+snap length and timestamp resolution, and enhanced / simple / (obsolete)
+packet blocks carry the frames. Every packet is decoded with its own
+interface's link layer, so one capture can mix e.g. Ethernet and Linux
+cooked interfaces; other blocks (name resolution, statistics, ...) are
+skipped. Records are yielded exactly like PcapReader's, with the data
+offset pointing into the memory map.
+"""
+import mmap
+import struct
+from collections import namedtuple
+
+from .reader import (PcapReader, PcapStream, IPPROTO_TCP, IPPROTO_UDP, LINK_LAYERS, PCAP_HEADER_LEN,
+                     PCAPNG_MAGIC, _ipv4_unpacker, _ports, decode_ip, decode_tcp)
+
+SECTION_HEADER = 0x0A0D0D0A
+INTERFACE_DESCRIPTION = 1
+OBSOLETE_PACKET = 2
+SIMPLE_PACKET = 3
+ENHANCED_PACKET = 6
+BYTE_ORDER_MAGICS = {b'\x4d\x3c\x2b\x1a': '<', b'\x1a\x2b\x3c\x4d': '>'}
+
+OPT_END = 0
+OPT_IF_TSRESOL = 9
+OPT_IF_TSOFFSET = 14
+
+MIN_BLOCK_LEN = 12
+ENHANCED_HEADER_LEN = 28
+
+Interface = namedtuple('Interface', ['linktype', 'link', 'snaplen', 'units', 'scale', 'offset', 'ipv4'])
+Interface.__doc__ = """One capture interface: link is its LINK_LAYERS entry (None if unsupported);
+timestamps are integers of `units` per second, plus `offset` seconds. ipv4 is
+the link's _ipv4_unpacker(), compiled once when the interface is declared."""
+
+
+class _Section:
+    """Byte order and interfaces of the section being read."""
+
+    def __init__(self, path, order):
+        self.path = path
+        self.order = order
+        self.interfaces = []
+        self.header = struct.Struct(order + 'II')
+        self.enhanced = struct.Struct(order + 'IIIII')   # interface, ts high, ts low, caplen, wirelen
+        self.enhanced_block = struct.Struct(order + '7I')  # type and length, then the fields above
+        self.obsolete = struct.Struct(order + 'HHIIII')  # interface, drops, ts high, ts low, caplen, wirelen
+        self.u32 = struct.Struct(order + 'I')
+        self.option = struct.Struct(order + 'HH')
+        self.last_ts = 0.0
+
+    def copy(self):
+        section = _Section(self.path, self.order)
+        section.interfaces = list(self.interfaces)
+        return section
+
+    @classmethod
+    def parse(cls, buf, offset, path):
+        """The section started by the section header block at buf[offset:]"""
+        order = BYTE_ORDER_MAGICS.get(bytes(buf[offset + 8:offset + 12]))
+        if order is None:
+            raise ValueError(f"{path}: bad pcapng byte-order magic at offset {offset}")
+        return cls(path, order)
+
+    def add_interface(self, buf, offset, length):
+        linktype, snaplen = struct.unpack_from(self.order + 'HxxI', buf, offset + 8)
+        units, offset_seconds = 1000000, 0
+        pos, end = offset + 16, offset + length - 4
+        while pos + 4 <= end:
+            code, size = self.option.unpack_from(buf, pos)
+            if code == OPT_END:
+                break
+            value = pos + 4
+            if code == OPT_IF_TSRESOL and size >= 1:
+                resolution = buf[value]
+                units = 2 ** (resolution & 0x7F) if resolution & 0x80 else 10 ** resolution
+            elif code == OPT_IF_TSOFFSET and size >= 8:
+                offset_seconds = struct.unpack_from(self.order + 'q', buf, value)[0]
+            pos = value + (size + 3) // 4 * 4
+        link = LINK_LAYERS.get(linktype)
+        self.interfaces.append(Interface(linktype, link, snaplen, units, 1.0 / units, offset_seconds,
+                                         _ipv4_unpacker(link) if link else None))
+
+    def interface(self, index):
+        try:
+            return self.interfaces[index]
+        except IndexError:
+            raise ValueError(f"{self.path}: packet on undeclared interface {index}") from None
+
+    def packet(self, buf, offset, btype, length):
+        """(ts, caplen, wirelen, data offset, interface) of a packet block, None for other blocks"""
+        if btype == ENHANCED_PACKET:
+            index, high, low, caplen, wirelen = self.enhanced.unpack_from(buf, offset + 8)
+            data = offset + 28
+        elif btype == SIMPLE_PACKET:
+            index, high, low = 0, None, None
+            wirelen = self.u32.unpack_from(buf, offset + 8)[0]
+            caplen = min(wirelen, length - 16, self.interface(0).snaplen or wirelen)
+            data = offset + 12
+        elif btype == OBSOLETE_PACKET:
+            index, _, high, low, caplen, wirelen = self.obsolete.unpack_from(buf, offset + 8)
+            data = offset + 28
+        else:
+            return None
+        interface = self.interface(index)
+        if data + caplen > offset + length:
+            raise ValueError(f"{self.path}: packet block at offset {offset} overruns its length")
+        if high is not None:
+            sec, frac = divmod(high << 32 | low, interface.units)
+            self.last_ts = sec + frac * interface.scale + interface.offset
+        # Simple packet blocks carry no timestamp; they get the previous packet's
+        return self.last_ts, caplen, wirelen, data, interface
+
+
+def _link(interface, path):
+    if interface.link is None:
+        raise ValueError(f"{path}: unsupported link type {interface.linktype}")
+    return interface.link
+
+
+class PcapngReader(PcapReader):
+    """Memory-mapped pcapng reader with PcapReader's interface.
+
+    start/stop offsets are block offsets; PCAP_HEADER_LEN, the classic
+    default start, means the beginning of the file. tcp_header() and
+    ip_header() need every interface to share one link type; the
+    iterating methods decode each packet with its own interface's.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: empty capture file")
+        try:
+            if self._map[:4] != PCAPNG_MAGIC:
+                raise ValueError(f"{path}: not a pcapng file")
+            # Interfaces are declared before the packets that use them; read the leading ones now
+            section, self._first_packet = self._head = self._state_at(None)
+        except ValueError:
+            self.close()
+            raise
+        linktypes = {interface.linktype for interface in section.interfaces}
+        self.linktype = linktypes.pop() if len(linktypes) == 1 else None
+        self.snaplen = section.interfaces[0].snaplen if section.interfaces else 0
+        self.ts_scale = section.interfaces[0].scale if section.interfaces else 1e-6
+
+    @property
+    def interfaces(self):
+        return self._head[0].interfaces
+
+    def _state_at(self, stop):
+        """(section, offset): the section state after the blocks before stop, or up to the first packet"""
+        mm = self._map
+        section = None
+        offset = 0
+        while offset + MIN_BLOCK_LEN <= len(mm) and (stop is None or offset < stop):
+            if section is None or mm[offset:offset + 4] == PCAPNG_MAGIC:
+                section = _Section.parse(mm, offset, self.path)
+            btype, length = section.header.unpack_from(mm, offset)
+            if length < MIN_BLOCK_LEN or offset + length > len(mm):
+                break
+            if btype == INTERFACE_DESCRIPTION:
+                section.add_interface(mm, offset, length)
+            elif stop is None and btype in (ENHANCED_PACKET, SIMPLE_PACKET, OBSOLETE_PACKET):
+                break
+            offset += length
+        if section is None:
+            raise ValueError(f"{self.path}: not a pcapng file")
+        return section, offset
+
+    def _start(self, start):
+        """(section, offset) to read the blocks of a range starting at start from"""
+        if start <= self._first_packet:
+            return self._head[0].copy(), self._first_packet
+        return self._state_at(start)
+
+    def _block(self, section, offset):
+        """(section, length, packet) of the block at offset; length is 0 for a truncated final block.
+
+        A section header block starts a new section and an interface
+        description adds an interface; packet is _Section.packet()'s tuple,
+        None for blocks without a packet.
+        """
+        mm = self._map
+        btype, length = section.header.unpack_from(mm, offset)
+        if btype == SECTION_HEADER:  # the same in either byte order
+            section = _Section.parse(mm, offset, self.path)
+            btype, length = section.header.unpack_from(mm, offset)
+        if length < MIN_BLOCK_LEN or offset + length > len(mm):
+            return section, 0, None
+        if btype == INTERFACE_DESCRIPTION:
+            section.add_interface(mm, offset, length)
+            return section, length, None
+        return section, length, section.packet(mm, offset, btype, length)
+
+    def _packets(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (ts, caplen, wirelen, data offset, interface) of the packet blocks in [start, stop).
+
+        Enhanced packet blocks, nearly every block of a capture, are
+        unpacked inline with one precompiled struct, and the interface is
+        only looked up again when the packet's differs from the previous
+        one's; the other blocks go through _block().
+        """
+        mm = self._map
+        size = len(mm)
+        stop = size if stop is None else min(stop, size)
+        section, offset = self._start(start)
+        unpack_block = section.enhanced_block.unpack_from
+        last_ts = section.last_ts
+        current = -1
+        while offset + MIN_BLOCK_LEN <= stop:
+            if offset + ENHANCED_HEADER_LEN <= size:
+                btype, length, index, high, low, caplen, wirelen = unpack_block(mm, offset)
+                if btype == ENHANCED_PACKET and length >= 32 and offset + length <= size:
+                    data = offset + ENHANCED_HEADER_LEN
+                    if data + caplen > offset + length:
+                        raise ValueError(f"{self.path}: packet block at offset {offset} overruns its length")
+                    offset += length
+                    if index != current:
+                        interface = section.interface(index)
+                        units, scale, ts_offset = interface.units, interface.scale, interface.offset
+                        current = index
+                    sec, frac = divmod(high << 32 | low, units)
+                    last_ts = sec + frac * scale + ts_offset
+                    yield last_ts, caplen, wirelen, data, interface
+                    continue
+            section.last_ts = last_ts
+            section, length, packet = self._block(section, offset)
+            if not length:
+                break  # truncated final block
+            if packet is not None:
+                yield packet
+            unpack_block = section.enhanced_block.unpack_from
+            last_ts = section.last_ts
+            current = -1
+            offset += length
+
+    def records(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (timestamp, caplen, wirelen, data_offset) for each packet block"""
+        for ts, caplen, wirelen, data, interface in self._packets(start, stop):
+            yield ts, caplen, wirelen, data
+
+    def records_at(self, offsets):
+        raise ValueError(f"{self.path}: record offsets are not supported for pcapng captures")
+
+    def split(self, parts):
+        """Splits the blocks into up to `parts` (start, stop) byte ranges, cut at block boundaries"""
+        mm = self._map
+        size = len(mm)
+        section, offset = self._head
+        header = section.header
+        target = max((size - offset) // max(parts, 1), 1)
+        ranges = []
+        start, begin = PCAP_HEADER_LEN, offset
+        while offset + MIN_BLOCK_LEN <= size:
+            if offset - begin >= target and len(ranges) < parts - 1:
+                ranges.append((start, offset))
+                start = begin = offset
+            btype, length = header.unpack_from(mm, offset)
+            if btype == SECTION_HEADER:
+                header = _Section.parse(mm, offset, self.path).header
+                length = header.unpack_from(mm, offset)[1]
+            if length < MIN_BLOCK_LEN:
+                break
+            offset += length
+        ranges.append((start, size))
+        return ranges
+
+    def _uniform_link(self):
+        if self.linktype is None:
+            raise ValueError(f"{self.path}: interfaces have different link types; use ip_packets() or tcp_packets()")
+        return _link(self.interfaces[0], self.path)
+
+    def tcp_header(self, ts, caplen, wirelen, data_offset):
+        return decode_tcp(self._map, data_offset, caplen, wirelen, ts, self._uniform_link())
+
+    def ip_header(self, caplen, data_offset):
+        return decode_ip(self._map, data_offset, caplen, self._uniform_link())
+
+    def ip_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (ts, caplen, wirelen, data_offset, ip) like PcapReader.ip_packets().
+
+        The loop of _packets() with the decoding inlined: plain IPv4 TCP/UDP
+        packets are decoded with the unpacker their interface compiled when
+        it was declared, as PcapReader.ip_packets() does for a classic
+        capture's single link.
+        """
+        mm, path = self._map, self.path
+        size = len(mm)
+        stop = size if stop is None else min(stop, size)
+        unpack_ports = _ports.unpack_from
+        section, offset = self._start(start)
+        unpack_block = section.enhanced_block.unpack_from
+        last_ts = section.last_ts
+        current = -1
+        while offset + MIN_BLOCK_LEN <= stop:
+            if offset + ENHANCED_HEADER_LEN <= size:
+                btype, length, index, high, low, caplen, wirelen = unpack_block(mm, offset)
+                if btype == ENHANCED_PACKET and length >= 32 and offset + length <= size:
+                    data = offset + ENHANCED_HEADER_LEN
+                    end = data + caplen
+                    if end > offset + length:
+                        raise ValueError(f"{path}: packet block at offset {offset} overruns its length")
+                    offset += length
+                    if index != current:
+                        interface = section.interface(index)
+                        link = interface.link or _link(interface, path)
+                        units, scale, ts_offset = interface.units, interface.scale, interface.offset
+                        type_off, ipv4_tag, unpack_ipv4, net_off = interface.ipv4
+                        min_len = net_off + 20
+                        current = index
+                    sec, frac = divmod(high << 32 | low, units)
+                    last_ts = ts = sec + frac * scale + ts_offset
+                    if caplen >= min_len:
+                        ethertype, vihl, total_len, frag, proto, src, dst = unpack_ipv4(mm, data + type_off)
+                        if ethertype == ipv4_tag and vihl == 0x45 and not frag & 0x1FFF:
+                            l4 = data + min_len
+                            end = min(end, data + net_off + total_len)
+                            if proto == IPPROTO_TCP and l4 + 20 <= end:
+                                sport, dport = unpack_ports(mm, l4)
+                                yield ts, caplen, wirelen, data, (proto, src, dst, sport, dport,
+                                                                 min(l4 + (mm[l4 + 12] >> 4) * 4, end), end)
+                                continue
+                            if proto == IPPROTO_UDP and l4 + 8 <= end:
+                                sport, dport = unpack_ports(mm, l4)
+                                yield ts, caplen, wirelen, data, (proto, src, dst, sport, dport, l4 + 8, end)
+                                continue
+                    yield ts, caplen, wirelen, data, decode_ip(mm, data, caplen, link)
+                    continue
+            section.last_ts = last_ts
+            section, length, packet = self._block(section, offset)
+            if not length:
+                break  # truncated final block
+            if packet is not None:
+                ts, caplen, wirelen, data, interface = packet
+                yield ts, caplen, wirelen, data, decode_ip(mm, data, caplen, interface.link or _link(interface, path))
+            unpack_block = section.enhanced_block.unpack_from
+            last_ts = section.last_ts
+            current = -1
+            offset += length
+
+    def tcp_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        mm, path = self._map, self.path
+        for ts, caplen, wirelen, data, interface in self._packets(start, stop):
+            pkt = decode_tcp(mm, data, caplen, wirelen, ts, interface.link or _link(interface, path))
+            if pkt is not None:
+                yield pkt
+
+
+class PcapngStream(PcapStream):
+    """Sequential pcapng reader for non-seekable streams, e.g. `dumpcap -w -`.
+
+    The blocks up to the first packet are read on construction so that
+    linktype is known (None if the interfaces' link types differ).
+    """
+
+    def __init__(self, fileobj, path='<stream>'):
+        self.path = path
+        self._file = fileobj
+        self._section = None
+        self._pending = None
+        for block in iter(self._next_block, None):
+            packet = self._packet(*block)
+            if packet is not None:
+                self._pending = packet
+                break
+        if self._section is None:
+            raise ValueError(f"{path}: not a pcapng stream")
+        interfaces = self._section.interfaces
+        linktypes = {interface.linktype for interface in interfaces}
+        self.linktype = linktypes.pop() if len(linktypes) == 1 else None
+        self.byte_order = self._section.order
+        self.snaplen = interfaces[0].snaplen if interfaces else 0
+        self.ts_scale = interfaces[0].scale if interfaces else 1e-6
+
+    def _next_block(self):
+        """(type, length, block bytes) of the next block, None at the end of the stream"""
+        head = self._file.read(MIN_BLOCK_LEN)
+        if len(head) < MIN_BLOCK_LEN:
+            return None
+        if self._section is None or head[:4] == PCAPNG_MAGIC:
+            self._section = _Section.parse(head, 0, self.path)
+        btype, length = self._section.header.unpack_from(head, 0)
+        if length < MIN_BLOCK_LEN:
+            raise ValueError(f"{self.path}: corrupt pcapng block length {length}")
+        rest = self._file.read(length - MIN_BLOCK_LEN)
+        if len(rest) < length - MIN_BLOCK_LEN:
+            return None  # stream ended mid-block
+        return btype, length, head + rest
+
+    def _packet(self, btype, length, block):
+        if btype == INTERFACE_DESCRIPTION:
+            self._section.add_interface(block, 0, length)
+            return None
+        packet = self._section.packet(block, 0, btype, length)
+        if packet is None:
+            return None
+        ts, caplen, wirelen, data, interface = packet
+        return ts, caplen, wirelen, block[data:data + caplen], interface
+
+    def _packets(self):
+        if self._pending is not None:
+            packet, self._pending = self._pending, None
+            yield packet
+        for block in iter(self._next_block, None):
+            packet = self._packet(*block)
+            if packet is not None:
+                yield packet
+
+    def records(self):
+        """Yields (timestamp, caplen, wirelen, data) with data as bytes"""
+        for ts, caplen, wirelen, data, interface in self._packets():
+            yield ts, caplen, wirelen, data
+
+    def tcp_packets(self):
+        """Yields a TcpHeader for every TCP segment read from the stream"""
+        path = self.path
+        for ts, caplen, wirelen, data, interface in self._packets():
+            pkt = decode_tcp(data, 0, caplen, wirelen, ts, interface.link or _link(interface, path))
+            if pkt is not None:
+                yield pkt
@@ -0,0 +1,158 @@
+"""Threaded live-capture pipeline: capture -> parse -> aggregate.
+
+The capture thread only reads frames and hands them to the parser through
+a bounded queue; when that queue is full the frame is dropped and counted
+rather than letting the capture fall behind the kernel buffer. The parser
+blocks on the (also bounded) aggregation queue, so a slow aggregator
+pushes back on parsing and, once the first queue fills, shows up as
+capture drops. Aggregation runs on the caller's thread, which also emits
+a snapshot every `interval` seconds.
+
+Frame sources yield (timestamp, frame bytes) or, when frames may be
+truncated, (timestamp, frame bytes, original length) and carry the
+capture's link type; see InterfaceFrames and StreamFrames.
+"""
+import queue
+import threading
+import time
+
+from .reader import LINK_LAYERS, PcapStream, decode_ip
+
+_DONE = object()
+
+
+class PipelineStats:
+    """Counters shared by the pipeline stages."""
+    __slots__ = ('captured', 'dropped', 'parsed', 'handled', 'started')
+
+    def __init__(self):
+        self.captured = 0
+        self.dropped = 0
+        self.parsed = 0
+        self.handled = 0
+        self.started = time.monotonic()
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in ('captured', 'dropped', 'parsed', 'handled')}
+
+
+class CapturePipeline:
+    """Runs a frame source, a parser and an aggregation handler as separate stages.
+
+    parse(ts, frame[, wirelen]) runs on the parser thread and returns an item for
+    handle(item), or None to skip the frame; handle runs on the thread
+    that calls run(). snapshot(stats) is called every interval seconds
+    and once more at the end.
+    """
+
+    def __init__(self, frames, parse, handle, snapshot=None, interval=5.0, queue_size=65536):
+        self.frames = frames
+        self.parse = parse
+        self.handle = handle
+        self.snapshot = snapshot
+        self.interval = interval
+        self.stats = PipelineStats()
+        self._raw = queue.Queue(maxsize=queue_size)
+        self._parsed = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+
+    def _capture(self):
+        put, stats, stop = self._raw.put_nowait, self.stats, self._stop
+        try:
+            for frame in self.frames:
+                if stop.is_set():
+                    break
+                stats.captured += 1
+                try:
+                    put(frame)
+                except queue.Full:
+                    stats.dropped += 1
+        finally:
+            self._raw.put(_DONE)
+
+    def _parse(self):
+        get, put, parse, stats = self._raw.get, self._parsed.put, self.parse, self.stats
+        while True:
+            frame = get()
+            if frame is _DONE:
+                break
+            item = parse(*frame)
+            if item is not None:
+                stats.parsed += 1
+                put(item)
+        put(_DONE)
+
+    def run(self):
+        """Processes frames until the source ends or the run is interrupted; returns the stats"""
+        threads = [threading.Thread(target=self._capture, name="capture", daemon=True),
+                   threading.Thread(target=self._parse, name="parse", daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        get, handle, stats = self._parsed.get, self.handle, self.stats
+        next_snapshot = time.monotonic() + self.interval
+        try:
+            while True:
+                try:
+                    item = get(timeout=0.2)
+                except queue.Empty:
+                    item = None
+                if item is _DONE:
+                    break
+                if item is not None:
+                    handle(item)
+                    stats.handled += 1
+                if self.snapshot and time.monotonic() >= next_snapshot:
+                    self.snapshot(stats)
+                    next_snapshot += self.interval
+        except KeyboardInterrupt:
+            self._stop.set()
+        if self.snapshot:
+            self.snapshot(stats)
+        return stats
+
+    def queue_depths(self):
+        return self._raw.qsize(), self._parsed.qsize()
+
+
+def parse_ip(linktype):
+    """A parse() for CapturePipeline yielding (ts, original length, frame, decode_ip tuple or None)"""
+    link = LINK_LAYERS.get(linktype)
+    if link is None:
+        raise ValueError(f"unsupported link type {linktype}")
+
+    def parse(ts, frame, wirelen=None):
+        return ts, wirelen or len(frame), frame, decode_ip(frame, 0, len(frame), link)
+    return parse
+
+
+class InterfaceFrames:
+    """Raw frames from a live interface through scapy's L2 listen socket (needs root)."""
+
+    def __init__(self, iface=None, bpf_filter=None):
+        from scapy.all import conf, MTU  # scapy is only needed for live capture
+        self._socket = conf.L2listen(iface=iface, filter=bpf_filter)
+        self._mtu = MTU
+        self.linktype = conf.l2types.layer2num[self._socket.LL]
+
+    def __iter__(self):
+        recv = self._socket.recv_raw
+        try:
+            while True:
+                _, frame, ts = recv(self._mtu)
+                if frame is not None:
+                    yield (ts if ts is not None else time.time()), frame
+        finally:
+            self._socket.close()
+
+
+class StreamFrames:
+    """Frames and their original lengths from a pcap stream, e.g. `tcpdump -i eth0 -U -w -` piped to stdin."""
+
+    def __init__(self, fileobj):
+        self._stream = PcapStream(fileobj)
+        self.linktype = self._stream.linktype
+
+    def __iter__(self):
+        for ts, caplen, wirelen, data in self._stream.records():
+            yield ts, data, wirelen
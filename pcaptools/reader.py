@@ -0,0 +1,445 @@
+"""Streaming pcap reader that walks records straight out of a memory map.
+
+Nothing is dissected beyond the headers the analyzers need, and packet
+payloads are never copied: callers get offsets into the map, or a
+memoryview when they really want the bytes.
+
+Ethernet, Linux cooked (SLL and SLL2, e.g. `tcpdump -i any`) and raw IP
+captures are supported; each link type is a fixed pair of header offsets
+looked up once per capture, and the IPv4 fast path in ip_packets() is a
+struct compiled for the capture's link type. pcapng files are read by
+pcapng.PcapngReader and compressed captures by
+compressed.CompressedPcapReader, which PcapReader() returns for them.
+"""
+import mmap
+import struct
+from collections import namedtuple
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+DLT_RAW = 12  # some writers store the DLT_RAW value instead of LINKTYPE_RAW
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+VLAN_TAGS = (0x8100, 0x88A8)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPV6_EXT_HEADERS = (0, 43, 60)  # hop-by-hop, routing, destination options
+
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+TH_PUSH = 0x08
+TH_ACK = 0x10
+TH_URG = 0x20
+
+PCAP_HEADER_LEN = 24
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'  # section header block type, the same in either byte order
+RECORD_HEADER_LEN = 16
+
+# magic -> (byte order, timestamp fraction scale)
+PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+# Offset of the ethertype / protocol field and of the network header. Raw IP
+# links have no such field (None): the IP version nibble tells v4 from v6.
+LINK_LAYERS = {
+    LINKTYPE_ETHERNET: (12, 14),
+    LINKTYPE_LINUX_SLL: (14, 16),
+    LINKTYPE_LINUX_SLL2: (0, 20),
+    LINKTYPE_RAW: (None, 0),
+    DLT_RAW: (None, 0),
+    LINKTYPE_IPV4: (None, 0),
+    LINKTYPE_IPV6: (None, 0),
+}
+_IP_VERSIONS = (None, None, None, None, ETH_P_IP, None, ETH_P_IPV6) + (None,) * 9
+
+_u16 = struct.Struct('!H')
+_ipv4 = struct.Struct('!BxHxxHxB2x4s4s')
+_ipv6 = struct.Struct('!xxxxHBx16s16s')
+_tcp = struct.Struct('!HHIIBBH')
+_ports = struct.Struct('!HH')
+
+TcpHeader = namedtuple('TcpHeader', [
+    'ts', 'wirelen', 'src', 'dst', 'sport', 'dport',
+    'seq', 'ack', 'flags', 'window', 'payload_len', 'wscale',
+])
+TcpHeader.__doc__ = """Decoded TCP/IP header fields of one captured packet.
+
+src/dst are packed 4 or 16 byte addresses, payload_len comes from the IP
+length fields (so it is right even for truncated captures) and wscale is
+the window scale option of a SYN segment, or -1 when absent.
+"""
+
+
+class PcapReader:
+    """Memory-mapped reader for classic libpcap files.
+
+    pcapng files get a PcapngReader and .gz / .xz / .zst compressed
+    captures a (sequential) CompressedPcapReader.
+    """
+
+    def __new__(cls, path, *args, **kwargs):
+        if cls is PcapReader:
+            from .compressed import CompressedPcapReader, is_compressed
+            if is_compressed(path):
+                return object.__new__(CompressedPcapReader)
+            if _is_pcapng(path):
+                from .pcapng import PcapngReader
+                return object.__new__(PcapngReader)
+        return object.__new__(cls)
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: empty capture file")
+
+        try:
+            order, self.ts_scale, self.snaplen, self.linktype = _parse_header(self._map[:PCAP_HEADER_LEN], path)
+        except ValueError:
+            self.close()
+            raise
+        self._record = struct.Struct(order + 'IIII')
+
+    def close(self):
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._map)
+
+    def records(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (timestamp, caplen, wirelen, data_offset) for each record"""
+        mm = self._map
+        unpack = self._record.unpack_from
+        scale = self.ts_scale
+        stop = len(mm) if stop is None else min(stop, len(mm))
+        offset = start
+        while offset + RECORD_HEADER_LEN <= stop:
+            sec, frac, caplen, wirelen = unpack(mm, offset)
+            data = offset + RECORD_HEADER_LEN
+            if data + caplen > len(mm):
+                break  # truncated final record
+            yield sec + frac * scale, caplen, wirelen, data
+            offset = data + caplen
+
+    def records_at(self, offsets):
+        """Like records(), for the records starting at the given byte offsets"""
+        mm = self._map
+        unpack = self._record.unpack_from
+        scale = self.ts_scale
+        for offset in offsets:
+            sec, frac, caplen, wirelen = unpack(mm, offset)
+            yield sec + frac * scale, caplen, wirelen, offset + RECORD_HEADER_LEN
+
+    def split(self, parts):
+        """Splits the records into up to `parts` (start, stop) byte ranges.
+
+        Ranges are record aligned, contiguous and cover the whole file, so
+        each can be handed to records()/tcp_packets() independently.
+        """
+        mm = self._map
+        unpack = self._record.unpack_from
+        size = len(mm)
+        target = max((size - PCAP_HEADER_LEN) // max(parts, 1), 1)
+        ranges = []
+        start = offset = PCAP_HEADER_LEN
+        while offset + RECORD_HEADER_LEN <= size:
+            if offset - start >= target and len(ranges) < parts - 1:
+                ranges.append((start, offset))
+                start = offset
+            offset += RECORD_HEADER_LEN + unpack(mm, offset)[2]
+        ranges.append((start, size))
+        return ranges
+
+    def packet(self, data_offset, caplen):
+        """Returns a zero-copy view of one record's bytes"""
+        return memoryview(self._map)[data_offset:data_offset + caplen]
+
+    def read(self, start, stop):
+        """Copies bytes start..stop of the capture; cheaper than packet() for small slices"""
+        return self._map[start:stop]
+
+    def tcp_header(self, ts, caplen, wirelen, data_offset):
+        """Decodes one record as yielded by records(); None if it is not TCP"""
+        return decode_tcp(self._map, data_offset, caplen, wirelen, ts, LINK_LAYERS[self.linktype])
+
+    def ip_header(self, caplen, data_offset):
+        """decode_ip() of one record as yielded by records(); None if it is not IP"""
+        return decode_ip(self._map, data_offset, caplen, LINK_LAYERS[self.linktype])
+
+    def ip_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields (ts, caplen, wirelen, data_offset, ip) for every record, ip
+        being the decode_ip() tuple or None for non-IP records.
+
+        Plain IPv4 TCP/UDP packets, the bulk of most captures, are decoded
+        inline with a single unpack of the link and IP headers.
+        """
+        mm = self._map
+        unpack = self._record.unpack_from
+        scale = self.ts_scale
+        link = LINK_LAYERS[self.linktype]
+        type_off, ipv4_tag, unpack_ipv4, net_off = _ipv4_unpacker(link)
+        unpack_ports = _ports.unpack_from
+        min_len = net_off + 20
+        stop = len(mm) if stop is None else min(stop, len(mm))
+        offset = start
+        while offset + RECORD_HEADER_LEN <= stop:
+            sec, frac, caplen, wirelen = unpack(mm, offset)
+            data = offset + RECORD_HEADER_LEN
+            if data + caplen > len(mm):
+                break  # truncated final record
+            offset = data + caplen
+            ts = sec + frac * scale
+            if caplen >= min_len:
+                ethertype, vihl, total_len, frag, proto, src, dst = unpack_ipv4(mm, data + type_off)
+                if ethertype == ipv4_tag and vihl == 0x45 and not frag & 0x1FFF:
+                    l4 = data + min_len
+                    end = min(offset, data + net_off + total_len)
+                    if proto == IPPROTO_TCP and l4 + 20 <= end:
+                        sport, dport = unpack_ports(mm, l4)
+                        yield ts, caplen, wirelen, data, (proto, src, dst, sport, dport,
+                                                 min(l4 + (mm[l4 + 12] >> 4) * 4, end), end)
+                        continue
+                    if proto == IPPROTO_UDP and l4 + 8 <= end:
+                        sport, dport = unpack_ports(mm, l4)
+                        yield ts, caplen, wirelen, data, (proto, src, dst, sport, dport, l4 + 8, end)
+                        continue
+            yield ts, caplen, wirelen, data, decode_ip(mm, data, caplen, link)
+
+    def tcp_packets(self, start=PCAP_HEADER_LEN, stop=None):
+        """Yields a TcpHeader for every TCP segment in the capture"""
+        mm = self._map
+        link = LINK_LAYERS[self.linktype]
+        for ts, caplen, wirelen, data in self.records(start, stop):
+            pkt = decode_tcp(mm, data, caplen, wirelen, ts, link)
+            if pkt is not None:
+                yield pkt
+
+
+class PcapStream:
+    """Sequential reader for non-seekable pcap streams, e.g. `tcpdump -U -w -`.
+
+    pcapng streams get a PcapngStream when fileobj can peek() (sys.stdin.buffer can).
+    """
+
+    def __new__(cls, fileobj, path='<stream>'):
+        peek = getattr(fileobj, 'peek', None)
+        if cls is PcapStream and peek is not None and peek(4)[:4] == PCAPNG_MAGIC:
+            from .pcapng import PcapngStream
+            return object.__new__(PcapngStream)
+        return object.__new__(cls)
+
+    def __init__(self, fileobj, path='<stream>'):
+        self.path = path
+        self._file = fileobj
+        header = fileobj.read(PCAP_HEADER_LEN)
+        self.byte_order, self.ts_scale, self.snaplen, self.linktype = _parse_header(header, path)
+        self._record = struct.Struct(self.byte_order + 'IIII')
+
+    def records(self):
+        """Yields (timestamp, caplen, wirelen, data) with data as bytes"""
+        read = self._file.read
+        unpack = self._record.unpack
+        scale = self.ts_scale
+        while True:
+            header = read(RECORD_HEADER_LEN)
+            if len(header) < RECORD_HEADER_LEN:
+                return
+            sec, frac, caplen, wirelen = unpack(header)
+            data = read(caplen)
+            if len(data) < caplen:
+                return  # stream ended mid-record
+            yield sec + frac * scale, caplen, wirelen, data
+
+    def tcp_packets(self):
+        """Yields a TcpHeader for every TCP segment read from the stream"""
+        link = LINK_LAYERS[self.linktype]
+        for ts, caplen, wirelen, data in self.records():
+            pkt = decode_tcp(data, 0, caplen, wirelen, ts, link)
+            if pkt is not None:
+                yield pkt
+
+
+def _is_pcapng(path):
+    with open(path, 'rb') as f:
+        return f.read(4) == PCAPNG_MAGIC
+
+
+def _parse_header(header, path):
+    """(byte order, timestamp scale, snaplen, linktype) of a pcap global header"""
+    magic = bytes(header[:4])
+    if len(header) < PCAP_HEADER_LEN or magic not in PCAP_MAGICS:
+        raise ValueError(f"{path}: not a pcap file")
+    order, ts_scale = PCAP_MAGICS[magic]
+    snaplen, linktype = struct.unpack_from(order + 'II', header, 16)
+    linktype &= 0xFFFF
+    if linktype not in LINK_LAYERS:
+        raise ValueError(f"{path}: unsupported link type {linktype}")
+    return order, ts_scale, snaplen, linktype
+
+
+def decode_tcp(buf, data, caplen, wirelen, ts, link):
+    """Decodes the TCP/IP headers of the record at buf[data:data + caplen].
+
+    link is the (ethertype offset, network header offset) pair of the
+    capture's link type. Returns a TcpHeader, or None for non-TCP records.
+    """
+    end = data + caplen
+    type_off, net_off = link
+    if type_off is None:
+        pos = data + net_off
+        if pos >= end:
+            return None
+        ethertype = _IP_VERSIONS[buf[pos] >> 4]
+    else:
+        pos = data + type_off
+        if pos + 2 > end:
+            return None
+        ethertype = _u16.unpack_from(buf, pos)[0]
+        pos = data + net_off
+        while ethertype in VLAN_TAGS and pos + 4 <= end:
+            ethertype = _u16.unpack_from(buf, pos + 2)[0]
+            pos += 4
+
+    if ethertype == ETH_P_IP:
+        if pos + 20 > end:
+            return None
+        vihl, total_len, frag, proto, src, dst = _ipv4.unpack_from(buf, pos)
+        if proto != IPPROTO_TCP or frag & 0x1FFF:
+            return None
+        ihl = (vihl & 0x0F) * 4
+        l4 = pos + ihl
+        ip_payload = total_len - ihl
+    elif ethertype == ETH_P_IPV6:
+        if pos + 40 > end:
+            return None
+        ip_payload, proto, src, dst = _ipv6.unpack_from(buf, pos)
+        l4 = pos + 40
+        while proto in IPV6_EXT_HEADERS and l4 + 2 <= end:
+            ext_len = (buf[l4 + 1] + 1) * 8
+            proto = buf[l4]
+            l4 += ext_len
+            ip_payload -= ext_len
+        if proto != IPPROTO_TCP:
+            return None
+    else:
+        return None
+
+    if l4 + 20 > end:
+        return None
+    sport, dport, seq, ack, doff, flags, window = _tcp.unpack_from(buf, l4)
+    hdr_len = (doff >> 4) * 4
+    wscale = _window_scale(buf, l4 + 20, min(l4 + hdr_len, end)) if flags & TH_SYN else -1
+    return TcpHeader(ts, wirelen, src, dst, sport, dport, seq, ack, flags,
+                     window, max(ip_payload - hdr_len, 0), wscale)
+
+
+def _ipv4_unpacker(link):
+    """(type_off, ipv4_tag, unpack, net_off) for decoding a link's plain IPv4 packets inline.
+
+    unpack(buf, data + type_off) reads the ethertype and the IPv4 header
+    in one go as (ethertype, vihl, total_len, frag, proto, src, dst); the
+    packet is plain IPv4 if ethertype == ipv4_tag and vihl == 0x45.
+    """
+    type_off, net_off = link
+    if type_off is None:
+        # No ethertype on raw IP links: an empty field stands in for it, vihl == 0x45 checks the version
+        return net_off, b'', struct.Struct('!0sBxHxxHxB2x4s4s').unpack_from, net_off
+    return (type_off, ETH_P_IP, struct.Struct(f'!H{net_off - type_off - 2}xBxHxxHxB2x4s4s').unpack_from,
+            net_off)
+
+
+def decode_ip(buf, data, caplen, link):
+    """Decodes the IP and TCP/UDP headers of the record at buf[data:data + caplen].
+
+    Returns (proto, src, dst, sport, dport, payload, payload_end), or None
+    for non-IP records. Ports are None unless the packet carries a TCP or
+    UDP header (e.g. ICMP, non-first fragments); payload..payload_end is
+    the transport payload (the IP payload for other protocols), clipped to
+    the IP length so link-layer padding is left out.
+    """
+    end = data + caplen
+    type_off, net_off = link
+    if type_off is None:
+        pos = data + net_off
+        if pos >= end:
+            return None
+        ethertype = _IP_VERSIONS[buf[pos] >> 4]
+    else:
+        pos = data + type_off
+        if pos + 2 > end:
+            return None
+        ethertype = _u16.unpack_from(buf, pos)[0]
+        pos = data + net_off
+        while ethertype in VLAN_TAGS and pos + 4 <= end:
+            ethertype = _u16.unpack_from(buf, pos + 2)[0]
+            pos += 4
+
+    if ethertype == ETH_P_IP:
+        if pos + 20 > end:
+            return None
+        vihl, total_len, frag, proto, src, dst = _ipv4.unpack_from(buf, pos)
+        l4 = pos + (vihl & 0x0F) * 4
+        end = min(end, pos + total_len)
+        if frag & 0x1FFF:
+            return proto, src, dst, None, None, l4, end
+    elif ethertype == ETH_P_IPV6:
+        if pos + 40 > end:
+            return None
+        ip_payload, proto, src, dst = _ipv6.unpack_from(buf, pos)
+        l4 = pos + 40
+        end = min(end, l4 + ip_payload)
+        while proto in IPV6_EXT_HEADERS and l4 + 2 <= end:
+            proto = buf[l4]
+            l4 += (buf[l4 + 1] + 1) * 8
+    else:
+        return None
+
+    if proto == IPPROTO_TCP and l4 + 20 <= end:
+        sport, dport = _ports.unpack_from(buf, l4)
+        return proto, src, dst, sport, dport, min(l4 + (buf[l4 + 12] >> 4) * 4, end), end
+    if proto == IPPROTO_UDP and l4 + 8 <= end:
+        sport, dport = _ports.unpack_from(buf, l4)
+        return proto, src, dst, sport, dport, l4 + 8, end
+    return proto, src, dst, None, None, min(l4, end), end
+
+
+def _window_scale(buf, pos, end):
+    """Returns the window scale option value, or -1 if the SYN has none"""
+    while pos < end:
+        kind = buf[pos]
+        if kind == 0:
+            break
+        if kind == 1:
+            pos += 1
+            continue
+        if pos + 1 >= end:
+            break
+        length = buf[pos + 1]
+        if kind == 3 and length == 3 and pos + 2 < end:
+            return buf[pos + 2]
+        if length < 2:
+            break
+        pos += length
+    return -1
@@ -0,0 +1,89 @@
+"""Compact packet records for sniffers that only need to list packets later.
+
+A record is (timestamp, IP protocol, src, dst, sport, dport, length) in
+parallel arrays, about 60 bytes each instead of a whole dissected packet.
+With a cap, a reservoir sample of the packets is kept for display while
+the count and byte total still cover every packet.
+"""
+import random
+from array import array
+from collections import namedtuple
+
+from .timeseries import format_address
+
+PacketRecord = namedtuple('PacketRecord', ['ts', 'proto', 'src', 'dst', 'sport', 'dport', 'length'])
+
+PROTO_NAMES = {1: 'ICMP', 6: 'TCP', 17: 'UDP', 58: 'ICMPv6'}
+_ADDR = 16  # bytes reserved per address; IPv4 addresses use the first 4
+
+
+class PacketRecords:
+    """Array-backed packet records, optionally capped by reservoir sampling."""
+
+    def __init__(self, cap=None, seed=None):
+        self.cap = cap
+        self.count = 0          # packets added, kept or not
+        self.total_bytes = 0
+        self._random = random.Random(seed)
+        self._seq = array('Q')
+        self._ts = array('d')
+        self._proto = array('B')
+        self._width = array('B')
+        self._addrs = bytearray()
+        self._ports = array('H')
+        self._length = array('I')
+
+    def __len__(self):
+        """Number of records kept"""
+        return len(self._seq)
+
+    def add(self, ts, proto, src, dst, sport, dport, length):
+        """Adds one packet; src/dst are packed 4 or 16 byte addresses"""
+        seq = self.count
+        self.count += 1
+        self.total_bytes += length
+        if self.cap is None or seq < self.cap:
+            self._seq.append(seq)
+            self._ts.append(ts)
+            self._proto.append(proto)
+            self._width.append(len(src))
+            self._addrs += src.ljust(_ADDR, b'\0') + dst.ljust(_ADDR, b'\0')
+            self._ports.extend((sport, dport))
+            self._length.append(length)
+            return
+        # Algorithm R: the new packet replaces a random kept one with probability cap/count
+        i = self._random.randrange(self.count)
+        if i >= self.cap:
+            return
+        self._seq[i] = seq
+        self._ts[i] = ts
+        self._proto[i] = proto
+        self._width[i] = len(src)
+        self._addrs[2 * _ADDR * i:2 * _ADDR * (i + 1)] = src.ljust(_ADDR, b'\0') + dst.ljust(_ADDR, b'\0')
+        self._ports[2 * i] = sport
+        self._ports[2 * i + 1] = dport
+        self._length[i] = length
+
+    def __iter__(self):
+        """Kept records in arrival order"""
+        addrs = self._addrs
+        for i in sorted(range(len(self._seq)), key=self._seq.__getitem__):
+            width = self._width[i]
+            base = 2 * _ADDR * i
+            yield PacketRecord(self._ts[i], self._proto[i],
+                               bytes(addrs[base:base + width]),
+                               bytes(addrs[base + _ADDR:base + _ADDR + width]),
+                               self._ports[2 * i], self._ports[2 * i + 1], self._length[i])
+
+    @property
+    def sampled(self):
+        return self.count > len(self)
+
+
+def format_record(record):
+    """One-line summary of a record, similar to scapy's Packet.summary()"""
+    proto = PROTO_NAMES.get(record.proto, f"proto {record.proto}")
+    src, dst = format_address(record.src), format_address(record.dst)
+    if record.proto in (6, 17):
+        src, dst = f"{src}:{record.sport}", f"{dst}:{record.dport}"
+    return f"{record.ts:.6f} {proto} {src} > {dst} len {record.length}"
@@ -0,0 +1,249 @@
+"""Declarative packet classification rules with per-rule counters and flow tables.
+
+A rule names a counter and constrains any of the header fields and the
+payload; a packet matches when every field the rule mentions matches
+(a list of values matches any of them):
+
+    {"name": "ims_dst", "dst": "10.0.137.79", "flows": true}
+    {"name": "port", "port": 4321, "proto": ["tcp", "udp"]}
+    {"name": "lan", "ip": "10.0.0.0/8"}
+    {"name": "login", "proto": "tcp", "dport": 80, "keyword": "password"}
+    {"name": "localhost", "ip": ["127.0.0.1", "::1"], "action": "exclude"}
+
+"ip" and "port" match either direction; src/dst and sport/dport one. The
+rule set is compiled into one lookup table per field mapping a value to
+the bit mask of the rules it satisfies (exact addresses and ports are a
+single dict lookup, CIDR blocks one lookup per distinct prefix length),
+so a packet is classified by AND-ing a handful of masks however many
+rules there are. Payload keywords are only scanned for packets that
+still match a keyword rule after the header fields.
+"""
+import ipaddress
+import json
+from collections import namedtuple
+
+from .keywords import KeywordMatcher
+from .records import PacketRecords
+from .timeseries import format_address
+
+Rule = namedtuple('Rule', ['name', 'label', 'action', 'proto', 'src', 'dst', 'ip',
+                           'sport', 'dport', 'port', 'keyword', 'flows', 'records'],
+                  defaults=(None, 'count', None, None, None, None, None, None, None, None, False, False))
+
+EXCLUDE = 'exclude'
+COUNT = 'count'
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'icmpv6': 58}
+_ADDRESS_FIELDS = ('src', 'dst', 'ip')
+_PORT_FIELDS = ('sport', 'dport', 'port')
+
+
+def _values(value):
+    if value is None:
+        return ()
+    return value if isinstance(value, (list, tuple)) else (value,)
+
+
+def _protocol(value):
+    if isinstance(value, str):
+        try:
+            return PROTOCOLS[value.lower()]
+        except KeyError:
+            raise ValueError(f"unknown protocol {value!r}") from None
+    return int(value)
+
+
+def parse_rule(spec):
+    """A Rule from a dict such as one entry of a rules file"""
+    unknown = set(spec) - set(Rule._fields)
+    if unknown:
+        raise ValueError(f"rule {spec.get('name')!r}: unknown fields {sorted(unknown)}")
+    if not spec.get('name'):
+        raise ValueError(f"rule without a name: {spec}")
+    rule = Rule(**spec)
+    if rule.action not in (COUNT, EXCLUDE):
+        raise ValueError(f"rule {rule.name!r}: action must be {COUNT!r} or {EXCLUDE!r}")
+    return rule._replace(label=rule.label or rule.name)
+
+
+def load_rules(path):
+    """Reads a JSON list of rules"""
+    with open(path) as f:
+        return [parse_rule(spec) for spec in json.load(f)]
+
+
+class _AddressTable:
+    """Address -> rule mask: exact addresses in one dict, CIDR blocks in one dict per prefix length."""
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = {}   # (address width, prefix length) -> {network prefix: mask}
+
+    def add(self, value, bit):
+        network = ipaddress.ip_network(value, strict=False)
+        width = network.max_prefixlen // 8
+        if network.prefixlen == network.max_prefixlen:
+            key = network.network_address.packed
+            self.exact[key] = self.exact.get(key, 0) | bit
+            return
+        table = self.prefixes.setdefault((width, network.prefixlen), {})
+        prefix = int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+        table[prefix] = table.get(prefix, 0) | bit
+
+    def compile(self):
+        """Returns lookup(addr) -> mask, skipping the prefix scan when there are no CIDR blocks"""
+        exact = self.exact
+        if not self.prefixes:
+            return lambda addr: exact.get(addr, 0)
+        by_width = {}
+        for (width, length), table in sorted(self.prefixes.items(), key=lambda item: -item[0][1]):
+            by_width.setdefault(width, []).append((width * 8 - length, table))
+
+        def lookup(addr):
+            mask = exact.get(addr, 0)
+            tables = by_width.get(len(addr))
+            if tables:
+                value = int.from_bytes(addr, 'big')
+                for shift, table in tables:
+                    mask |= table.get(value >> shift, 0)
+            return mask
+        return lookup
+
+
+class RuleSet:
+    """Compiled rules; match() returns the bit mask of the rules a packet satisfies."""
+
+    def __init__(self, rules):
+        self.rules = [parse_rule(rule) if isinstance(rule, dict) else rule for rule in rules]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("rule names must be unique")
+        self.index = {name: i for i, name in enumerate(names)}
+        self.all = (1 << len(self.rules)) - 1
+        self.exclude = 0
+        self.keyword_rules = 0
+
+        protocols = {}
+        ports = {field: {} for field in _PORT_FIELDS}
+        addresses = {field: _AddressTable() for field in _ADDRESS_FIELDS}
+        keywords = {}
+        # wildcard[field]: rules that do not constrain the field
+        wildcard = dict.fromkeys(('proto', *_PORT_FIELDS, *_ADDRESS_FIELDS), 0)
+        for i, rule in enumerate(self.rules):
+            bit = 1 << i
+            if rule.action == EXCLUDE:
+                self.exclude |= bit
+            if rule.proto is None:
+                wildcard['proto'] |= bit
+            for value in _values(rule.proto):
+                proto = _protocol(value)
+                protocols[proto] = protocols.get(proto, 0) | bit
+            for field in _PORT_FIELDS:
+                if getattr(rule, field) is None:
+                    wildcard[field] |= bit
+                for port in _values(getattr(rule, field)):
+                    ports[field][int(port)] = ports[field].get(int(port), 0) | bit
+            for field in _ADDRESS_FIELDS:
+                if getattr(rule, field) is None:
+                    wildcard[field] |= bit
+                for value in _values(getattr(rule, field)):
+                    addresses[field].add(value, bit)
+            if rule.keyword is not None:
+                self.keyword_rules |= bit
+                for keyword in _values(rule.keyword):
+                    keywords[keyword] = keywords.get(keyword, 0) | bit
+
+        self._checks = [check for field, check in self._field_checks(protocols, ports, addresses, wildcard)
+                        if wildcard[field] != self.all]   # fields no rule constrains are skipped
+        self._keywords = keywords
+        self._matcher = KeywordMatcher(list(keywords)) if keywords else None
+
+    @staticmethod
+    def _field_checks(protocols, ports, addresses, wildcard):
+        """(field, check(proto, src, dst, sport, dport) -> mask of the rules the field allows)"""
+        proto_any, sport_any, dport_any, port_any = (wildcard[field] for field in ('proto', *_PORT_FIELDS))
+        src_any, dst_any, ip_any = (wildcard[field] for field in _ADDRESS_FIELDS)
+        sports, dports, either_ports = (ports[field] for field in _PORT_FIELDS)
+        src_lookup, dst_lookup, ip_lookup = (addresses[field].compile() for field in _ADDRESS_FIELDS)
+        return [
+            ('proto', lambda proto, src, dst, sport, dport: protocols.get(proto, 0) | proto_any),
+            ('sport', lambda proto, src, dst, sport, dport: sports.get(sport, 0) | sport_any),
+            ('dport', lambda proto, src, dst, sport, dport: dports.get(dport, 0) | dport_any),
+            ('port', lambda proto, src, dst, sport, dport:
+                either_ports.get(sport, 0) | either_ports.get(dport, 0) | port_any),
+            ('src', lambda proto, src, dst, sport, dport: src_lookup(src) | src_any),
+            ('dst', lambda proto, src, dst, sport, dport: dst_lookup(dst) | dst_any),
+            ('ip', lambda proto, src, dst, sport, dport: ip_lookup(src) | ip_lookup(dst) | ip_any),
+        ]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, proto, src, dst, sport, dport, payload=None):
+        """Mask of the rules matching a packet; src/dst are packed addresses, ports None without TCP/UDP"""
+        mask = self.all
+        for check in self._checks:
+            mask &= check(proto, src, dst, sport, dport)
+            if not mask:
+                return 0
+        if mask & self.keyword_rules:
+            found = self._matcher.scan(payload) if payload else None
+            matched = 0
+            if found is not None:
+                for keyword in found[0]:
+                    matched |= self._keywords[keyword]
+            mask &= matched | ~self.keyword_rules
+        return mask
+
+
+class RuleCounter:
+    """Packets, bytes and (optionally) per-flow packet counts and records of one rule."""
+    __slots__ = ('rule', 'packets', 'bytes', 'flows', 'records')
+
+    def __init__(self, rule, max_records=None):
+        self.rule = rule
+        self.packets = 0
+        self.bytes = 0
+        self.flows = {} if rule.flows else None
+        self.records = PacketRecords(max_records) if rule.records else None
+
+    def format_flows(self):
+        """{"src:sport -> dst:dport": packets} for the flow table"""
+        return {f"{format_address(src)}:{sport} -> {format_address(dst)}:{dport}": count
+                for (src, dst, sport, dport), count in (self.flows or {}).items()}
+
+
+class RuleCounters:
+    """One RuleCounter per rule of a RuleSet, updated from match() masks."""
+
+    def __init__(self, ruleset, max_records=None):
+        self.ruleset = ruleset
+        self.counters = [RuleCounter(rule, max_records) for rule in ruleset.rules]
+
+    def __getitem__(self, name):
+        return self.counters[self.ruleset.index[name]]
+
+    def __contains__(self, name):
+        return name in self.ruleset.index
+
+    def __iter__(self):
+        return iter(self.counters)
+
+    def add(self, mask, ts, proto, src, dst, sport, dport, length):
+        """Counts a packet for every rule in mask; flows need TCP/UDP ports"""
+        counters = self.counters
+        while mask:
+            low = mask & -mask
+            counter = counters[low.bit_length() - 1]
+            mask ^= low
+            counter.packets += 1
+            counter.bytes += length
+            if counter.flows is not None and sport is not None:
+                key = (src, dst, sport, dport)
+                counter.flows[key] = counter.flows.get(key, 0) + 1
+            if counter.records is not None:
+                counter.records.add(ts, proto, src, dst, sport or 0, dport or 0, length)
+
+    def as_dict(self):
+        return {counter.rule.name: {'packets': counter.packets, 'bytes': counter.bytes,
+                                    **({'flows': counter.format_flows()} if counter.flows is not None else {})}
+                for counter in self.counters}
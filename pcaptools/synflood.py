@@ -0,0 +1,259 @@
+"""Streaming SYN-flood detector with automatic attack start/end detection.
+
+Usage:
+    python3 -m pcaptools.synflood syn_attack.pcap
+    sudo tcpdump -i eth0 -U -w - tcp | python3 -m pcaptools.synflood -
+
+Packets are folded into fixed-width time buckets; the last few buckets
+form a sliding window with the SYN (connection attempt) rate, the ratio of
+attempts to completed handshakes, the half-open connection count and a HyperLogLog estimate of distinct SYN sources
+(fan-in). A window is anomalous when the SYN rate jumps well above its
+learned baseline and SYNs go unanswered or pile up half-open; `hold`
+anomalous buckets in a row raise an attack start alert. Ending has
+hysteresis: the SYN rate must stay below `end_fraction` of the start
+threshold for `end_hold` buckets, so a slow or bursty flood is reported
+as one attack rather than flapping at the threshold, and the baseline
+stays frozen until the end is confirmed. Memory is bounded by the window
+length and the half-open cap.
+"""
+import argparse
+import math
+import sys
+from collections import OrderedDict, deque, namedtuple
+
+from .reader import PcapReader, PcapStream, TH_SYN, TH_ACK, TH_RST
+
+Alert = namedtuple('Alert', ['kind', 'ts', 'syn_rate', 'syn_ratio', 'half_open', 'fan_in'])
+
+
+class HyperLogLog:
+    """Distinct-count sketch over hashable items (addresses as bytes)."""
+    __slots__ = ('p', 'registers')
+
+    def __init__(self, p=10):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, item):
+        h = hash(item) & 0xFFFFFFFFFFFFFFFF
+        rest_bits = 64 - self.p
+        rest = h & ((1 << rest_bits) - 1)
+        rank = rest_bits - rest.bit_length() + 1
+        index = h >> rest_bits
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class _Bucket:
+    __slots__ = ('start', 'syn', 'completed', 'sources')
+
+    def __init__(self, start, p):
+        self.start = start
+        self.syn = 0
+        self.completed = 0
+        self.sources = HyperLogLog(p)
+
+
+class SynFloodDetector:
+    """Sliding-window SYN-flood detector fed one TCP packet at a time."""
+
+    def __init__(self, bucket=1.0, window=3, hold=2, end_hold=5, rate_factor=5.0, min_syn_rate=1.0,
+                 end_fraction=0.5, ratio_threshold=3.0, half_open_threshold=64, half_open_timeout=30.0,
+                 max_half_open=65536, baseline_alpha=0.1, sketch_precision=10):
+        self.bucket = bucket
+        self.hold = hold
+        self.end_hold = end_hold
+        self.end_fraction = end_fraction
+        self.rate_factor = rate_factor
+        self.min_syn_rate = min_syn_rate
+        self.ratio_threshold = ratio_threshold
+        self.half_open_threshold = half_open_threshold
+        self.half_open_timeout = half_open_timeout
+        self.max_half_open = max_half_open
+        self.baseline_alpha = baseline_alpha
+        self.sketch_precision = sketch_precision
+
+        self.window = deque(maxlen=window)
+        self.current = None
+        self.half_open = OrderedDict()  # (client, cport, server, sport) -> SYN time
+        self.baseline = None
+        self.in_attack = False
+        self.streak = 0
+        self.streak_start = None
+        self.attack_start = None
+        self.first_ts = None
+        self.last_ts = None
+        self.stats = None
+
+    def update(self, ts, flags, src, dst, sport, dport):
+        """Feeds one TCP packet; returns the alerts it completed (usually none)"""
+        alerts = []
+        if self.current is None:
+            self.first_ts = ts
+            self.current = _Bucket(ts, self.sketch_precision)
+        while ts >= self.current.start + self.bucket:
+            alerts.extend(self._close_bucket())
+        self.last_ts = ts
+
+        bucket = self.current
+        if flags & TH_SYN:
+            if flags & TH_ACK:
+                # A SYN-ACK also opens the attempt when its SYN was not captured
+                key = (dst, dport, src, sport)
+                if key in self.half_open:
+                    return alerts
+                src = dst
+            else:
+                key = (src, sport, dst, dport)
+            bucket.syn += 1
+            bucket.sources.add(src)
+            self.half_open[key] = ts
+            self.half_open.move_to_end(key)
+            if len(self.half_open) > self.max_half_open:
+                self.half_open.popitem(last=False)
+        elif flags & (TH_ACK | TH_RST) and self.half_open:
+            # The client's ACK completes the handshake; a reset from either side aborts it
+            if self.half_open.pop((src, sport, dst, dport), None) is not None:
+                if not flags & TH_RST:
+                    bucket.completed += 1
+            elif flags & TH_RST:
+                self.half_open.pop((dst, dport, src, sport), None)
+        return alerts
+
+    def finish(self):
+        """Closes the last bucket and any attack still in progress"""
+        alerts = []
+        if self.current is not None:
+            alerts.extend(self._close_bucket())
+        if self.in_attack:
+            self.in_attack = False
+            alerts.append(self._alert('attack_end', self.last_ts))
+        return alerts
+
+    def _close_bucket(self):
+        closed = self.current
+        self.window.append(closed)
+        self.current = _Bucket(closed.start + self.bucket, self.sketch_precision)
+
+        now = self.current.start
+        while self.half_open:
+            key, started = next(iter(self.half_open.items()))
+            if now - started < self.half_open_timeout:
+                break
+            self.half_open.popitem(last=False)
+
+        syn = sum(b.syn for b in self.window)
+        completed = sum(b.completed for b in self.window)
+        sources = HyperLogLog(self.sketch_precision)
+        for b in self.window:
+            sources.merge(b.sources)
+        rate = syn / (len(self.window) * self.bucket)
+        self.stats = {
+            'syn_rate': rate,
+            'syn_ratio': syn / max(completed, 1),
+            'half_open': len(self.half_open),
+            'fan_in': sources.count(),
+        }
+
+        # The baseline is frozen during an attack, so the end threshold cannot drift up with it
+        threshold = max(self.min_syn_rate, self.rate_factor * (self.baseline or 0.0))
+        if self.in_attack:
+            anomalous = rate >= self.end_fraction * threshold
+        else:
+            anomalous = (rate >= threshold
+                         and (self.stats['syn_ratio'] >= self.ratio_threshold
+                              or self.stats['half_open'] >= self.half_open_threshold))
+            if not anomalous:
+                self.baseline = rate if self.baseline is None else (
+                    self.baseline + self.baseline_alpha * (rate - self.baseline))
+
+        # Count buckets that disagree with the current state
+        if anomalous != self.in_attack:
+            if self.streak == 0:
+                self.streak_start = closed.start
+            self.streak += 1
+        else:
+            self.streak = 0
+        if self.streak < (self.end_hold if self.in_attack else self.hold):
+            return []
+        if anomalous:
+            self.attack_start = self.streak_start
+        self.streak = 0
+        self.in_attack = anomalous
+        if anomalous:
+            return [self._alert('attack_start', self.streak_start)]
+        # The first calm window still overlapped the attack's last buckets
+        end = max(self.streak_start - (len(self.window) - 1) * self.bucket, self.attack_start)
+        return [self._alert('attack_end', end)]
+
+    def _alert(self, kind, ts):
+        stats = self.stats or {'syn_rate': 0.0, 'syn_ratio': 0.0, 'half_open': 0, 'fan_in': 0}
+        return Alert(kind, ts, stats['syn_rate'], stats['syn_ratio'], stats['half_open'], stats['fan_in'])
+
+
+def detect(packets, detector=None):
+    """Runs a detector over TcpHeaders and yields alerts as soon as they fire"""
+    detector = detector or SynFloodDetector()
+    update = detector.update
+    for pkt in packets:
+        yield from update(pkt.ts, pkt.flags, pkt.src, pkt.dst, pkt.sport, pkt.dport)
+    yield from detector.finish()
+
+
+def attack_windows(alerts):
+    """Pairs start/end alerts into (start, end) timestamps"""
+    windows = []
+    start = None
+    for alert in alerts:
+        if alert.kind == 'attack_start':
+            start = alert.ts
+        elif start is not None:
+            windows.append((start, alert.ts))
+            start = None
+    return windows
+
+
+def format_alert(alert, origin=0.0):
+    return (f"[{alert.ts - origin:9.3f}s] {alert.kind.replace('_', ' ').upper()}: "
+            f"SYN rate {alert.syn_rate:.1f}/s, SYN/handshake {alert.syn_ratio:.1f}, "
+            f"half-open {alert.half_open}, distinct sources ~{alert.fan_in}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect SYN floods in a capture or a live pcap stream")
+    parser.add_argument("pcap", help="Capture file, or - to read a pcap stream from stdin")
+    parser.add_argument("-b", "--bucket", type=float, default=1.0, help="Bucket width in seconds")
+    parser.add_argument("-w", "--window", type=int, default=3, help="Buckets per sliding window")
+    parser.add_argument("-r", "--min-rate", type=float, default=1.0,
+                        help="Lowest SYN rate (per second) that can count as an attack, whatever the baseline")
+    parser.add_argument("--end-hold", type=int, default=5, help="Calm buckets in a row that end an attack")
+    args = parser.parse_args()
+
+    detector = SynFloodDetector(bucket=args.bucket, window=args.window, end_hold=args.end_hold,
+                                min_syn_rate=args.min_rate)
+    if args.pcap == "-":
+        reader = PcapStream(sys.stdin.buffer)
+    else:
+        reader = PcapReader(args.pcap)
+
+    alerts = []
+    for alert in detect(reader.tcp_packets(), detector):
+        alerts.append(alert)
+        print(format_alert(alert, detector.first_ts), flush=True)
+    if not alerts:
+        print("No SYN flood detected")
+
+
+if __name__ == '__main__':
+    main()
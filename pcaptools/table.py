@@ -0,0 +1,356 @@
+"""Columnar packet table: one NumPy structured array row per TCP segment.
+
+A capture is decoded once into the table and every metric after that is a
+vectorized reduction over its columns. Addresses and 4-tuples are
+dictionary encoded, so a row only costs a few dozen bytes.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from .intervals import HOLE_HORIZON
+from .reader import PcapReader, PCAP_HEADER_LEN, TH_SYN, TH_FIN, TH_RST, TH_ACK
+from .tcp_tracker import OUT_OF_ORDER_THRESHOLD
+
+PACKET_DTYPE = np.dtype([
+    ('ts', np.float64),
+    ('wirelen', np.uint32),
+    ('src', np.uint32),        # index into PacketTable.addresses
+    ('dst', np.uint32),
+    ('sport', np.uint16),
+    ('dport', np.uint16),
+    ('seq', np.uint32),
+    ('ack', np.uint32),
+    ('flags', np.uint8),
+    ('window', np.uint16),
+    ('payload_len', np.uint16),
+    ('wscale', np.int8),
+    ('flow', np.uint32),       # index into PacketTable.flows
+])
+
+SEQ_MOD = 1 << 32
+
+TrackerColumns = namedtuple('TrackerColumns', [
+    'order', 'first', 'rel', 'expected',           # as sequence_state()
+    'flow', 'seq', 'ack', 'window', 'ts', 'seglen', 'rst',
+    'flow_start',   # position of the row's flow's first row
+    'last_ack',     # position of the last ACK row so far, possibly of an earlier flow
+    'prev_ack',     # position of the flow's ACK row before this one, -1 if none
+    'dup',          # duplicate ACK
+    'reset',        # ACK row changing the flow's ACK number
+    'dup_run',      # duplicate ACKs since the flow's first row, first ACK row or last reset
+    'retrans',      # starts below the expected sequence number: a retransmission event
+    'last_advance', # position of the flow's last row that advanced the expected sequence number
+])
+
+
+class PacketTable:
+    """TCP packets of one capture stored column-wise."""
+
+    def __init__(self, packets, addresses, flows):
+        self.packets = packets
+        self.addresses = addresses
+        self.flows = flows
+        index = {flow: i for i, flow in enumerate(flows)}
+        self.peers = np.array([index.get((dst, src, dport, sport), -1)
+                               for src, dst, sport, dport in flows], dtype=np.int64)
+        self._sequence = None
+
+    @classmethod
+    def from_pcap(cls, pcap_file, start=PCAP_HEADER_LEN, stop=None):
+        """Decodes the TCP packets of pcap_file (or of one byte range of it)"""
+        with PcapReader(pcap_file) as reader:
+            return cls.from_packets(reader.tcp_packets(start, stop))
+
+    @classmethod
+    def from_packets(cls, tcp_packets):
+        """Builds the table from TcpHeaders in capture order, e.g. a merge of several captures"""
+        addresses = {}
+        flows = {}
+
+        def rows():
+            for pkt in tcp_packets:
+                key = (pkt.src, pkt.dst, pkt.sport, pkt.dport)
+                flow = flows.get(key)
+                if flow is None:
+                    flow = flows[key] = len(flows)
+                yield (pkt.ts, pkt.wirelen,
+                       addresses.setdefault(pkt.src, len(addresses)),
+                       addresses.setdefault(pkt.dst, len(addresses)),
+                       pkt.sport, pkt.dport, pkt.seq, pkt.ack, pkt.flags,
+                       pkt.window, pkt.payload_len, pkt.wscale, flow)
+
+        packets = np.fromiter(rows(), dtype=PACKET_DTYPE)
+        return cls(packets, list(addresses), list(flows))
+
+    def __len__(self):
+        return len(self.packets)
+
+    def total_bytes(self):
+        return int(self.packets['wirelen'].sum(dtype=np.int64))
+
+    def duration(self):
+        ts = self.packets['ts']
+        return float(ts[-1] - ts[0]) if len(ts) else 0.0
+
+    def scaled_windows(self):
+        """Calculated window of every packet, as tshark reports tcp.window_size.
+
+        A direction's window is scaled by the shift from its own SYN once
+        SYNs from both directions have been seen; SYN segments are never scaled.
+        """
+        p = self.packets
+        n = len(p)
+        flow = p['flow'].astype(np.int64)
+        is_syn = (p['flags'] & TH_SYN) != 0
+        syn_rows = np.flatnonzero(is_syn)
+
+        first_syn = np.full(len(self.flows) + 1, n, dtype=np.int64)  # last slot: no peer
+        np.minimum.at(first_syn, flow[syn_rows], syn_rows)
+        shift = np.full(len(self.flows) + 1, -1, dtype=np.int64)
+        shift[flow[syn_rows][::-1]] = p['wscale'][syn_rows][::-1]
+
+        peer = self.peers[flow]
+        peer[peer < 0] = len(self.flows)
+        rows = np.arange(n)
+        scaled = (~is_syn & (first_syn[flow] < rows) & (first_syn[peer] < rows)
+                  & (shift[flow] > 0) & (shift[peer] >= 0))
+
+        windows = p['window'].astype(np.int64)
+        windows[scaled] <<= shift[flow][scaled]
+        return windows
+
+    def sequence_state(self):
+        """Per-flow unwrapped sequence numbers, in flow-sorted row order.
+
+        Returns (order, first, rel, expected): `order` sorts the rows by flow
+        (stable in time), `first` marks each flow's first row, `rel` is the
+        unwrapped sequence number relative to that first row and `expected`
+        is the running maximum of earlier segment ends in the same flow
+        (meaningless on first rows). Computed once per table; the arrays
+        are shared, so callers must not modify them.
+        """
+        if self._sequence is None:
+            self._sequence = self._sequence_state()
+        return self._sequence
+
+    def _sequence_state(self):
+        p = self.packets
+        n = len(p)
+        order = np.argsort(p['flow'], kind='stable')
+        flow = p['flow'][order]
+        flags = p['flags'][order]
+        seq = p['seq'][order].astype(np.int64)
+
+        first = np.ones(n, dtype=bool)
+        first[1:] = flow[1:] != flow[:-1]
+        step = np.zeros(n, dtype=np.int64)
+        step[1:] = (seq[1:] - seq[:-1] + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+        step[first] = 0
+        start = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+        cum = np.cumsum(step)
+        rel = cum - cum[start]
+
+        seg_end = rel + p['payload_len'][order] + ((flags & (TH_SYN | TH_FIN)) != 0)
+        # Lift every flow above the previous one so one accumulate covers all flows
+        span = int(seg_end.max() - rel.min()) + 1 if n else 1
+        base = np.cumsum(first) * span
+        expected = np.empty(n, dtype=np.int64)
+        expected[1:] = np.maximum.accumulate(seg_end + base)[:-1]
+        expected -= base
+        return order, first, rel, expected
+
+    def lost_segments(self):
+        """Mask of segments that start beyond the next expected sequence number.
+
+        Mirrors tshark's tcp.analysis.lost_segment: sequence numbers are
+        unwrapped per flow and compared against the running maximum of the
+        segment ends seen so far in that flow, the same rule TcpTracker
+        applies packet by packet.
+        """
+        order, first, rel, expected = self.sequence_state()
+        rst = (self.packets['flags'][order] & TH_RST) != 0
+        lost = np.empty(len(order), dtype=bool)
+        lost[order] = ~first & ~rst & (rel > expected)
+        return lost
+
+    def tracker_columns(self):
+        """TcpTracker's per-row state as flow-sorted columns (see TrackerColumns).
+
+        Pure ACKs repeating the flow's previous ACK and window are
+        duplicates; any other change of the ACK number ends the run of
+        duplicates, and so does the flow's first ACK, which has nothing
+        to repeat.
+        """
+        p = self.packets
+        n = len(p)
+        order, first, rel, expected = self.sequence_state()
+        flow = p['flow'][order].astype(np.int64)
+        flags = p['flags'][order]
+        seq = p['seq'][order]
+        ack = p['ack'][order]
+        window = p['window'][order]
+        seglen = p['payload_len'][order] + ((flags & (TH_SYN | TH_FIN)) != 0)
+        seg_end = rel + seglen
+        rst = (flags & TH_RST) != 0
+        rows = np.arange(n)
+        flow_start = np.maximum.accumulate(np.where(first, rows, 0))
+
+        is_ack = (flags & TH_ACK) != 0
+        last_ack = np.maximum.accumulate(np.where(is_ack, rows, -1))
+        prev_ack = np.empty(n, dtype=np.int64)
+        prev_ack[1:] = last_ack[:-1]
+        prev_ack[0] = -1
+        prev_ack[prev_ack < flow_start] = -1
+        same_ack = (prev_ack >= 0) & (ack == ack[prev_ack])
+        same_window = np.zeros(n, dtype=bool)
+        same_window[1:] = window[1:] == window[:-1]
+        dup = is_ack & same_ack & same_window & ~first & (seglen == 0) & ~rst
+        reset = is_ack & (prev_ack >= 0) & ~same_ack
+        dups = np.cumsum(dup)
+        run_start = np.maximum.accumulate(np.where(first | (is_ack & ~same_ack), rows, 0))
+        dup_run = dups - dups[run_start]
+
+        retrans = (~first & ~rst & (seglen > 0) & (rel < expected)
+                   & ~((seglen == 1) & (seg_end == expected)))
+        advancing = first | (seg_end > expected)
+        return TrackerColumns(
+            order, first, rel, expected, flow, seq, ack, window, p['ts'][order], seglen, rst,
+            flow_start, last_ack, prev_ack, dup, reset, dup_run, retrans,
+            np.maximum.accumulate(np.where(advancing, rows, 0)))
+
+    def peer_rows(self, columns, rows):
+        """Position of the peer flow's last row before each of `rows`, -1 if none"""
+        n = len(columns.order)
+        peer = self.peers[columns.flow[rows]]
+        key = columns.flow * n + columns.order
+        pos = np.searchsorted(key, peer * n + columns.order[rows]) - 1
+        pos[peer < 0] = -1
+        pos[columns.flow[pos] != peer] = -1
+        return pos
+
+    def events(self, ooo_threshold=OUT_OF_ORDER_THRESHOLD):
+        """Retransmission / out-of-order / duplicate ACK totals, as TcpTracker.events() counts them.
+
+        TcpTracker's per-packet rules evaluated on the flow-sorted columns:
+        a data segment starting below the next expected sequence number is
+        a fast retransmission if the peer's last ACK asked for it with >= 2
+        duplicate ACKs, out-of-order if it follows the last advancing
+        segment within ooo_threshold seconds, a retransmission otherwise.
+        """
+        c = self.tracker_columns()
+        retrans = np.flatnonzero(c.retrans)
+
+        # The peer's state after its last row before each retransmission
+        pos = self.peer_rows(c, retrans)
+        peer_ack = c.last_ack[pos]
+        peer_acked = (pos >= 0) & (peer_ack >= c.flow_start[pos])
+        fast = (peer_acked & (c.dup_run[pos] >= 2)
+                & (c.ack[peer_ack] == c.seq[retrans]))
+
+        out_of_order = (~fast & (c.ts[retrans] - c.ts[c.last_advance[retrans - 1]] < ooo_threshold)
+                        & (c.seq[retrans] != c.seq[retrans - 1]))
+
+        fast_count = int(np.count_nonzero(fast))
+        ooo_count = int(np.count_nonzero(out_of_order))
+        return {
+            'retransmissions': len(retrans) - ooo_count,
+            'fast_retransmissions': fast_count,
+            'out_of_order': ooo_count,
+            'duplicate_acks': int(np.count_nonzero(c.dup)),
+        }
+
+    def payload_ranges(self):
+        """Unwrapped payload byte ranges [start, end) of every data segment.
+
+        Returns (flow, start, end) arrays; positions are relative to the
+        first sequence number seen in each flow.
+        """
+        order, first, rel, expected = self.sequence_state()
+        p = self.packets
+        start = rel + ((p['flags'][order] & TH_SYN) != 0)
+        end = start + p['payload_len'][order]
+        keep = end > start
+        return p['flow'][order][keep], start[keep], end[keep]
+
+    def delivered(self):
+        """(unique bytes, filled holes, filled bytes) of the payload of all flows.
+
+        Unique bytes count every payload byte once, plus the stale holes
+        IntervalSet would have filled (see stale_holes()).
+        """
+        flow, start, end = merge_ranges(*self.payload_ranges())
+        holes, filled = stale_holes(flow, start, end)
+        return int((end - start).sum()) + filled, holes, filled
+
+    def unique_payload_bytes(self):
+        """Payload bytes delivered by all flows, each byte counted once"""
+        return self.delivered()[0]
+
+    def metrics(self):
+        """Throughput, goodput, loss rate and max window of the whole table"""
+        unique_bytes, filled_holes, filled_bytes = self.delivered()
+        return summarize(len(self), self.total_bytes(), unique_bytes,
+                         int(self.lost_segments().sum()), self.duration(),
+                         int(self.scaled_windows().max()) if len(self) else 0, filled_holes, filled_bytes)
+
+
+def merge_ranges(flow, start, end):
+    """Merges overlapping or touching ranges of the same flow.
+
+    Returns (flow, start, end) of the disjoint ranges, sorted by flow and start.
+    """
+    if len(flow) == 0:
+        return flow, start, end
+    order = np.lexsort((start, flow))
+    flow, start, end = flow[order], start[order], end[order]
+
+    new_flow = np.ones(len(flow), dtype=bool)
+    new_flow[1:] = flow[1:] != flow[:-1]
+    span = int(end.max() - start.min()) + 1
+    base = np.cumsum(new_flow) * span
+    reach = np.maximum.accumulate(end + base) - base
+    opens = new_flow.copy()
+    opens[1:] |= start[1:] > reach[:-1]
+
+    heads = np.flatnonzero(opens)
+    return flow[heads], start[heads], np.maximum.reduceat(end, heads)
+
+
+def stale_holes(flow, start, end, horizon=HOLE_HORIZON):
+    """(count, bytes) of the holes between merge_ranges() output that IntervalSet fills.
+
+    Those are the holes ending more than `horizon` bytes below the end of
+    their flow's last range.
+    """
+    if len(flow) < 2:
+        return 0, 0
+    last = np.r_[np.flatnonzero(flow[1:] != flow[:-1]), len(flow) - 1]
+    top = np.repeat(end[last], np.diff(np.r_[-1, last]))
+    stale = (flow[1:] == flow[:-1]) & (start[1:] < top[1:] - horizon)
+    return int(np.count_nonzero(stale)), int((start[1:] - end[:-1])[stale].sum())
+
+
+def summarize(packet_count, total_bytes, unique_bytes, lost_packets, duration, max_window_size,
+              filled_holes=0, filled_bytes=0):
+    """Turns raw per-capture totals into the metrics dict the analyzers print"""
+    if duration > 0:
+        throughput = (total_bytes * 8) / (duration * 1000000)  # Mbps
+        goodput = (unique_bytes * 8) / (duration * 1000000)  # Mbps
+    else:
+        throughput = 0
+        goodput = 0
+
+    return {
+        'packets': packet_count,
+        'bytes': total_bytes,
+        'unique_bytes': unique_bytes,
+        'lost_packets': lost_packets,
+        'duration': duration,
+        'throughput': throughput,
+        'goodput': goodput,
+        'loss_rate': (lost_packets / packet_count) * 100 if packet_count else 0,
+        'max_window_size': max_window_size,
+        'filled_holes': filled_holes,  # uncaptured holes counted in unique_bytes (see IntervalSet)
+        'filled_bytes': filled_bytes,
+    }
@@ -0,0 +1,169 @@
+"""Per-flow TCP sequence tracker (native replacement for tshark's tcp.analysis).
+
+Every direction of a connection, keyed on its 4-tuple, keeps a handful of
+slotted fields and each packet is classified with O(1) work:
+
+- lost segment: starts beyond the next expected sequence number
+- retransmission: carries sequence space that was already seen
+- fast retransmission: a retransmission answering >= 2 duplicate ACKs
+- out-of-order: a retransmission arriving shortly after newer data
+- duplicate ACK: a pure ACK repeating the previous ACK and window
+
+Payload ranges are also collected in an IntervalSet per direction, so
+unique_bytes is the flow's goodput in bytes with retransmissions counted once.
+"""
+from .cache import cached_analysis
+from .capture import capture_parts
+from .intervals import IntervalSet
+from .reader import PcapReader, TH_SYN, TH_FIN, TH_RST, TH_ACK
+
+SEQ_MOD = 1 << 32
+
+# Matches tshark's default out-of-order threshold when no RTT is known
+OUT_OF_ORDER_THRESHOLD = 0.003  # seconds
+
+LOST_SEGMENT = 0x01
+RETRANSMISSION = 0x02
+FAST_RETRANSMISSION = 0x04
+OUT_OF_ORDER = 0x08
+DUPLICATE_ACK = 0x10
+
+EVENT_COUNTERS = ('retransmissions', 'fast_retransmissions', 'out_of_order', 'duplicate_acks')
+
+EVENT_NAMES = {
+    LOST_SEGMENT: 'lost_segments',
+    RETRANSMISSION: 'retransmissions',
+    FAST_RETRANSMISSION: 'fast_retransmissions',
+    OUT_OF_ORDER: 'out_of_order',
+    DUPLICATE_ACK: 'duplicate_acks',
+}
+
+
+def seq_after(a, b):
+    """True if sequence number a is strictly after b (mod 2^32)"""
+    return 0 < (a - b) % SEQ_MOD < SEQ_MOD // 2
+
+
+class FlowState:
+    """Sequence state and event counters of one direction of a connection."""
+    __slots__ = ('next_seq', 'last_seq', 'seq_pos', 'advance_ts', 'last_ack', 'last_window',
+                 'dup_acks', 'delivered', 'packets', 'bytes', 'unique_bytes', 'lost_segments', 'retransmissions',
+                 'fast_retransmissions', 'out_of_order', 'duplicate_acks')
+
+    def __init__(self):
+        self.next_seq = None
+        self.last_seq = None
+        self.seq_pos = 0
+        self.advance_ts = 0.0
+        self.last_ack = None
+        self.last_window = None
+        self.dup_acks = 0
+        self.delivered = None
+        self.packets = 0
+        self.bytes = 0
+        self.unique_bytes = 0
+        self.lost_segments = 0
+        self.retransmissions = 0
+        self.fast_retransmissions = 0
+        self.out_of_order = 0
+        self.duplicate_acks = 0
+
+    def counters(self):
+        return {name: getattr(self, name) for name in
+                ('packets', 'bytes', 'unique_bytes') + tuple(EVENT_NAMES.values())}
+
+
+class TcpTracker:
+    """Classifies TCP segments against per-flow state, one packet at a time."""
+
+    def __init__(self, ooo_threshold=OUT_OF_ORDER_THRESHOLD):
+        self.ooo_threshold = ooo_threshold
+        self.flows = {}
+
+    def update(self, pkt):
+        """Feeds one TcpHeader and returns its bitmask of analysis events"""
+        key = (pkt.src, pkt.dst, pkt.sport, pkt.dport)
+        state = self.flows.get(key)
+        if state is None:
+            state = self.flows[key] = FlowState()
+        peer = self.flows.get((pkt.dst, pkt.src, pkt.dport, pkt.sport))
+
+        flags = pkt.flags
+        seq = pkt.seq
+        seglen = pkt.payload_len + (1 if flags & (TH_SYN | TH_FIN) else 0)
+        seg_end = (seq + seglen) % SEQ_MOD
+        state.packets += 1
+        state.bytes += pkt.wirelen
+        events = 0
+
+        expected = state.next_seq
+        if expected is not None and not flags & TH_RST:
+            if seq_after(seq, expected):
+                events = LOST_SEGMENT
+                state.lost_segments += 1
+            elif seglen and seq_after(expected, seq) and not (seglen == 1 and seg_end == expected):
+                if peer is not None and peer.dup_acks >= 2 and peer.last_ack == seq:
+                    events = RETRANSMISSION | FAST_RETRANSMISSION
+                    state.fast_retransmissions += 1
+                elif pkt.ts - state.advance_ts < self.ooo_threshold and seq != state.last_seq:
+                    events = OUT_OF_ORDER
+                    state.out_of_order += 1
+                else:
+                    events = RETRANSMISSION
+                if events & RETRANSMISSION:
+                    state.retransmissions += 1
+
+        if flags & TH_ACK:
+            if (seglen == 0 and not flags & TH_RST and pkt.ack == state.last_ack
+                    and pkt.window == state.last_window):
+                events |= DUPLICATE_ACK
+                state.dup_acks += 1
+                state.duplicate_acks += 1
+            elif pkt.ack != state.last_ack:
+                state.dup_acks = 0
+            state.last_ack = pkt.ack
+        state.last_window = pkt.window
+
+        if state.last_seq is not None:
+            state.seq_pos += (seq - state.last_seq + SEQ_MOD // 2) % SEQ_MOD - SEQ_MOD // 2
+        if pkt.payload_len:
+            if state.delivered is None:
+                state.delivered = IntervalSet()
+            start = state.seq_pos + (1 if flags & TH_SYN else 0)
+            state.unique_bytes += state.delivered.add(start, start + pkt.payload_len)
+
+        if expected is None or seq_after(seg_end, expected):
+            state.next_seq = seg_end
+            state.advance_ts = pkt.ts
+        state.last_seq = seq
+        return events
+
+    def totals(self):
+        """Counters summed over every flow"""
+        totals = dict.fromkeys(FlowState().counters(), 0)
+        for state in self.flows.values():
+            for name, value in state.counters().items():
+                totals[name] += value
+        return totals
+
+    def events(self):
+        """The retransmission / out-of-order / duplicate ACK totals the analyzers print"""
+        totals = self.totals()
+        return {name: totals[name] for name in EVENT_COUNTERS}
+
+
+def track_pcap(pcap_file, ooo_threshold=OUT_OF_ORDER_THRESHOLD):
+    """Runs a TcpTracker over every TCP segment of pcap_file"""
+    tracker = TcpTracker(ooo_threshold)
+    update = tracker.update
+    for part in capture_parts(pcap_file):
+        with PcapReader(part) as reader:
+            for pkt in reader.tcp_packets():
+                update(pkt)
+    return tracker
+
+
+@cached_analysis('tcp_events', version=1)
+def event_counts(pcap_file):
+    """Retransmission / out-of-order / duplicate ACK totals of pcap_file"""
+    return track_pcap(pcap_file).events()
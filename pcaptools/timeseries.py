@@ -0,0 +1,205 @@
+"""Time-binned per-flow / per-client throughput and Jain's fairness index.
+
+Usage: python3 -m pcaptools.timeseries reno_part_b.pcap --bin 0.1 --level flow -o reno_flows.csv
+
+One pass over the capture accumulates wire bytes per (bin, flow) for the
+flows that carry data. Only the flows active in the current bin are held
+in a dict; finished bins are appended to flat array columns. A capture
+already decoded into a PacketTable is binned from its columns instead
+(ThroughputSeries.from_table()).
+"""
+import argparse
+import csv
+import socket
+from array import array
+
+import numpy as np
+
+from .cache import cached_analysis
+from .capture import capture_parts
+from .reader import PcapReader
+
+
+def format_address(addr):
+    return socket.inet_ntop(socket.AF_INET if len(addr) == 4 else socket.AF_INET6, addr)
+
+
+def jain_index(rates):
+    """Jain's fairness index of each row of rates, over the entries > 0"""
+    rates = np.atleast_2d(np.asarray(rates, dtype=np.float64))
+    active = (rates > 0).sum(axis=1)
+    total = rates.sum(axis=1)
+    squares = (rates ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        index = total ** 2 / (active * squares)
+    return np.where(active > 0, index, np.nan)
+
+
+class ThroughputSeries:
+    """Streaming per-flow byte counts in fixed-width time bins."""
+
+    def __init__(self, bin_width=1.0):
+        self.bin_width = bin_width
+        self.start_ts = None
+        self.flows = {}        # 4-tuple -> flow id
+        self.payload = []      # payload bytes per flow id, to pick out data flows
+        self._current = None
+        self._active = {}      # flow id -> bytes in the current bin
+        self._bins = array('q')
+        self._flow_ids = array('q')
+        self._bytes = array('q')
+
+    def update(self, pkt):
+        """Adds one TcpHeader to the series"""
+        if self.start_ts is None:
+            self.start_ts = pkt.ts
+        index = int((pkt.ts - self.start_ts) // self.bin_width)
+        if index != self._current:
+            self._flush()
+            self._current = index
+
+        flow = self._flow_id((pkt.src, pkt.dst, pkt.sport, pkt.dport))
+        self.payload[flow] += pkt.payload_len
+        self._active[flow] = self._active.get(flow, 0) + pkt.wirelen
+
+    @classmethod
+    def from_table(cls, table, bin_width=1.0):
+        """The series of a PacketTable, binned from its columns instead of packet by packet"""
+        series = cls(bin_width)
+        if len(table):
+            series.start_ts = float(table.packets['ts'][0])
+            for key, (payload, bins, nbytes) in zip(table.flows, flow_bins(table, series.start_ts, bin_width)):
+                series.add_flow(key, payload, bins, nbytes)
+        return series
+
+    def add_flow(self, key, payload, bins, nbytes):
+        """Adds one flow's wire bytes already summed per bin, e.g. from flow_bins()"""
+        flow = self._flow_id(key)
+        self.payload[flow] += payload
+        self._bins.frombytes(np.asarray(bins, dtype=np.int64).tobytes())
+        self._flow_ids.extend([flow] * len(bins))
+        self._bytes.frombytes(np.asarray(nbytes, dtype=np.int64).tobytes())
+
+    def _flow_id(self, key):
+        flow = self.flows.get(key)
+        if flow is None:
+            flow = self.flows[key] = len(self.payload)
+            self.payload.append(0)
+        return flow
+
+    def _flush(self):
+        for flow, nbytes in self._active.items():
+            self._bins.append(self._current)
+            self._flow_ids.append(flow)
+            self._bytes.append(nbytes)
+        self._active = {}
+
+    def _matrix(self, groups, ngroups):
+        self._flush()
+        bins = np.frombuffer(self._bins, dtype=np.int64)
+        flows = np.frombuffer(self._flow_ids, dtype=np.int64)
+        nbytes = np.frombuffer(self._bytes, dtype=np.int64)
+        group = groups[flows] if len(flows) else flows
+        keep = group >= 0
+        nbins = int(bins.max()) + 1 if len(bins) else 0
+
+        matrix = np.zeros((nbins, ngroups), dtype=np.float64)
+        np.add.at(matrix, (bins[keep], group[keep]), nbytes[keep])
+        times = (self.start_ts or 0.0) + np.arange(nbins) * self.bin_width
+        return times, matrix * 8 / (self.bin_width * 1000000)  # Mbps
+
+    def data_flows(self):
+        """4-tuples of the flow directions that carried payload"""
+        return [key for key, flow in self.flows.items() if self.payload[flow]]
+
+    def flow_matrix(self):
+        """(bin start times, flow labels, Mbps[bins, flows]) for the data flows"""
+        keys = self.data_flows()
+        groups = np.full(len(self.payload), -1, dtype=np.int64)
+        for i, key in enumerate(keys):
+            groups[self.flows[key]] = i
+        times, matrix = self._matrix(groups, len(keys))
+        labels = [f"{format_address(src)}:{sport}->{format_address(dst)}:{dport}"
+                  for src, dst, sport, dport in keys]
+        return times, labels, matrix
+
+    def client_matrix(self):
+        """(bin start times, client addresses, Mbps[bins, clients]); a client is a data sender"""
+        clients = {}
+        groups = np.full(len(self.payload), -1, dtype=np.int64)
+        for key in self.data_flows():
+            groups[self.flows[key]] = clients.setdefault(key[0], len(clients))
+        times, matrix = self._matrix(groups, len(clients))
+        return times, [format_address(addr) for addr in clients], matrix
+
+    def client_series(self):
+        """client_matrix() as plain lists: {'times', 'clients', 'mbps'}"""
+        times, clients, matrix = self.client_matrix()
+        return {'times': times.tolist(), 'clients': clients, 'mbps': matrix.tolist()}
+
+
+def flow_bins(table, origin, bin_width):
+    """Per flow of a PacketTable: (payload bytes, bin indices, wire bytes per bin).
+
+    Bins are counted from `origin`, so the bins of several tables (ranges
+    of one capture) line up when they share it.
+    """
+    p = table.packets
+    nflows = len(table.flows)
+    if not len(p):
+        return [(0, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))] * nflows
+    flow = p['flow'].astype(np.int64)
+    bins = np.floor_divide(p['ts'] - origin, bin_width).astype(np.int64)
+    payload = np.bincount(flow, weights=p['payload_len'], minlength=nflows).astype(np.int64)
+    low = int(bins.min())
+    width = int(bins.max()) - low + 1
+    cell, index = np.unique(flow * width + (bins - low), return_inverse=True)
+    nbytes = np.bincount(index, weights=p['wirelen']).astype(np.int64)
+    bounds = np.searchsorted(cell // width, np.arange(1, nflows))
+    return list(zip(payload.tolist(), np.split(cell % width + low, bounds), np.split(nbytes, bounds)))
+
+
+def throughput_series(pcap_file, bin_width=1.0):
+    """Builds a ThroughputSeries from every TCP segment of pcap_file"""
+    series = ThroughputSeries(bin_width)
+    update = series.update
+    for part in capture_parts(pcap_file):
+        with PcapReader(part) as reader:
+            for pkt in reader.tcp_packets():
+                update(pkt)
+    return series
+
+
+@cached_analysis('client_throughput', version=1)
+def client_throughput(pcap_file, bin_width=1.0):
+    """Cacheable per-client series: {'times', 'clients', 'mbps'} as plain lists"""
+    return throughput_series(pcap_file, bin_width).client_series()
+
+
+def write_series_csv(output_file, times, labels, matrix):
+    """Writes one row per bin: relative time, Mbps per series, Jain's index"""
+    fairness = jain_index(matrix) if len(matrix) else []
+    start = times[0] if len(times) else 0.0
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['time'] + labels + ['jain_index'])
+        for t, row, jain in zip(times, matrix, fairness):
+            writer.writerow([f"{t - start:.3f}"] + [f"{v:.4f}" for v in row] + [f"{jain:.4f}"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-bin throughput and fairness of a capture")
+    parser.add_argument("pcap", help="Capture to analyze")
+    parser.add_argument("-b", "--bin", type=float, default=1.0, help="Bin width in seconds")
+    parser.add_argument("-l", "--level", choices=["client", "flow"], default="client")
+    parser.add_argument("-o", "--output", default="throughput.csv", help="Output CSV")
+    args = parser.parse_args()
+
+    series = throughput_series(args.pcap, args.bin)
+    times, labels, matrix = series.client_matrix() if args.level == "client" else series.flow_matrix()
+    write_series_csv(args.output, times, labels, matrix)
+    print(f"Wrote {len(times)} bins x {len(labels)} {args.level}s to {args.output}")
+
+
+if __name__ == '__main__':
+    main()